@@ -0,0 +1,96 @@
+import json
+import logging
+from collections import OrderedDict
+from config import RECENT_EVENT_CACHE_SIZE
+
+logger = logging.getLogger()
+
+# ウォームコンテナ内で受け付け済みのevent_id（古いものから順に破棄する）
+_recent_event_ids = OrderedDict()
+
+
+def get_retry_info(event):
+    """
+    Slackの再送ヘッダーを取得する
+
+    Args:
+        event: Lambda関数に渡されるイベント
+
+    Returns:
+        tuple: (retry_num, retry_reason)。再送でない場合は (None, None)
+    """
+    headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+    retry_num = headers.get("x-slack-retry-num")
+    if retry_num is None:
+        return None, None
+
+    try:
+        retry_num = int(retry_num)
+    except ValueError:
+        retry_num = 0
+    return retry_num, headers.get("x-slack-retry-reason")
+
+
+def peek_event_id(event):
+    """
+    イベントの検証を行わずにevent_idだけを取り出す（取得できない場合はNone）
+    """
+    try:
+        return json.loads(event["body"]).get("event_id")
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+
+
+def remember_event(event_id):
+    _recent_event_ids[event_id] = True
+    _recent_event_ids.move_to_end(event_id)
+    while len(_recent_event_ids) > RECENT_EVENT_CACHE_SIZE:
+        _recent_event_ids.popitem(last=False)
+
+
+def is_recent_event(event_id):
+    return event_id in _recent_event_ids
+
+
+def clear_recent_events():
+    _recent_event_ids.clear()
+
+
+def no_retry_response(message):
+    """
+    Slackに再送不要を伝えるレスポンスを作成する
+    """
+    return {
+        "statusCode": 200,
+        "headers": {"X-Slack-No-Retry": "1"},
+        "body": json.dumps({"message": message}),
+    }
+
+
+def admit_retry(event):
+    """
+    再送イベントのうち、このコンテナで受け付け済みのものをネットワーク呼び出しなしで弾く
+
+    Args:
+        event: Lambda関数に渡されるイベント
+
+    Returns:
+        dict: 再送を打ち切る場合はそのレスポンス、処理を続ける場合はNone
+    """
+    retry_num, retry_reason = get_retry_info(event)
+    if retry_num is None:
+        return None
+
+    event_id = peek_event_id(event)
+    if event_id and is_recent_event(event_id):
+        logger.info(
+            f"Retry of in-flight event ignored: event_id={event_id}, "
+            f"retry_num={retry_num}, retry_reason={retry_reason}"
+        )
+        return no_retry_response("Retry ignored")
+
+    logger.info(
+        f"Retry delivery received: event_id={event_id}, "
+        f"retry_num={retry_num}, retry_reason={retry_reason}"
+    )
+    return None
@@ -1,19 +1,89 @@
-import boto3
 import json
 import logging
 import re
-from botocore.config import Config
-from botocore.exceptions import ClientError
+import time
 from config import *
+from context_utils import estimate_tokens, fit_messages, get_input_token_budget
+from endpoint_utils import (
+    get_endpoints,
+    get_ordered_endpoints,
+    is_retryable_error,
+    log_endpoint_health,
+)
+from log_utils import log_event, Payload
+from metrics_utils import timed, record_stage, add_count
+from rate_limit_utils import (
+    BedrockBusyError,
+    acquire_bedrock_capacity,
+    release_bedrock_capacity,
+)
 
 logger = logging.getLogger()
 
-# カスタムリトライ設定
-custom_retry_config = Config(retries={"max_attempts": 8, "mode": "adaptive"})
+# プロンプトキャッシュのブレークポイント
+CACHE_CONTROL = {"cache_control": {"type": "ephemeral"}}
+
+# コールドスタートを短くするため、クライアントは初回利用時に作成する
+# （リージョンごとに1つ）
+_bedrock_runtimes = {}
+
+
+def get_bedrock_runtime(region=None):
+    region = region or get_endpoints()[0].region
+    if region not in _bedrock_runtimes:
+        import boto3
+        from botocore.config import Config
+
+        # カスタムリトライ設定
+        # 流量制御が有効な場合や、フェイルオーバー先がある場合は、
+        # 同じエンドポイントへの再試行を減らして早く応答・切り替えする
+        max_attempts = 3 if BEDROCK_ADMISSION_ENABLED or len(get_endpoints()) > 1 else 8
+        custom_retry_config = Config(
+            retries={"max_attempts": max_attempts, "mode": "adaptive"},
+            max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+        )
+
+        _bedrock_runtimes[region] = boto3.client(
+            "bedrock-runtime",
+            region_name=region,
+            config=custom_retry_config,
+            endpoint_url=BEDROCK_ENDPOINT_URL,
+        )
+    return _bedrock_runtimes[region]
+
+
+def invoke_with_failover(operation, body, model_id=AI_MODEL_ID):
+    """
+    健全なエンドポイントから順にBedrockを呼び出し、スロットリングや5xxの場合は
+    次のエンドポイントに切り替える
+
+    Args:
+        operation: クライアントのメソッド名（"invoke_model" など）
+        body: リクエストボディ（JSON文字列）
+        model_id: モデルID（推論プロファイルの接頭辞はエンドポイントごとに付け替える）
+
+    Returns:
+        tuple: (レスポンス, 呼び出したエンドポイント, 呼び出し開始時刻)
+    """
+    last_error = None
+    for endpoint in get_ordered_endpoints():
+        start = time.monotonic()
+        try:
+            client = get_bedrock_runtime(endpoint.region)
+            response = getattr(client, operation)(
+                modelId=endpoint.model_id(model_id), body=body
+            )
+            return response, endpoint, start
+        except Exception as e:
+            if not is_retryable_error(e):
+                raise
+            endpoint.record_failure()
+            last_error = e
+            logger.warning(f"Bedrock endpoint {endpoint.name} failed: {e}")
+
+    log_endpoint_health()
+    raise last_error
 
-bedrock_runtime = boto3.client(
-    "bedrock-runtime", region_name="ap-northeast-1", config=custom_retry_config
-)
 
 def strip_thinking_tags(text):
     """レスポンスから<thinking>タグとその内容を除去"""
@@ -21,26 +91,189 @@ def strip_thinking_tags(text):
     return re.sub(pattern, "", text, flags=re.DOTALL).strip()
 
 
-def invoke_claude_model(messages):
+class ThinkingTagFilter:
     """
-    AWS Bedrock Claude モデルを呼び出して応答を取得
+    ストリーミング出力から<thinking>タグとその内容を逐次除去するフィルタ
+
+    タグがチャンクの境界で分割される場合に備え、タグの先頭と一致する可能性のある
+    末尾の文字列は次のチャンクが届くまで保持する
+    """
+
+    OPEN_TAG = "<thinking>"
+    CLOSE_TAG = "</thinking>"
+
+    def __init__(self):
+        self.buffer = ""
+        self.in_thinking = False
+        self.started = False
+
+    def feed(self, text):
+        """
+        チャンクを追加し、表示してよいテキストを返す
+        """
+        self.buffer += text
+        visible = []
+        while True:
+            tag = self.CLOSE_TAG if self.in_thinking else self.OPEN_TAG
+            index = self.buffer.find(tag)
+            if index != -1:
+                if not self.in_thinking:
+                    visible.append(self.buffer[:index])
+                self.buffer = self.buffer[index + len(tag) :]
+                self.in_thinking = not self.in_thinking
+                continue
+
+            keep = partial_tag_length(self.buffer, tag)
+            if not self.in_thinking:
+                visible.append(self.buffer[: len(self.buffer) - keep])
+            self.buffer = self.buffer[len(self.buffer) - keep :]
+            break
+
+        return self._trim_leading("".join(visible))
+
+    def flush(self):
+        """
+        保持している残りのテキストを返す（閉じられていない<thinking>の内容は捨てる）
+        """
+        rest = "" if self.in_thinking else self.buffer
+        self.buffer = ""
+        return self._trim_leading(rest)
+
+    def _trim_leading(self, text):
+        # strip_thinking_tags と同様に、出力の先頭の空白は除去する
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        return text
+
+
+def partial_tag_length(text, tag):
+    """
+    text の末尾が tag の先頭部分と一致する最大の長さを返す
+    """
+    for length in range(min(len(text), len(tag) - 1), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+def estimate_request_tokens(request):
+    """
+    リクエストの入力と最大出力を合わせたトークン数を推定する
+    """
+    text = json.dumps([request["system"], request["messages"]], ensure_ascii=False)
+    return estimate_tokens(text) + request["max_tokens"]
+
+
+def count_usage_tokens(usage):
+    """
+    レスポンスのusageから、入力（キャッシュを含む）と出力の合計トークン数を求める
+    """
+    if not usage:
+        return None
+    return sum(
+        usage.get(name, 0)
+        for name in (
+            "input_tokens",
+            "output_tokens",
+            "cache_read_input_tokens",
+            "cache_creation_input_tokens",
+        )
+    )
+
+
+def raise_client_error(e):
+    """
+    Bedrockのエラーを記録して送出する（スロットリングは混雑中のエラーとして送出する）
+    """
+    log_client_error(e)
+    if e.response["Error"]["Code"] == "ThrottlingException":
+        raise BedrockBusyError("Bedrock is throttling requests") from e
+    raise e
+
+
+def log_client_error(e):
+    if e.response["Error"]["Code"] == "ThrottlingException":
+        logger.warning(
+            "ThrottlingException occurred. Consider implementing a backoff strategy"
+            " or reducing request frequency."
+        )
+    else:
+        logger.error(f"Error invoking Bedrock model: {e}")
+        if "ValidationException" in str(e):
+            logger.error("Validation error. Check the format of the messages.")
+
+
+def build_request_body(messages, cache_prompt=None, system=None, max_tokens=None):
     """
-    body = json.dumps(
-        {
-            "anthropic_version": AI_MODEL_VERSION,
-            "max_tokens": AI_MODEL_MAX_TOKENS,
-            "system": AI_SYSTEM_PROMPT,
-            "messages": messages,
-        }
+    Bedrockに送信するリクエストボディを作成する
+
+    cache_prompt が有効な場合、システムプロンプトをキャッシュのブレークポイントにする
+    system, max_tokens を省略した場合は設定値を使う
+    """
+    if cache_prompt is None:
+        cache_prompt = PROMPT_CACHE_ENABLED
+
+    system_prompt = system or AI_SYSTEM_PROMPT
+    system = system_prompt
+    if cache_prompt:
+        system = [{"type": "text", "text": system_prompt, **CACHE_CONTROL}]
+
+    return {
+        "anthropic_version": AI_MODEL_VERSION,
+        "max_tokens": max_tokens or AI_MODEL_MAX_TOKENS,
+        "system": system,
+        "messages": messages,
+    }
+
+
+def log_token_usage(usage):
+    """
+    入力・出力トークン数と、プロンプトキャッシュの読み込み・書き込みトークン数を記録する
+    """
+    if not usage:
+        return
+    add_count("input_tokens", usage.get("input_tokens", 0))
+    add_count("output_tokens", usage.get("output_tokens", 0))
+    add_count("cache_read_tokens", usage.get("cache_read_input_tokens", 0))
+    logger.info(
+        f"Token usage: input={usage.get('input_tokens', 0)}, "
+        f"output={usage.get('output_tokens', 0)}, "
+        f"cache_read={usage.get('cache_read_input_tokens', 0)}, "
+        f"cache_write={usage.get('cache_creation_input_tokens', 0)}"
     )
 
+
+def invoke_claude_model(messages, system=None, max_tokens=None, model_id=None):
+    """
+    AWS Bedrock Claude モデルを呼び出して応答を取得
+
+    system, max_tokens を指定すると、会話への応答以外の用途（要約など）に使える
+    model_id を指定すると、設定値（AI_MODEL_ID）以外のモデルを呼び出す
+    """
+    from botocore.exceptions import ClientError
+
+    model_id = model_id or AI_MODEL_ID
+    request = build_request_body(messages, system=system, max_tokens=max_tokens)
+    body = json.dumps(request)
+
     # debug log
-    logger.info(f"Messages: {json.dumps(messages, indent=2)}")
+    log_event(logging.INFO, "Messages", count=len(messages), messages=Payload(messages))
 
+    # 全コンテナで共有する呼び出し枠を確保する（空かない場合はBedrockBusyError）
+    with timed("bedrock_admission"):
+        capacity = acquire_bedrock_capacity(estimate_request_tokens(request), model_id)
+    actual_tokens = None
     try:
-        response = bedrock_runtime.invoke_model(modelId=AI_MODEL_ID, body=body)
-        response_body = json.loads(response["body"].read())
-        logger.debug(f"Bedrock response: {json.dumps(response_body)}")
+        with timed("bedrock"):
+            response, endpoint, start = invoke_with_failover(
+                "invoke_model", body, model_id
+            )
+            response_body = json.loads(response["body"].read())
+        endpoint.record_success((time.monotonic() - start) * 1000)
+        log_event(logging.DEBUG, "Bedrock response", body=Payload(response_body))
+        log_token_usage(response_body.get("usage"))
+        actual_tokens = count_usage_tokens(response_body.get("usage"))
 
         # content配列が存在するか、空でないかを確認
         if "content" not in response_body or not response_body["content"]:
@@ -49,16 +282,7 @@ def invoke_claude_model(messages):
         raw_text = response_body["content"][0]["text"]
         return strip_thinking_tags(raw_text)
     except ClientError as e:
-        if e.response["Error"]["Code"] == "ThrottlingException":
-            logger.warning(
-                "ThrottlingException occurred. Consider implementing a backoff strategy"
-                " or reducing request frequency."
-            )
-        else:
-            logger.error(f"Error invoking Bedrock model: {e}")
-            if "ValidationException" in str(e):
-                logger.error("Validation error. Check the format of the messages.")
-        raise
+        raise_client_error(e)
     except IndexError as e:
         # リストインデックスエラーを明示的に処理
         logger.error(f"Index error while processing Bedrock response: {e}")
@@ -68,23 +292,112 @@ def invoke_claude_model(messages):
         # メッセージの変更
         logger.error(f"Unexpected error: {e}")
         raise Exception(f"Failed to invoke Bedrock model: {str(e)}")
+    finally:
+        release_bedrock_capacity(capacity, actual_tokens)
+
+
+def stream_claude_model(messages, max_tokens=None, model_id=None):
+    """
+    AWS Bedrock Claude モデルをストリーミングで呼び出し、応答のテキストを順に返す
+
+    <thinking>タグの内容は除去済みのテキストのみを返す
+
+    Yields:
+        str: 表示してよいテキストの断片
+    """
+    from botocore.exceptions import ClientError
 
+    model_id = model_id or AI_MODEL_ID
+    request = build_request_body(messages, max_tokens=max_tokens)
+    body = json.dumps(request)
 
-def format_conversation_for_claude(conversation_history, append_message=None):
+    # debug log
+    log_event(logging.INFO, "Messages", count=len(messages), messages=Payload(messages))
+
+    # 全コンテナで共有する呼び出し枠を確保する（空かない場合はBedrockBusyError）
+    with timed("bedrock_admission"):
+        capacity = acquire_bedrock_capacity(estimate_request_tokens(request), model_id)
+    usage = {}
+    try:
+        # ストリームの途中で発生したエラーは切り替えの対象外（出力済みの内容があるため）
+        response, endpoint, start = invoke_with_failover(
+            "invoke_model_with_response_stream", body, model_id
+        )
+        # ストリーミングでは応答の開始までの時間をレイテンシとして記録する
+        endpoint.record_success((time.monotonic() - start) * 1000)
+        record_stage("bedrock_stream_open", (time.monotonic() - start) * 1000)
+
+        thinking_filter = ThinkingTagFilter()
+        for event in response["body"]:
+            chunk = event.get("chunk")
+            if not chunk:
+                continue
+
+            data = json.loads(chunk["bytes"])
+            if data.get("type") == "message_start":
+                usage.update(data.get("message", {}).get("usage", {}))
+            elif data.get("type") == "message_delta":
+                usage.update(data.get("usage", {}))
+            elif data.get("type") == "content_block_delta":
+                delta = data.get("delta", {})
+                if delta.get("type") == "text_delta":
+                    text = thinking_filter.feed(delta.get("text", ""))
+                    if text:
+                        yield text
+            elif data.get("type") == "message_stop":
+                metrics = data.get("amazon-bedrock-invocationMetrics")
+                if metrics:
+                    logger.info(f"Bedrock stream metrics: {json.dumps(metrics)}")
+                log_token_usage(usage)
+
+        text = thinking_filter.flush()
+        if text:
+            yield text
+    except ClientError as e:
+        # ストリームの途中で発生したエラー（EventStreamError）も含む
+        raise_client_error(e)
+    finally:
+        release_bedrock_capacity(capacity, count_usage_tokens(usage))
+
+
+def format_conversation_for_claude(
+    conversation_history,
+    append_message=None,
+    cache_prefix=None,
+    model_id=None,
+    max_tokens=None,
+):
+    """
+    Slackの会話履歴をモデルに送信するメッセージに整形する
+
+    model_id, max_tokens には振り分けたモデルと最大出力トークン数を指定し、
+    そのモデルの入力トークンの上限に収める（省略時は設定値のモデル）
+
+    Returns:
+        tuple: (整形したメッセージ, アシスタントの回答数)
+    """
     formatted_messages = []
     assistant_response_count = 0
     last_role = None
+    bot_mention = None
 
     for msg in conversation_history:
+        # 要約済みの会話は、要約に含めた回答数も数える
+        if msg.get("summary"):
+            assistant_response_count += msg.get("assistant_count", 0)
+
         role = "assistant" if msg.get("bot_id") else "user"
         content = msg["text"]
 
         # ボットメンションを除去（Slackの履歴にはメンションが含まれている可能性があるため）
         if role == "user":
-            from slack_utils import BOT_USER_ID
+            if bot_mention is None:
+                from slack_utils import get_bot_user_id
+
+                bot_user_id = get_bot_user_id()
+                bot_mention = f"<@{bot_user_id}>" if bot_user_id else ""
 
-            if BOT_USER_ID:
-                bot_mention = f"<@{BOT_USER_ID}>"
+            if bot_mention:
                 content = content.replace(bot_mention, "").strip()
 
         if role == "assistant":
@@ -104,4 +417,28 @@ def format_conversation_for_claude(conversation_history, append_message=None):
         else:
             formatted_messages.append({"role": "user", "content": append_message})
 
+    # 入力トークンの上限に収める（古い会話から省略する）
+    formatted_messages, _ = fit_messages(
+        formatted_messages, budget=get_input_token_budget(model_id, max_tokens)
+    )
+
+    if cache_prefix is None:
+        cache_prefix = PROMPT_CACHE_ENABLED
+    if cache_prefix:
+        add_cache_breakpoint(formatted_messages)
+
     return formatted_messages, assistant_response_count
+
+
+def add_cache_breakpoint(formatted_messages):
+    """
+    最新のユーザー発言より前の会話（次回以降も変わらない部分）の末尾に
+    プロンプトキャッシュのブレークポイントを付ける
+    """
+    if len(formatted_messages) < 2 or formatted_messages[-1]["role"] != "user":
+        return
+
+    message = formatted_messages[-2]
+    if not message["content"]:
+        return
+    message["content"] = [{"type": "text", "text": message["content"], **CACHE_CONTROL}]
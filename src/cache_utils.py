@@ -0,0 +1,107 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from config import (
+    CACHE_MEMORY_MAX_ENTRIES,
+    CACHE_DYNAMODB_ENABLED,
+    CACHE_DYNAMODB_MAX_VALUE_BYTES,
+)
+from dynamodb_utils import get_state, put_state
+
+logger = logging.getLogger()
+
+# コンテナ内のメモリキャッシュ（キー -> (有効期限, 値)）
+_memory_cache = OrderedDict()
+
+
+def get_cached(namespace, key, persist=None):
+    """
+    キャッシュから値を取得する（メモリ、DynamoDBの順に参照）
+
+    Args:
+        namespace: キャッシュの種類（例: "file", "url"）
+        key: キャッシュキー
+        persist: DynamoDBも参照するかどうか（省略時は CACHE_DYNAMODB_ENABLED）
+
+    Returns:
+        キャッシュされた値（存在しない、または期限切れの場合はNone）
+    """
+    cache_key = f"{namespace}#{key}"
+    now = time.time()
+
+    entry = _memory_cache.get(cache_key)
+    if entry:
+        expires_at, value = entry
+        if expires_at > now:
+            _memory_cache.move_to_end(cache_key)
+            return value
+        del _memory_cache[cache_key]
+
+    if not (CACHE_DYNAMODB_ENABLED if persist is None else persist):
+        return None
+
+    try:
+        item = get_state(get_state_key(cache_key))
+    except Exception as e:
+        logger.warning(f"Error reading cache from DynamoDB: {e}")
+        return None
+
+    # TTLによる削除は遅延するため、期限はここでも確認する
+    if not item or int(item.get("expires_at", 0)) <= now:
+        return None
+
+    value = json.loads(item["value"])
+    _store_in_memory(cache_key, int(item["expires_at"]), value)
+    return value
+
+
+def set_cached(namespace, key, value, ttl_seconds, persist=None):
+    """
+    値をキャッシュに保存する
+
+    Args:
+        namespace: キャッシュの種類
+        key: キャッシュキー
+        value: 保存する値（JSONシリアライズ可能なもの）
+        ttl_seconds: 有効期間（秒）
+        persist: DynamoDBにも保存するかどうか（省略時は CACHE_DYNAMODB_ENABLED）
+    """
+    cache_key = f"{namespace}#{key}"
+    expires_at = int(time.time() + ttl_seconds)
+    _store_in_memory(cache_key, expires_at, value)
+
+    if not (CACHE_DYNAMODB_ENABLED if persist is None else persist):
+        return
+
+    serialized = json.dumps(value, ensure_ascii=False)
+    if len(serialized.encode("utf-8")) > CACHE_DYNAMODB_MAX_VALUE_BYTES:
+        logger.info(f"Cache value too large for DynamoDB, skipped: {cache_key[:100]}")
+        return
+
+    try:
+        put_state(
+            get_state_key(cache_key),
+            {"value": serialized, "expires_at": expires_at},
+        )
+    except Exception as e:
+        logger.warning(f"Error writing cache to DynamoDB: {e}")
+
+
+def get_state_key(cache_key):
+    # URLなどの長いキーでもDynamoDBのキー長制限に収まるよう、ハッシュ化する
+    namespace = cache_key.split("#", 1)[0]
+    digest = hashlib.sha256(cache_key.encode("utf-8")).hexdigest()
+    return f"cache#{namespace}#{digest}"
+
+
+def clear_memory_cache():
+    _memory_cache.clear()
+
+
+def _store_in_memory(cache_key, expires_at, value):
+    _memory_cache[cache_key] = (expires_at, value)
+    _memory_cache.move_to_end(cache_key)
+    while len(_memory_cache) > CACHE_MEMORY_MAX_ENTRIES:
+        _memory_cache.popitem(last=False)
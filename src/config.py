@@ -1,7 +1,15 @@
+import json
 import os
 
 SLACK_BOT_TOKEN = os.environ["SLACK_BOT_TOKEN"]
 DYNAMODB_TABLE_NAME = os.environ["DYNAMODB_TABLE_NAME"]
+# ボットのユーザーID（指定するとauth.testの呼び出しを省略する）
+SLACK_BOT_USER_ID = os.environ.get("SLACK_BOT_USER_ID")
+
+# 接続先の差し替え（ローカルの負荷試験などでスタブのサーバーを使う場合に指定する）
+SLACK_API_BASE_URL = os.environ.get("SLACK_API_BASE_URL")
+BEDROCK_ENDPOINT_URL = os.environ.get("BEDROCK_ENDPOINT_URL")
+DYNAMODB_ENDPOINT_URL = os.environ.get("DYNAMODB_ENDPOINT_URL")
 
 # AI モデル関連
 AI_MODEL_MAX_TOKENS = 2048
@@ -12,5 +20,263 @@ AI_SYSTEM_PROMPT = (
     "markdownや箇条書きだけで回答することは控え、要所でのみ活用するようにしましょう。"
 )
 
+# true の場合、システムプロンプトとスレッドの過去の会話にプロンプトキャッシュの
+# ブレークポイント（cache_control）を付けてBedrockに送信する
+PROMPT_CACHE_ENABLED = os.environ.get("PROMPT_CACHE_ENABLED", "false").lower() == "true"
+
+# モデルの振り分け関連
+# true の場合、メッセージの長さや添付ファイルの有無などからモデルと最大出力トークン数を選ぶ
+MODEL_ROUTING_ENABLED = (
+    os.environ.get("MODEL_ROUTING_ENABLED", "false").lower() == "true"
+)
+# 振り分け先のモデル（ティア）
+MODEL_TIERS = {
+    "light": {
+        "model_id": os.environ.get(
+            "MODEL_TIER_LIGHT_ID", "global.anthropic.claude-haiku-4-5-20251001-v1:0"
+        ),
+        "max_tokens": 1024,
+    },
+    "standard": {
+        "model_id": os.environ.get(
+            "MODEL_TIER_STANDARD_ID",
+            "global.anthropic.claude-sonnet-4-5-20250929-v1:0",
+        ),
+        "max_tokens": 2048,
+    },
+    "heavy": {"model_id": AI_MODEL_ID, "max_tokens": AI_MODEL_MAX_TOKENS},
+}
+# 振り分けのルール（上から順に評価し、最初に条件をすべて満たしたティアを使う）
+# 条件のキーは特徴量の名前。"max_" / "min_" で始まるキーは上限・下限、それ以外は一致を判定する
+# 環境変数 MODEL_ROUTING_RULES にJSONで指定すると置き換えられる
+MODEL_ROUTING_RULES = json.loads(
+    os.environ.get(
+        "MODEL_ROUTING_RULES",
+        json.dumps(
+            [
+                {
+                    "name": "short_chat",
+                    "tier": "light",
+                    "max_message_chars": 60,
+                    "has_attachment": False,
+                    "has_url": False,
+                    "has_code": False,
+                    "max_thread_depth": 6,
+                },
+                {
+                    "name": "simple_question",
+                    "tier": "standard",
+                    "max_message_chars": 400,
+                    "has_attachment": False,
+                    "has_code": False,
+                },
+            ]
+        ),
+    )
+)
+# どのルールにも当てはまらない場合のティア
+MODEL_ROUTING_DEFAULT_TIER = "heavy"
+# チャンネルごとに固定するティア（JSON。例: {"C0123456789": "heavy"}）
+MODEL_ROUTING_CHANNEL_OVERRIDES = json.loads(
+    os.environ.get("MODEL_ROUTING_CHANNEL_OVERRIDES", "{}")
+)
+
+# コンテキスト（入力トークン）関連
+# モデルごとのコンテキストウィンドウ（トークン数）。モデルIDに含まれる文字列で判定し、
+# 複数が当てはまる場合は長い（より具体的な）ものを使う。指定のないモデルは既定値を使う
+# 環境変数 MODEL_CONTEXT_WINDOW_TOKENS にJSONで指定する
+# （例: {"claude-haiku": 100000} で軽量モデルへの入力を抑える）
+MODEL_CONTEXT_WINDOW_TOKENS = json.loads(
+    os.environ.get("MODEL_CONTEXT_WINDOW_TOKENS", "{}")
+)
+DEFAULT_CONTEXT_WINDOW_TOKENS = 200000
+# トークン数は推定値のため、コンテキストウィンドウのうち入力に使う割合を抑える
+CONTEXT_BUDGET_RATIO = 0.75
+# 入力トークンの上限を明示する場合に指定（0 の場合はモデルから自動で決める）
+CONTEXT_INPUT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_INPUT_TOKEN_BUDGET", "0"))
+# 情報源ごとの上限（トークン数）
+CONTEXT_FILE_TOKEN_CAP = 20000
+CONTEXT_URL_TOKEN_CAP = 20000
+CONTEXT_HISTORY_TOKEN_CAP = 100000
+
+# スレッド要約関連
+# true の場合、長いスレッドの古い会話をモデルで要約し、DynamoDBに保存して再利用する
+THREAD_SUMMARY_ENABLED = (
+    os.environ.get("THREAD_SUMMARY_ENABLED", "false").lower() == "true"
+)
+# 要約されていない履歴の推定トークン数がこの値を超えたら要約する
+THREAD_SUMMARY_TRIGGER_TOKENS = 20000
+# 要約せずにそのまま送信する直近のメッセージ数
+THREAD_SUMMARY_KEEP_RECENT = 10
+# 要約の最大出力トークン数
+THREAD_SUMMARY_MAX_TOKENS = 1024
+# 要約の入力（前回の要約と新たに要約する会話）の最大トークン数
+THREAD_SUMMARY_INPUT_TOKEN_CAP = 60000
+# 要約アイテムの保持期間（秒）
+THREAD_SUMMARY_TTL_SECONDS = 30 * 24 * 60 * 60
+
+# Bedrockのエンドポイント関連
+# 呼び出し先のリージョンと推論プロファイルの組を優先順にカンマ区切りで指定する
+# 形式: "リージョン:推論プロファイル"（例: "ap-northeast-1:global,ap-northeast-1:jp,ap-northeast-3:jp"）
+# 推論プロファイルを空にした場合は、リージョン内のモデルIDを直接呼び出す
+BEDROCK_ENDPOINTS = os.environ.get("BEDROCK_ENDPOINTS", "ap-northeast-1:global")
+# エンドポイント（リージョン）ごとのクライアントのコネクションプールの大きさ
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.environ.get("BEDROCK_MAX_POOL_CONNECTIONS", "10"))
+# レイテンシとエラー率の指数移動平均の重み
+ENDPOINT_EWMA_ALPHA = 0.3
+# 失敗したエンドポイントを選択の対象から外す時間（秒）
+ENDPOINT_COOLDOWN_SECONDS = 30
+
+# Bedrock呼び出しの流量制御関連
+# true の場合、全コンテナで共有する呼び出し数・トークン数・同時実行数の上限を
+# DynamoDBのアトミックカウンターで管理し、超える場合は待機または「混雑中」と応答する
+BEDROCK_ADMISSION_ENABLED = (
+    os.environ.get("BEDROCK_ADMISSION_ENABLED", "false").lower() == "true"
+)
+BEDROCK_REQUESTS_PER_MINUTE = int(os.environ.get("BEDROCK_REQUESTS_PER_MINUTE", "60"))
+BEDROCK_TOKENS_PER_MINUTE = int(os.environ.get("BEDROCK_TOKENS_PER_MINUTE", "200000"))
+BEDROCK_MAX_CONCURRENCY = int(os.environ.get("BEDROCK_MAX_CONCURRENCY", "10"))
+# 実行枠の有効期間（秒）。呼び出し中のコンテナが異常終了した場合はこの時間の経過後に解放される
+BEDROCK_SLOT_LEASE_SECONDS = 300
+# 上限に達している場合に待機する最大時間（秒）と、空きを確認する間隔（秒）
+BEDROCK_ADMISSION_MAX_WAIT_SECONDS = 5
+BEDROCK_ADMISSION_POLL_SECONDS = 0.5
+
 # Slack 関連
 SLACK_MESSAGE_LIMIT = 3000
+# true の場合、auth.testで解決したボットのユーザーIDをDynamoDBに保存し、
+# コールドスタート時にも再利用する
+BOT_IDENTITY_PERSIST_ENABLED = (
+    os.environ.get("BOT_IDENTITY_PERSIST_ENABLED", "false").lower() == "true"
+)
+
+# ストリーミング応答関連
+# true の場合、モデルの出力を受け取りながらSlackのメッセージを順次更新する
+STREAMING_RESPONSE_ENABLED = (
+    os.environ.get("STREAMING_RESPONSE_ENABLED", "false").lower() == "true"
+)
+# chat.update の最小間隔（秒）。Slackのレート制限（Tier 3）に収まるようにする
+STREAMING_UPDATE_INTERVAL_SECONDS = 1.0
+# 出力が始まるまで表示するメッセージ
+STREAMING_PLACEHOLDER_TEXT = "回答を生成しています..."
+# 生成が途中で失敗した場合に、出力済みの内容の末尾に付ける文言
+STREAMING_INTERRUPTED_TEXT = "（応答の生成が中断されました）"
+
+# 非同期処理関連
+# true の場合、フロントのハンドラはイベントを受け付けて即座に200を返し、
+# 以降の処理はワーカー（自身の非同期呼び出し）で実行する
+ASYNC_PROCESSING_ENABLED = (
+    os.environ.get("ASYNC_PROCESSING_ENABLED", "false").lower() == "true"
+)
+# ワーカーとして呼び出すLambda関数名（未指定の場合は自身の関数名を使用）
+WORKER_FUNCTION_NAME = os.environ.get("WORKER_FUNCTION_NAME")
+
+# スレッド単位の直列化関連
+# true の場合、スレッドごとにリースを取得して応答を1件ずつ生成し、
+# 処理中に届いたメンションはまとめて1回の応答で処理する
+THREAD_LEASE_ENABLED = os.environ.get("THREAD_LEASE_ENABLED", "false").lower() == "true"
+# リースの有効期間（秒）。処理中のワーカーが異常終了した場合はこの時間の経過後に解放される
+THREAD_LEASE_SECONDS = 300
+
+# 再送イベント関連
+# ウォームコンテナ内で記憶しておく処理済みevent_idの最大件数
+RECENT_EVENT_CACHE_SIZE = 1000
+
+# キャッシュ関連
+# コンテナ内のメモリキャッシュに保持する最大件数
+CACHE_MEMORY_MAX_ENTRIES = 256
+# true の場合、メモリキャッシュに加えてDynamoDBにもキャッシュを保存する
+# （テーブルのTTL属性に expires_at を設定しておくこと）
+CACHE_DYNAMODB_ENABLED = (
+    os.environ.get("CACHE_DYNAMODB_ENABLED", "false").lower() == "true"
+)
+# DynamoDBに保存する値の最大サイズ（アイテムの上限400KBに余裕を持たせる）
+CACHE_DYNAMODB_MAX_VALUE_BYTES = 350 * 1024
+# スレッド内の添付ファイルを展開した内容のキャッシュ期間（秒）
+# URLの内容は get_url_content のキャッシュ（URL_CONTENT_*）で再検証しながら再利用する
+FILE_EXPANSION_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# 添付ファイル・URLの並行取得関連
+# 同時に実行する取得処理の最大数
+EXPANSION_MAX_WORKERS = int(os.environ.get("EXPANSION_MAX_WORKERS", "8"))
+
+# ログ関連
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# ログレベルごとの大きな値（イベント本文・会話履歴・応答など）の出力方法
+# size: 文字数のみ / preview: 文字数と先頭部分 / full: 全体（LOG_FULL_MAX_CHARS まで）
+LOG_PAYLOAD_POLICIES = json.loads(
+    os.environ.get(
+        "LOG_PAYLOAD_POLICIES",
+        json.dumps(
+            {
+                "DEBUG": "full",
+                "INFO": "preview",
+                "WARNING": "preview",
+                "ERROR": "preview",
+            }
+        ),
+    )
+)
+# preview で出力する最大文字数
+LOG_PREVIEW_CHARS = int(os.environ.get("LOG_PREVIEW_CHARS", "200"))
+# full で出力する最大文字数
+LOG_FULL_MAX_CHARS = 20000
+# 大きな値を全体出力する呼び出しの割合（0〜1。調査時に一部の呼び出しのみ詳しく記録する）
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "0"))
+
+# メトリクス関連
+# true の場合、処理段階ごとの時間と件数をCloudWatch Embedded Metric Formatで出力する
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "false").lower() == "true"
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "AIChatbot")
+
+# HTTP通信関連（コンテナ内で共有するコネクションプール）
+HTTP_CONNECT_TIMEOUT_SECONDS = 3.05
+HTTP_READ_TIMEOUT_SECONDS = 10
+HTTP_MAX_RETRIES = 2
+HTTP_RETRY_BACKOFF_FACTOR = 0.5
+# ホストごとに保持するコネクションの最大数（並行取得数を下回らないようにする）
+HTTP_POOL_MAXSIZE = max(EXPANSION_MAX_WORKERS, 10)
+# コネクションプールを保持するホストの最大数
+HTTP_POOL_CONNECTIONS = 20
+
+# URLの内容のキャッシュ関連
+# この期間内はサーバーに問い合わせずキャッシュした内容を使う（秒）
+URL_CONTENT_FRESH_SECONDS = 10 * 60
+# 期間を過ぎた内容もETag/Last-Modifiedによる再検証用に保持する期間（秒）
+URL_CONTENT_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# URLのみのメッセージに対する要約のキャッシュ関連
+# true の場合、同じページ（内容が同じもの）の要約をチャンネル・スレッドをまたいで再利用する
+URL_SUMMARY_CACHE_ENABLED = (
+    os.environ.get("URL_SUMMARY_CACHE_ENABLED", "false").lower() == "true"
+)
+# 要約のキャッシュ期間（秒）。ページの内容が変わった場合はキーが変わるため再度要約する
+URL_SUMMARY_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# URLの内容の取得関連
+# 1ページあたりに読み込む最大バイト数（超えた分は読み込まずに打ち切る）
+URL_MAX_BYTES = 2 * 1024 * 1024
+URL_DOWNLOAD_CHUNK_BYTES = 64 * 1024
+# テキストとして取得するContent-Type（これ以外は本文を読み込まない）
+URL_SUPPORTED_CONTENT_TYPES = (
+    "text/html",
+    "application/xhtml+xml",
+    "text/plain",
+    "text/markdown",
+)
+
+# HTMLの本文抽出エンジン（"auto", "lxml", "stream", "bs4"）
+# auto はlxmlが利用できればlxml、なければ標準ライブラリのトークナイザーを使う
+HTML_EXTRACTOR = os.environ.get("HTML_EXTRACTOR", "auto")
+
+# スレッド履歴関連
+# conversations.replies の1ページあたりの取得件数
+THREAD_HISTORY_PAGE_SIZE = 200
+# true の場合、スレッドごとに取得済みの履歴を保持し、新しいメッセージのみを取得する
+THREAD_HISTORY_INCREMENTAL = (
+    os.environ.get("THREAD_HISTORY_INCREMENTAL", "false").lower() == "true"
+)
+THREAD_HISTORY_CACHE_TTL_SECONDS = 24 * 60 * 60
+# 最新のボットのメッセージがこの秒数以内に投稿・更新された場合は、
+# 応答の生成中とみなして履歴を保持しない
+THREAD_HISTORY_SETTLE_SECONDS = 60
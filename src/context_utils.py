@@ -0,0 +1,199 @@
+import json
+import logging
+import math
+import re
+from config import (
+    AI_MODEL_ID,
+    AI_MODEL_MAX_TOKENS,
+    AI_SYSTEM_PROMPT,
+    MODEL_CONTEXT_WINDOW_TOKENS,
+    DEFAULT_CONTEXT_WINDOW_TOKENS,
+    CONTEXT_BUDGET_RATIO,
+    CONTEXT_INPUT_TOKEN_BUDGET,
+    CONTEXT_FILE_TOKEN_CAP,
+    CONTEXT_URL_TOKEN_CAP,
+    CONTEXT_HISTORY_TOKEN_CAP,
+)
+
+logger = logging.getLogger()
+
+# 1文字あたりの推定トークン数
+# 日本語などの非ASCII文字はおおよそ1文字1トークン、英数字は3〜4文字で1トークン
+NON_ASCII_TOKENS_PER_CHAR = 1.0
+ASCII_TOKENS_PER_CHAR = 0.3
+# 1メッセージあたりのロールなどのオーバーヘッド
+MESSAGE_OVERHEAD_TOKENS = 4
+
+NON_ASCII_PATTERN = re.compile(r"[^\x00-\x7f]")
+
+SOURCE_TOKEN_CAPS = {
+    "file": CONTEXT_FILE_TOKEN_CAP,
+    "url": CONTEXT_URL_TOKEN_CAP,
+}
+
+TRUNCATION_NOTE = "\n…（長すぎるため以降を省略しました）"
+OMISSION_NOTE = "【システムメッセージ】コンテキストの上限を超えるため、途中の会話{count}件を省略しました。"
+
+
+def estimate_tokens(text):
+    """
+    テキストのトークン数を推定する（日本語・英語の混在に対応）
+    """
+    if not text:
+        return 0
+    non_ascii = len(NON_ASCII_PATTERN.findall(text))
+    ascii_chars = len(text) - non_ascii
+    return math.ceil(
+        non_ascii * NON_ASCII_TOKENS_PER_CHAR + ascii_chars * ASCII_TOKENS_PER_CHAR
+    )
+
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    推定トークン数が max_tokens 以下になるようにテキストの先頭部分を残す
+
+    Returns:
+        tuple: (切り詰めたテキスト, 切り詰めたかどうか)
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text, False
+
+    limit = max(max_tokens - estimate_tokens(TRUNCATION_NOTE), 0)
+    used = 0.0
+    end = 0
+    for char in text:
+        used += ASCII_TOKENS_PER_CHAR if char < "\x80" else NON_ASCII_TOKENS_PER_CHAR
+        if used > limit:
+            break
+        end += 1
+    return text[:end] + TRUNCATION_NOTE, True
+
+
+def cap_source_text(text, source):
+    """
+    添付ファイル・URLの本文を情報源ごとの上限に収める
+    """
+    capped, truncated = truncate_to_tokens(text, SOURCE_TOKEN_CAPS[source])
+    if truncated:
+        logger.info(
+            f"Context source truncated: source={source}, "
+            f"estimated_tokens={estimate_tokens(text)}, cap={SOURCE_TOKEN_CAPS[source]}"
+        )
+    return capped
+
+
+def get_input_token_budget(model_id=None, max_tokens=None):
+    """
+    モデルに送信するメッセージの入力トークンの上限を返す
+
+    コンテキストウィンドウから出力トークンとシステムプロンプトの分を差し引く
+
+    Args:
+        model_id: 応答に使うモデルID（省略時は AI_MODEL_ID）
+        max_tokens: 最大出力トークン数（省略時は AI_MODEL_MAX_TOKENS）
+    """
+    if CONTEXT_INPUT_TOKEN_BUDGET > 0:
+        return CONTEXT_INPUT_TOKEN_BUDGET
+
+    model_id = model_id or AI_MODEL_ID
+    matches = [name for name in MODEL_CONTEXT_WINDOW_TOKENS if name in model_id]
+    window = (
+        MODEL_CONTEXT_WINDOW_TOKENS[max(matches, key=len)]
+        if matches
+        else DEFAULT_CONTEXT_WINDOW_TOKENS
+    )
+    return (
+        int(window * CONTEXT_BUDGET_RATIO)
+        - (max_tokens or AI_MODEL_MAX_TOKENS)
+        - estimate_tokens(AI_SYSTEM_PROMPT)
+    )
+
+
+def fit_messages(formatted_messages, budget=None):
+    """
+    整形済みのメッセージを入力トークンの上限に収める
+
+    最新のユーザー発言は必ず残し、スレッドの最初のメッセージ（親メッセージ）も
+    可能な限り残す。それ以外は新しいものから順に上限まで残し、古い会話を省略する。
+    省略した場合は、その旨をシステムメッセージとして残す
+
+    Args:
+        formatted_messages: format_conversation_for_claude で整形したメッセージ
+        budget: 入力トークンの上限（省略時はモデルから決める）
+
+    Returns:
+        tuple: (上限に収めたメッセージ, 省略内容のレポート)
+    """
+    if budget is None:
+        budget = get_input_token_budget()
+
+    report = {
+        "budget": budget,
+        "input_tokens": 0,
+        "dropped_messages": 0,
+        "truncated_messages": [],
+    }
+    if not formatted_messages:
+        return formatted_messages, report
+
+    def tokens(message):
+        return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+    def truncated(index, message, max_tokens):
+        content, cut = truncate_to_tokens(
+            message["content"], max(max_tokens - MESSAGE_OVERHEAD_TOKENS, 0)
+        )
+        if cut:
+            report["truncated_messages"].append(index)
+        return {**message, "content": content}
+
+    last_index = len(formatted_messages) - 1
+    newest = truncated(last_index, formatted_messages[-1], budget // 2)
+    history_budget = min(budget - tokens(newest), CONTEXT_HISTORY_TOKEN_CAP)
+    older = formatted_messages[:-1]
+
+    kept = []
+    used = 0
+    if older:
+        # 親メッセージは履歴の上限の半分までに収めて残す
+        root = truncated(0, older[0], history_budget // 2)
+        used = tokens(root)
+
+        # 新しいメッセージから順に、上限に達するまで残す
+        first_kept = len(older)
+        for index in range(len(older) - 1, 0, -1):
+            message_tokens = tokens(older[index])
+            if used + message_tokens > history_budget:
+                break
+            used += message_tokens
+            first_kept = index
+
+        report["dropped_messages"] = first_kept - 1
+        kept = [root]
+        if report["dropped_messages"]:
+            note = OMISSION_NOTE.format(count=report["dropped_messages"])
+            kept.append({"role": "user", "content": note})
+        kept.extend(older[first_kept:])
+
+    fitted = merge_consecutive_roles(kept + [newest])
+    report["input_tokens"] = sum(tokens(message) for message in fitted)
+
+    if report["dropped_messages"] or report["truncated_messages"]:
+        logger.info(f"Context report: {json.dumps(report)}")
+    return fitted, report
+
+
+def merge_consecutive_roles(messages):
+    """
+    同じロールが連続するメッセージを結合する
+    """
+    merged = []
+    for message in messages:
+        if merged and merged[-1]["role"] == message["role"]:
+            merged[-1] = {
+                **merged[-1],
+                "content": f"{merged[-1]['content']}\n{message['content']}",
+            }
+        else:
+            merged.append(dict(message))
+    return merged
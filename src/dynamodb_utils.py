@@ -1,30 +1,43 @@
-import boto3
 import time
 import logging
-from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Attr
-from config import DYNAMODB_TABLE_NAME
+from config import DYNAMODB_TABLE_NAME, DYNAMODB_ENDPOINT_URL
+from metrics_utils import timed
 
 logger = logging.getLogger()
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+
+# コールドスタートを短くするため、テーブルは初回利用時に作成する
+_table = None
+
+
+def get_table():
+    global _table
+    if _table is None:
+        import boto3
+
+        _table = boto3.resource("dynamodb", endpoint_url=DYNAMODB_ENDPOINT_URL).Table(
+            DYNAMODB_TABLE_NAME
+        )
+    return _table
 
 
 def save_initial_event(event_id, user_id, channel_id, thread_ts, user_message):
+    from botocore.exceptions import ClientError
+
     timestamp = int(time.time() * 1000)
     try:
-        table.put_item(
-            Item={
-                "event_id": event_id,
-                "user_id": user_id,
-                "timestamp": timestamp,
-                "channel_id": channel_id,
-                "thread_ts": thread_ts,
-                "user_message": user_message,
-                "status": "processing",
-            },
-            ConditionExpression="attribute_not_exists(event_id)",
-        )
+        with timed("dynamodb"):
+            get_table().put_item(
+                Item={
+                    "event_id": event_id,
+                    "user_id": user_id,
+                    "timestamp": timestamp,
+                    "channel_id": channel_id,
+                    "thread_ts": thread_ts,
+                    "user_message": user_message,
+                    "status": "processing",
+                },
+                ConditionExpression="attribute_not_exists(event_id)",
+            )
         logger.info(f"Initial entry saved to DynamoDB: event_id={event_id}")
         return True
     except ClientError as e:
@@ -36,17 +49,128 @@ def save_initial_event(event_id, user_id, channel_id, thread_ts, user_message):
 
 
 def update_event(event_id, ai_response):
+    from boto3.dynamodb.conditions import Attr
+    from botocore.exceptions import ClientError
+
     try:
-        table.update_item(
+        with timed("dynamodb"):
+            get_table().update_item(
+                Key={"event_id": event_id},
+                UpdateExpression="set ai_response = :r, #s = :c",
+                ExpressionAttributeValues={":r": ai_response, ":c": "completed"},
+                ExpressionAttributeNames={"#s": "status"},
+                ConditionExpression=Attr("status").eq("processing"),
+            )
+        logger.info(f"Event updated in DynamoDB: event_id={event_id}")
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            logger.info(f"Event already processed: {event_id}")
+        else:
+            raise
+
+
+def start_event_work(event_id):
+    """
+    ワーカーがイベントの処理を開始したことを記録する
+
+    Lambdaの非同期呼び出しはタイムアウトや異常終了の後に再実行されるため、
+    処理中または処理済みのイベントは開始しない
+
+    Returns:
+        bool: 処理を開始できた場合はTrue、処理中または処理済みの場合はFalse
+    """
+    from boto3.dynamodb.conditions import Attr
+    from botocore.exceptions import ClientError
+
+    try:
+        with timed("dynamodb"):
+            get_table().update_item(
+                Key={"event_id": event_id},
+                UpdateExpression="set worker_started_at = :t",
+                ExpressionAttributeValues={":t": int(time.time() * 1000)},
+                ConditionExpression=Attr("status").eq("processing")
+                & Attr("worker_started_at").not_exists(),
+            )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            logger.info(f"Event already started or processed: {event_id}")
+            return False
+        raise
+
+
+def save_event_message(event_id, user_message):
+    """
+    イベントの記録に処理済みのユーザーメッセージを保存する
+
+    スレッドのリースで保留されたメンションは、このメッセージを読み込んで応答する
+    """
+    with timed("dynamodb"):
+        get_table().update_item(
             Key={"event_id": event_id},
-            UpdateExpression="set ai_response = :r, #s = :c",
-            ExpressionAttributeValues={":r": ai_response, ":c": "completed"},
-            ExpressionAttributeNames={"#s": "status"},
-            ConditionExpression=Attr("status").eq("processing"),
+            UpdateExpression="set user_message = :m",
+            ExpressionAttributeValues={":m": user_message},
         )
-        logger.info(f"Event updated in DynamoDB: event_id={event_id}")
+
+
+def get_event_message(event_id):
+    """
+    イベントの記録からユーザーメッセージを取得する（記録がない場合はNone）
+    """
+    with timed("dynamodb"):
+        response = get_table().get_item(Key={"event_id": event_id})
+    return response.get("Item", {}).get("user_message")
+
+
+def fail_event(event_id, error_message):
+    """
+    応答できなかったイベントを失敗として記録する
+    """
+    from boto3.dynamodb.conditions import Attr
+    from botocore.exceptions import ClientError
+
+    try:
+        with timed("dynamodb"):
+            get_table().update_item(
+                Key={"event_id": event_id},
+                UpdateExpression="set error_message = :e, #s = :f",
+                ExpressionAttributeValues={":e": error_message, ":f": "failed"},
+                ExpressionAttributeNames={"#s": "status"},
+                ConditionExpression=Attr("status").eq("processing"),
+            )
+        logger.info(f"Event marked as failed in DynamoDB: event_id={event_id}")
     except ClientError as e:
         if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
             logger.info(f"Event already processed: {event_id}")
         else:
             raise
+
+
+def get_state(key):
+    """
+    イベント以外の状態を保存したアイテムを取得する
+
+    状態アイテムはイベントと同じテーブルに、プレフィックス付きのキーで保存する
+
+    Args:
+        key: アイテムのキー（例: "bot_identity#..."）
+
+    Returns:
+        dict: アイテム（存在しない場合はNone）
+    """
+    with timed("dynamodb"):
+        response = get_table().get_item(Key={"event_id": key})
+    return response.get("Item")
+
+
+def put_state(key, attributes):
+    """
+    イベント以外の状態をアイテムとして保存する
+
+    Args:
+        key: アイテムのキー
+        attributes: 保存する属性
+    """
+    with timed("dynamodb"):
+        get_table().put_item(Item={**attributes, "event_id": key})
+    logger.info(f"State saved to DynamoDB: key={key}")
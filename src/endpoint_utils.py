@@ -0,0 +1,150 @@
+import logging
+import time
+from config import (
+    BEDROCK_ENDPOINTS,
+    ENDPOINT_EWMA_ALPHA,
+    ENDPOINT_COOLDOWN_SECONDS,
+)
+
+logger = logging.getLogger()
+
+# 推論プロファイルの接頭辞（モデルIDから取り除いて付け替える）
+PROFILE_PREFIXES = ("global", "us", "eu", "apac", "jp", "au", "ca", "us-gov")
+
+# フェイルオーバーの対象とするエラーコード
+RETRYABLE_ERROR_CODES = {
+    "ThrottlingException",
+    "ServiceUnavailableException",
+    "InternalServerException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+}
+
+# エラー率1あたりのスコアの増加率と、設定順1つあたりのスコアの増加率
+ERROR_PENALTY = 4.0
+PRIORITY_PENALTY = 0.25
+
+
+class Endpoint:
+    """
+    Bedrockの呼び出し先（リージョンと推論プロファイル）と、その健全性の統計
+    """
+
+    def __init__(self, region, profile, priority):
+        self.region = region
+        self.profile = profile
+        self.priority = priority
+        self.latency_ewma_ms = None
+        self.error_ewma = 0.0
+        self.cooldown_until = 0.0
+
+    @property
+    def name(self):
+        return f"{self.region}:{self.profile}"
+
+    def model_id(self, model_id):
+        """
+        モデルIDの推論プロファイルの接頭辞を、このエンドポイントのものに付け替える
+        """
+        prefix, _, rest = model_id.partition(".")
+        base = rest if prefix in PROFILE_PREFIXES else model_id
+        return f"{self.profile}.{base}" if self.profile else base
+
+    def record_success(self, latency_ms):
+        if self.latency_ewma_ms is None:
+            self.latency_ewma_ms = latency_ms
+        else:
+            self.latency_ewma_ms += ENDPOINT_EWMA_ALPHA * (
+                latency_ms - self.latency_ewma_ms
+            )
+        self.error_ewma *= 1 - ENDPOINT_EWMA_ALPHA
+        self.cooldown_until = 0.0
+
+    def record_failure(self):
+        self.error_ewma += ENDPOINT_EWMA_ALPHA * (1 - self.error_ewma)
+        self.cooldown_until = time.monotonic() + ENDPOINT_COOLDOWN_SECONDS
+
+
+def parse_endpoints(spec):
+    """
+    "リージョン:推論プロファイル" のカンマ区切りをエンドポイントのリストにする
+    """
+    endpoints = []
+    for priority, entry in enumerate(item.strip() for item in spec.split(",")):
+        if not entry:
+            continue
+        region, _, profile = entry.partition(":")
+        endpoints.append(Endpoint(region.strip(), profile.strip(), priority))
+    if not endpoints:
+        raise ValueError(f"No Bedrock endpoints configured: {spec!r}")
+    return endpoints
+
+
+# コンテナ内で共有するエンドポイントと統計
+_endpoints = parse_endpoints(BEDROCK_ENDPOINTS)
+
+
+def get_endpoints():
+    return _endpoints
+
+
+def reset_endpoint_health():
+    """
+    エンドポイントの統計を初期化する（主にテスト用）
+    """
+    global _endpoints
+    _endpoints = parse_endpoints(BEDROCK_ENDPOINTS)
+
+
+def get_ordered_endpoints():
+    """
+    健全なものから順に並べたエンドポイントを返す
+
+    失敗直後（クールダウン中）のエンドポイントは後ろに回す。それ以外は
+    レイテンシの移動平均にエラー率と設定順に応じた重みを掛けたスコアの小さい順とする。
+    レイテンシが未計測のエンドポイントは、計測済みのものの平均として扱う
+    """
+    now = time.monotonic()
+    measured = [e.latency_ewma_ms for e in _endpoints if e.latency_ewma_ms is not None]
+    default_latency = sum(measured) / len(measured) if measured else 0.0
+
+    def score(endpoint):
+        latency = (
+            endpoint.latency_ewma_ms
+            if endpoint.latency_ewma_ms is not None
+            else default_latency
+        )
+        return (
+            latency
+            * (1 + ERROR_PENALTY * endpoint.error_ewma)
+            * (1 + PRIORITY_PENALTY * endpoint.priority)
+        )
+
+    return sorted(
+        _endpoints,
+        key=lambda e: (e.cooldown_until > now, score(e), e.priority),
+    )
+
+
+def is_retryable_error(error):
+    """
+    他のエンドポイントで再試行すべきエラー（スロットリング、5xx、通信エラー）かどうか
+    """
+    from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code")
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return code in RETRYABLE_ERROR_CODES or status >= 500
+    return isinstance(error, (ConnectionError, HTTPClientError))
+
+
+def log_endpoint_health():
+    logger.info(
+        "Bedrock endpoint health: "
+        + ", ".join(
+            f"{e.name}(latency_ms={e.latency_ewma_ms or 0:.0f}, "
+            f"error={e.error_ewma:.2f})"
+            for e in _endpoints
+        )
+    )
@@ -0,0 +1,274 @@
+import logging
+import re
+from html.parser import HTMLParser
+from config import HTML_EXTRACTOR
+
+logger = logging.getLogger()
+
+# 本文として扱わない要素
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "nav", "aside"}
+# 本文領域（main/article）の外にある場合のみ除外する要素
+BOILERPLATE_TAGS = {"header", "footer"}
+# 本文領域とみなす要素
+MAIN_TAGS = {"main", "article"}
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+META_CHARSET_PATTERN = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.I)
+# 文字コードの推定に使う先頭のバイト数
+DETECT_ENCODING_BYTES = 64 * 1024
+
+
+def extract_html_content(html, backend=None, encoding=None):
+    """
+    HTMLからタイトルと本文のテキストを抽出する
+
+    指定された抽出エンジンで失敗した場合は、BeautifulSoupによる抽出にフォールバックする
+
+    Args:
+        html: HTMLのバイト列または文字列
+        backend: 抽出エンジン（"auto", "lxml", "stream", "bs4"）。省略時は設定値
+        encoding: HTTPヘッダー（Content-Type）で指定された文字コード
+
+    Returns:
+        tuple: (title, content)
+    """
+    name = resolve_backend(backend or HTML_EXTRACTOR)
+    try:
+        return EXTRACTORS[name](html, encoding)
+    except Exception as e:
+        if name == "bs4":
+            raise
+        logger.warning(f"HTML extractor '{name}' failed, falling back to bs4: {e}")
+        return extract_with_bs4(html, encoding)
+
+
+def resolve_backend(name):
+    """
+    "auto" の場合、lxmlが利用できればlxml、なければstreamを使う
+    """
+    if name != "auto":
+        if name not in EXTRACTORS:
+            raise ValueError(f"Unknown HTML extractor: {name}")
+        return name
+
+    try:
+        import lxml.html  # noqa: F401
+
+        return "lxml"
+    except ImportError:
+        return "stream"
+
+
+def extract_with_bs4(html, encoding=None):
+    """
+    BeautifulSoup（html.parser）でbody全体のテキストを抽出する
+    """
+    from bs4 import BeautifulSoup
+
+    if isinstance(html, bytes):
+        # ヘッダーの文字コード指定がなければ、UnicodeDammitによる判定に任せる
+        soup = BeautifulSoup(html, "html.parser", from_encoding=encoding)
+    else:
+        soup = BeautifulSoup(html, "html.parser")
+
+    # メタデータの取得
+    title = soup.title.string if soup.title else "No title found"
+
+    # body タグ内の全てのテキストを取得
+    body = soup.body
+    if body:
+        # スクリプトとスタイルタグを除去
+        for script_or_style in body(["script", "style"]):
+            script_or_style.decompose()
+        content = body.get_text()
+    else:
+        content = "No body content found"
+
+    return title, normalize_whitespace(content)
+
+
+def extract_with_lxml(html, encoding=None):
+    """
+    lxmlでHTMLを解析し、主要な本文領域のテキストを抽出する
+    """
+    import lxml.html
+
+    document = lxml.html.document_fromstring(decode_html(html, encoding))
+
+    # svgの<title>などを拾わないよう、head直下のタイトルのみを使う
+    title_element = document.find("./head/title")
+    title = title_element.text_content() if title_element is not None else None
+
+    for element in document.xpath(
+        "//" + "|//".join(sorted(SKIP_TAGS)) + "|//comment()"
+    ):
+        element.drop_tree()
+
+    # 入れ子になったmain/articleは外側のみを使う
+    mains = [
+        element
+        for element in document.xpath("//main|//article|//*[@role='main']")
+        if not element.xpath(
+            "ancestor::main|ancestor::article|ancestor::*[@role='main']"
+        )
+    ]
+    if mains:
+        content = " ".join(element.text_content() for element in mains)
+    else:
+        body = document.find("body")
+        if body is None:
+            content = ""
+        else:
+            for element in body.xpath("//header|//footer"):
+                element.drop_tree()
+            content = body.text_content()
+
+    return finalize(title, content)
+
+
+class _StreamingTextParser(HTMLParser):
+    """
+    DOMを構築せずにタグを順に読み、タイトルと本文のテキストを収集するパーサー
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title_parts = []
+        self.body_parts = []
+        self.main_parts = []
+        self.in_title = False
+        self.title_done = False
+        self.in_head = False
+        self.skip_depth = 0
+        self.main_depth = 0
+        self.boilerplate_depth = 0
+        # role="main" が付いた要素のタグ名と、同名タグの入れ子の深さ
+        self.role_main_tag = None
+        self.role_main_nesting = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "head":
+            self.in_head = True
+        elif tag == "body":
+            self.in_head = False
+        elif tag == "title":
+            # svgの<title>などの除外する要素内のタイトルや、2つ目以降のタイトルは使わない
+            if not self.skip_depth and not self.title_done:
+                self.in_title = True
+        elif tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in MAIN_TAGS:
+            self.main_depth += 1
+        elif ("role", "main") in attrs and self.role_main_tag is None:
+            self.role_main_tag = tag
+            self.role_main_nesting = 1
+            self.main_depth += 1
+        elif tag == self.role_main_tag:
+            self.role_main_nesting += 1
+        elif tag in BOILERPLATE_TAGS and self.main_depth == 0:
+            self.boilerplate_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self.in_head = False
+        elif tag == "title":
+            if self.in_title:
+                self.in_title = False
+                self.title_done = True
+        elif tag in SKIP_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+        elif tag in MAIN_TAGS:
+            self.main_depth = max(self.main_depth - 1, 0)
+        elif tag == self.role_main_tag:
+            self.role_main_nesting -= 1
+            if self.role_main_nesting == 0:
+                self.role_main_tag = None
+                self.main_depth = max(self.main_depth - 1, 0)
+        elif tag in BOILERPLATE_TAGS and self.boilerplate_depth:
+            self.boilerplate_depth -= 1
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title_parts.append(data)
+        elif self.in_head or self.skip_depth:
+            return
+        elif self.main_depth:
+            self.main_parts.append(data)
+        elif not self.boilerplate_depth:
+            self.body_parts.append(data)
+
+
+def extract_with_stream(html, encoding=None):
+    """
+    標準ライブラリのトークナイザーで、DOMを構築せずに本文のテキストを抽出する
+    """
+    parser = _StreamingTextParser()
+    parser.feed(decode_html(html, encoding))
+    parser.close()
+
+    title = "".join(parser.title_parts) if parser.title_parts else None
+    # main/articleがあればその内容を、なければヘッダー・フッターを除いた本文を使う
+    parts = (
+        parser.main_parts if "".join(parser.main_parts).strip() else parser.body_parts
+    )
+    return finalize(title, "".join(parts))
+
+
+def decode_html(html, encoding=None):
+    """
+    HTMLのバイト列を文字列に変換する
+
+    HTTPヘッダーの文字コード指定、metaタグの文字コード指定の順に使い、
+    どちらもなければ内容から文字コードを推定する
+    """
+    if isinstance(html, str):
+        return html
+
+    match = META_CHARSET_PATTERN.search(html[:4096])
+    meta_encoding = match.group(1).decode("ascii") if match else None
+    for candidate in (encoding, meta_encoding):
+        if not candidate:
+            continue
+        try:
+            return html.decode(candidate, errors="replace")
+        except LookupError:
+            logger.warning(f"Unknown charset: {candidate}")
+
+    return html.decode(detect_encoding(html), errors="replace")
+
+
+def detect_encoding(html):
+    """
+    文字コードの指定がないHTMLの文字コードを推定する（推定できなければUTF-8）
+    """
+    try:
+        html.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    try:
+        from charset_normalizer import from_bytes
+    except ImportError:
+        return "utf-8"
+
+    best = from_bytes(html[:DETECT_ENCODING_BYTES]).best()
+    return best.encoding if best else "utf-8"
+
+
+def finalize(title, content):
+    title = normalize_whitespace(title) if title else "No title found"
+    content = normalize_whitespace(content)
+    return title, content or "No body content found"
+
+
+def normalize_whitespace(text):
+    # 不要な空白文字の削除
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+EXTRACTORS = {
+    "lxml": extract_with_lxml,
+    "stream": extract_with_stream,
+    "bs4": extract_with_bs4,
+}
@@ -0,0 +1,145 @@
+import logging
+import threading
+from config import (
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    HTTP_READ_TIMEOUT_SECONDS,
+    HTTP_MAX_RETRIES,
+    HTTP_RETRY_BACKOFF_FACTOR,
+    HTTP_POOL_MAXSIZE,
+    HTTP_POOL_CONNECTIONS,
+)
+
+logger = logging.getLogger()
+
+# リトライ対象のステータスコード
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# コンテナ内で共有するセッション（初回利用時に作成する）
+_session = None
+
+# コネクションプールの利用状況の累計（プールが破棄されても減らないように記録する）
+_pool_stats_lock = threading.Lock()
+_pool_stats = {"requests": 0, "connections": 0}
+
+
+def record_pool_event(name):
+    """
+    コネクションプールの送信数・新規接続数の累計に1を加える
+    """
+    with _pool_stats_lock:
+        _pool_stats[name] += 1
+
+
+def create_adapter(**kwargs):
+    """
+    送信数と新規接続数を累計に記録するHTTPAdapterを作成する
+
+    urllib3のプールはホスト数が pool_connections を超えると破棄されるため、
+    プールごとの集計ではなく、送信と接続のたびにモジュールの累計を更新する
+    """
+    from requests.adapters import HTTPAdapter
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class CountingPoolMixin:
+        def urlopen(self, *args, **kwargs):
+            # リトライ時は urlopen が再帰的に呼ばれるため、送信ごとに数える
+            record_pool_event("requests")
+            return super().urlopen(*args, **kwargs)
+
+        def _new_conn(self):
+            record_pool_event("connections")
+            return super()._new_conn()
+
+    class CountingHTTPConnectionPool(CountingPoolMixin, HTTPConnectionPool):
+        pass
+
+    class CountingHTTPSConnectionPool(CountingPoolMixin, HTTPSConnectionPool):
+        pass
+
+    class CountingHTTPAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": CountingHTTPConnectionPool,
+                "https": CountingHTTPSConnectionPool,
+            }
+
+    return CountingHTTPAdapter(**kwargs)
+
+
+def get_session():
+    """
+    コネクションプールとリトライ設定を持つ共有のrequests.Sessionを取得する
+
+    コンテナが生きている間はコネクションを保持し、DNS解決とTLSハンドシェイクを省略する
+    """
+    global _session
+    if _session is None:
+        import requests
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=HTTP_MAX_RETRIES,
+            backoff_factor=HTTP_RETRY_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False,
+        )
+        adapter = create_adapter(
+            pool_connections=HTTP_POOL_CONNECTIONS,
+            pool_maxsize=HTTP_POOL_MAXSIZE,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+    return _session
+
+
+def http_get(url, **kwargs):
+    """
+    共有セッションでGETリクエストを送信する
+
+    timeout を指定しない場合は (接続, 読み込み) のタイムアウトを設定する
+    """
+    kwargs.setdefault(
+        "timeout", (HTTP_CONNECT_TIMEOUT_SECONDS, HTTP_READ_TIMEOUT_SECONDS)
+    )
+    return get_session().get(url, **kwargs)
+
+
+def get_pool_stats():
+    """
+    コネクションプールの利用状況の累計を取得する
+
+    Returns:
+        dict: requests（送信数）、misses（新規接続数）、hits（既存接続の再利用数）
+    """
+    with _pool_stats_lock:
+        requests_count = _pool_stats["requests"]
+        connections_count = _pool_stats["connections"]
+
+    return {
+        "requests": requests_count,
+        "misses": connections_count,
+        "hits": max(requests_count - connections_count, 0),
+    }
+
+
+def log_pool_stats():
+    stats = get_pool_stats()
+    logger.info(
+        f"HTTP pool stats: requests={stats['requests']}, "
+        f"hits={stats['hits']}, misses={stats['misses']}"
+    )
+
+
+def close_session():
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None
+    with _pool_stats_lock:
+        _pool_stats["requests"] = 0
+        _pool_stats["connections"] = 0
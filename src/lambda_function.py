@@ -1,26 +1,76 @@
 import json
 import logging
-from slack_utils import handle_slack_event, send_slack_message, get_thread_history
-from dynamodb_utils import save_initial_event, update_event
-from bedrock_utils import invoke_claude_model, format_conversation_for_claude
-from url_utils import get_url_content
-from utils import create_error_message, extract_url
+import time
+from functools import partial
+from slack_utils import (
+    handle_slack_event,
+    send_slack_message,
+    get_thread_history,
+    StreamingMessage,
+)
+from dynamodb_utils import (
+    save_initial_event,
+    start_event_work,
+    update_event,
+    save_event_message,
+    get_event_message,
+    fail_event,
+)
+from bedrock_utils import (
+    invoke_claude_model,
+    stream_claude_model,
+    format_conversation_for_claude,
+)
+from url_utils import (
+    get_url_content,
+    get_summary_cache_key,
+    get_url_summary,
+    save_url_summary,
+)
+from utils import create_error_message, extract_url, run_concurrently
+from http_utils import log_pool_stats
+from log_utils import log_event, begin_invocation, Payload
+from metrics_utils import begin_metrics, timed, add_count, flush_metrics
+from context_utils import cap_source_text
+from queue_utils import dispatch_task, is_worker_event, WORKER_TASK_KEY
+from admission_utils import admit_retry, remember_event, no_retry_response
+from summary_utils import compact_history
+from routing_utils import extract_features, route_model, log_route_outcome
+from rate_limit_utils import BedrockBusyError
+from thread_lease_utils import (
+    acquire_thread_lease,
+    release_thread_lease,
+    abandon_thread_lease,
+)
+from config import (
+    LOG_LEVEL,
+    AI_MODEL_ID,
+    ASYNC_PROCESSING_ENABLED,
+    STREAMING_RESPONSE_ENABLED,
+    THREAD_SUMMARY_ENABLED,
+    MODEL_ROUTING_ENABLED,
+    THREAD_LEASE_ENABLED,
+    URL_SUMMARY_CACHE_ENABLED,
+)
 
 # ロガーの設定
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(LOG_LEVEL)
 
+BUSY_MESSAGE = "ただいまリクエストが集中しています。しばらく待ってから、もう一度メンションしてください。"
+RESPONSE_LIMIT_MESSAGE = "申し訳ありませんが、このスレッドでの回答回数が制限を超えました。新しいスレッドで質問していただくようお願いいたします。"
 
-def validate_and_parse_event(event):
+
+def parse_event_body(event):
     """
-    Slackイベントの検証とパース処理を行う
+    Slackイベントのbodyを解析する
 
     Args:
         event: Lambda関数に渡されるイベント
 
     Returns:
-        tuple: (channel_id, user_id, message, thread_ts, event_id) または
-               challenge responseの場合はそのレスポンス
+        tuple: (slack_event, event_id) または
+               challenge response・無視すべきイベントの場合はそのレスポンス
     """
     # Slack Event APIからのチャレンジレスポンスの処理
     if "challenge" in event["body"]:
@@ -31,17 +81,44 @@ def validate_and_parse_event(event):
     slack_event = body["event"]
     event_id = body["event_id"]
 
-    # デバッグ: パースされたbodyをログに出力
-    logger.info(f"Parsed body: {json.dumps(body, indent=2)}")
+    # デバッグ: パースされたbodyをログに出力（大きさはログレベルごとの方針で抑える）
+    log_event(
+        logging.INFO,
+        "Parsed body",
+        event_id=event_id,
+        type=slack_event.get("type"),
+        body=Payload(body),
+    )
 
     # app_mentionイベント以外は無視
     if slack_event["type"] != "app_mention":
         return {"statusCode": 200, "body": json.dumps({"message": "OK"})}
 
-    # Slackイベントの処理
-    channel_id, user_id, message, thread_ts = handle_slack_event(slack_event)
+    return slack_event, event_id
+
+
+def claim_event(slack_event, event_id):
+    """
+    仮のエントリをDynamoDBに保存し、イベントを確保する
+
+    添付ファイルの取得などの前に確保し、別のコンテナに届いた再送では重複して処理しない
 
-    return channel_id, user_id, message, thread_ts, event_id
+    Returns:
+        dict: 重複したイベントの場合はそのレスポンス、確保できた場合はNone
+    """
+    thread_ts = slack_event.get("thread_ts", slack_event["ts"])
+    if not save_initial_event(
+        event_id,
+        slack_event["user"],
+        slack_event["channel"],
+        thread_ts,
+        slack_event["text"],
+    ):
+        logger.info(f"Duplicate event detected: {event_id}")
+        remember_event(event_id)
+        return no_retry_response("Duplicate event ignored")
+    remember_event(event_id)
+    return None
 
 
 def process_url_content(message):
@@ -52,15 +129,20 @@ def process_url_content(message):
         message: ユーザーメッセージ
 
     Returns:
-        str: 処理後のメッセージ
+        tuple: (処理後のメッセージ, 要約のキャッシュキー)
+               キャッシュキーはURLのみのメッセージで内容を取得できた場合のみ設定する
     """
     # URLの抽出
     url = extract_url(message)
     processed_message = message
+    summary_key = None
 
     if url:
         try:
-            url_title, url_content = get_url_content(url)
+            add_count("urls")
+            with timed("url_fetch"):
+                url_title, url_content = get_url_content(url)
+            url_content = cap_source_text(url_content, "url")
 
             # URLのみの場合とそうでない場合で処理を分ける
             if message.strip() == f"<{url}>":
@@ -70,6 +152,7 @@ def process_url_content(message):
                     f"タイトル: {url_title}\n"
                     f"本文: {url_content}\n"
                 )
+                summary_key = get_summary_cache_key(url, url_title, url_content)
             else:
                 processed_message += (
                     f"\n\nURLの内容：\n\nタイトル:{url_title}\n本文:{url_content}"
@@ -82,31 +165,89 @@ def process_url_content(message):
                 f"エラーメッセージ: {str(e)}"
             )
 
-    return processed_message
+    return processed_message, summary_key
 
 
-def process_conversation(conversation_history, message):
+def process_conversation(conversation_history, message, route=None):
     """
     会話履歴とメッセージをモデルに送信し、レスポンスを取得する
 
     Args:
         conversation_history: 会話履歴
         message: 処理済みメッセージ
+        route: route_model の振り分け結果（省略時は既定のモデル）
 
     Returns:
         str: AIの応答
     """
+    route = route or {}
     messages, assistant_response_count = format_conversation_for_claude(
-        conversation_history, message
+        conversation_history,
+        message,
+        model_id=route.get("model_id"),
+        max_tokens=route.get("max_tokens"),
     )
 
     if assistant_response_count >= 50:
-        return "申し訳ありませんが、このスレッドでの回答回数が制限を超えました。新しいスレッドで質問していただくようお願いいたします。"
+        return RESPONSE_LIMIT_MESSAGE
     else:
-        ai_response = invoke_claude_model(messages)
+        ai_response = invoke_claude_model(
+            messages,
+            max_tokens=route.get("max_tokens"),
+            model_id=route.get("model_id"),
+        )
         return ai_response
 
 
+def stream_conversation(
+    channel_id, thread_ts, conversation_history, message, route=None
+):
+    """
+    モデルの出力を受け取りながらSlackのメッセージを順次更新する
+
+    Args:
+        channel_id: Slackチャンネルid
+        thread_ts: スレッドts
+        conversation_history: 会話履歴
+        message: 処理済みメッセージ
+        route: route_model の振り分け結果（省略時は既定のモデル）
+
+    Returns:
+        str: AIの応答の全文
+    """
+    route = route or {}
+    messages, assistant_response_count = format_conversation_for_claude(
+        conversation_history,
+        message,
+        model_id=route.get("model_id"),
+        max_tokens=route.get("max_tokens"),
+    )
+
+    if assistant_response_count >= 50:
+        send_slack_message(channel_id, RESPONSE_LIMIT_MESSAGE, thread_ts)
+        return RESPONSE_LIMIT_MESSAGE
+
+    writer = StreamingMessage(channel_id, thread_ts)
+    writer.start()
+    parts = []
+    try:
+        # Bedrockからの受信とSlackの更新を合わせた、応答の表示が完了するまでの時間
+        with timed("response_stream"):
+            for text in stream_claude_model(
+                messages,
+                max_tokens=route.get("max_tokens"),
+                model_id=route.get("model_id"),
+            ):
+                parts.append(text)
+                writer.append(text)
+            writer.finish()
+    except Exception:
+        writer.fail()
+        raise
+
+    return "".join(parts).strip()
+
+
 def handle_response(channel_id, thread_ts, response, event_id):
     """
     レスポンスをSlackに送信し、DynamoDBを更新する
@@ -118,7 +259,7 @@ def handle_response(channel_id, thread_ts, response, event_id):
         event_id: イベントID
     """
     # AIの応答をログに記録
-    logger.info(f"AI response: {response}")
+    log_event(logging.INFO, "AI response", response=Payload(response))
 
     # Slackにメッセージを送信（スレッド内）
     send_slack_message(channel_id, response, thread_ts)
@@ -127,6 +268,31 @@ def handle_response(channel_id, thread_ts, response, event_id):
     update_event(event_id, response)
 
 
+def notify_error(channel_id, thread_ts, error):
+    """
+    エラーメッセージをSlackのスレッドに送信する
+
+    Args:
+        channel_id: Slackチャンネルid
+        thread_ts: スレッドts
+        error: 発生した例外
+    """
+    if isinstance(error, BedrockBusyError):
+        # 混雑時はエラーの詳細ではなく、時間をおいて再度依頼するよう案内する
+        error_message = BUSY_MESSAGE
+        logger.warning(f"Bedrock busy: {str(error)}")
+    else:
+        error_message = create_error_message("処理", str(error))
+        logger.error(error_message)
+
+    try:
+        send_slack_message(channel_id, error_message, thread_ts)
+    except Exception as slack_error:
+        logger.error(
+            f"Slackへのエラーメッセージ送信中にエラーが発生しました：{str(slack_error)}"
+        )
+
+
 def handle_error(event, error):
     """
     エラーハンドリングを行う
@@ -138,20 +304,18 @@ def handle_error(event, error):
     Returns:
         dict: エラーレスポンス
     """
-    error_message = create_error_message("処理", str(error))
-    logger.error(error_message)
-
     # エラーメッセージをSlackに送信
     try:
-        channel_id = json.loads(event["body"])["event"]["channel"]
-        thread_ts = json.loads(event["body"])["event"].get(
-            "thread_ts", json.loads(event["body"])["event"]["ts"]
-        )
-        send_slack_message(channel_id, error_message, thread_ts)
-    except Exception as slack_error:
+        slack_event = json.loads(event["body"])["event"]
+        channel_id = slack_event["channel"]
+        thread_ts = slack_event.get("thread_ts", slack_event["ts"])
+    except Exception as parse_error:
+        logger.error(create_error_message("処理", str(error)))
         logger.error(
-            f"Slackへのエラーメッセージ送信中にエラーが発生しました：{str(slack_error)}"
+            f"エラー通知先のSlackスレッドを特定できませんでした：{str(parse_error)}"
         )
+    else:
+        notify_error(channel_id, thread_ts, error)
 
     return {
         "statusCode": 500,
@@ -159,49 +323,318 @@ def handle_error(event, error):
     }
 
 
-def lambda_handler(event, context):
+def process_event(channel_id, message, thread_ts, event_id):
+    """
+    受け付け済みのイベントについて、会話履歴の取得から応答の送信までを行う
+
+    スレッドのリースが有効な場合、同じスレッドの応答は1件ずつ生成する。
+    応答中に届いたメンションは、リースを保持しているイベントがまとめて処理する。
+    応答に失敗した場合、まとめて処理する予定だったメンションは失敗として記録する
+    （エラーは呼び出し元がスレッドに通知する）
+
+    Args:
+        channel_id: Slackチャンネルid
+        message: ユーザーメッセージ
+        thread_ts: スレッドts
+        event_id: イベントID
+    """
+    if not THREAD_LEASE_ENABLED:
+        generate_reply(channel_id, message, thread_ts, [event_id])
+        return
+
+    # 保留された場合、リースを保持しているイベントはメッセージをイベントの記録から
+    # 読み込むため、処理済みのメッセージ（添付ファイルの内容を含む）を先に記録する
+    save_event_message(event_id, message)
+    if not acquire_thread_lease(channel_id, thread_ts, event_id):
+        # 応答中のイベントが、このメンションを含めて続けて応答する
+        return
+
+    coalesced = []
     try:
-        # デバッグ: リクエスト全体をログに出力
-        logger.info(f"Received event: {json.dumps(event, indent=2)}")
+        generate_reply(channel_id, message, thread_ts, [event_id])
+
+        # 応答中に届いたメンションは、最新のメッセージに対する1回の応答にまとめる
+        pending = release_thread_lease(channel_id, thread_ts, event_id)
+        while pending:
+            logger.info(f"Coalescing {len(pending)} mentions in thread {thread_ts}")
+            coalesced = [mention["event_id"] for mention in pending]
+            generate_reply(
+                channel_id, load_latest_message(coalesced), thread_ts, coalesced
+            )
+            coalesced = []
+            pending = release_thread_lease(channel_id, thread_ts, event_id)
+    except Exception as e:
+        pending = abandon_thread_lease(channel_id, thread_ts, event_id)
+        unanswered = coalesced + [mention["event_id"] for mention in pending]
+        if unanswered:
+            logger.warning(
+                f"Marking {len(unanswered)} pending mentions as failed "
+                f"in thread {thread_ts}"
+            )
+        for pending_event_id in unanswered:
+            try:
+                fail_event(pending_event_id, str(e))
+            except Exception as record_error:
+                logger.error(
+                    f"Error marking event {pending_event_id} as failed: {record_error}"
+                )
+        raise
 
-        # イベント検証と解析
-        result = validate_and_parse_event(event)
 
-        # チャレンジレスポンスまたは無視すべきイベントの場合は早期リターン
-        if isinstance(result, dict):
-            return result
+def load_latest_message(event_ids):
+    """
+    まとめて応答するメンションのうち、最新のメッセージをイベントの記録から読み込む
+    """
+    for pending_event_id in reversed(event_ids):
+        message = get_event_message(pending_event_id)
+        if message:
+            return message
+    raise RuntimeError(f"Pending mention messages not found: {event_ids}")
 
-        channel_id, user_id, message, thread_ts, event_id = result
 
-        # 最新のユーザーメッセージをログに記録
-        logger.info(f"User message: {message}")
+def generate_reply(channel_id, message, thread_ts, event_ids):
+    """
+    会話履歴を取得して応答を生成し、Slackに送信する
 
-        # 仮のエントリをDynamoDBに保存
-        if not save_initial_event(event_id, user_id, channel_id, thread_ts, message):
-            logger.info(f"Duplicate event detected: {event_id}")
-            return {
-                "statusCode": 200,
-                "body": json.dumps({"message": "Duplicate event ignored"}),
-            }
+    Args:
+        channel_id: Slackチャンネルid
+        message: 応答する対象のユーザーメッセージ
+        thread_ts: スレッドts
+        event_ids: この応答で処理するイベントIDのリスト
+    """
+    # スレッドの会話履歴の取得と、URLを処理したメッセージの作成を並行して行う
+    conversation_history, (processed_message, summary_key) = run_concurrently(
+        [
+            partial(get_thread_history, channel_id, thread_ts),
+            partial(process_url_content, message),
+        ]
+    )
+
+    # デバッグ: スレッドの内容をログに出力
+    log_event(
+        logging.INFO,
+        "Thread history",
+        messages=len(conversation_history),
+        history=Payload(conversation_history),
+    )
+
+    # 最新のメッセージを除外（handle_slack_eventで既に処理済み）
+    conversation_history = conversation_history[:-1]
+    add_count("thread_messages", len(conversation_history))
+
+    # メッセージの長さや添付ファイルの有無などから、応答に使うモデルを選ぶ
+    route = None
+    if MODEL_ROUTING_ENABLED:
+        route = route_model(channel_id, extract_features(message, conversation_history))
+
+    # URLのみのメッセージで、同じページの要約があればモデルを呼び出さずに応答する
+    # 要約は会話履歴を含まないプロンプトの応答として再利用するため、スレッドの
+    # 最初のメッセージに限る（前の会話がなければ応答数の上限にも達しない）
+    if not URL_SUMMARY_CACHE_ENABLED or conversation_history:
+        summary_key = None
+    model_id = route["model_id"] if route else AI_MODEL_ID
+    response = get_url_summary(summary_key, model_id) if summary_key else None
+    if response:
+        handle_response(channel_id, thread_ts, response, event_ids[0])
+    else:
+        response = reply_with_model(
+            channel_id,
+            thread_ts,
+            conversation_history,
+            processed_message,
+            route,
+            event_ids[0],
+        )
+        if summary_key and response and response != RESPONSE_LIMIT_MESSAGE:
+            save_url_summary(summary_key, model_id, response)
+
+    # まとめて処理したイベントにも同じ応答を記録する
+    for event_id in event_ids[1:]:
+        update_event(event_id, response)
 
-        # スレッドの会話履歴を取得
-        conversation_history = get_thread_history(channel_id, thread_ts)
+    # 外部HTTP通信のコネクション再利用状況を記録
+    log_pool_stats()
 
-        # デバッグ: スレッドの内容をログに出力
-        logger.info(f"Thread history: {json.dumps(conversation_history, indent=2)}")
 
-        # 最新のメッセージを除外（handle_slack_eventで既に処理済み）
-        conversation_history = conversation_history[:-1]
+def reply_with_model(
+    channel_id, thread_ts, conversation_history, processed_message, route, event_id
+):
+    """
+    モデルで応答を生成してSlackに送信し、DynamoDBを更新する
 
-        # URLを処理したメッセージを取得
-        processed_message = process_url_content(message)
+    Returns:
+        str: AIの応答
+    """
+    # 長いスレッドでは古い会話を要約に置き換える
+    if THREAD_SUMMARY_ENABLED:
+        conversation_history = compact_history(
+            channel_id, thread_ts, conversation_history
+        )
 
+    start = time.perf_counter()
+    if STREAMING_RESPONSE_ENABLED:
+        # 生成中の応答をSlackに順次表示し、完了後にDynamoDBを更新する
+        response = stream_conversation(
+            channel_id, thread_ts, conversation_history, processed_message, route
+        )
+        if route:
+            log_route_outcome(route, (time.perf_counter() - start) * 1000, response)
+        log_event(logging.INFO, "AI response", response=Payload(response))
+        update_event(event_id, response)
+    else:
         # 会話処理とAIレスポンスの取得
-        response = process_conversation(conversation_history, processed_message)
+        response = process_conversation(conversation_history, processed_message, route)
+        if route:
+            log_route_outcome(route, (time.perf_counter() - start) * 1000, response)
 
         # レスポンス処理
         handle_response(channel_id, thread_ts, response, event_id)
 
+    return response
+
+
+def accept_event(event, context):
+    """
+    非同期モードのフロント処理：イベントを確保してワーカーに渡し、即座に応答する
+
+    Slackの3秒以内の応答期限に間に合わせるため、ここではネットワーク呼び出しを
+    DynamoDBへの確保とワーカーへの送信のみに抑える
+
+    Args:
+        event: Lambda関数に渡されるイベント
+        context: Lambdaコンテキスト
+
+    Returns:
+        dict: HTTPレスポンス
+    """
+    result = parse_event_body(event)
+    if isinstance(result, dict):
+        return result
+
+    slack_event, event_id = result
+
+    # 仮のエントリをDynamoDBに保存（イベントの確保）
+    duplicate_response = claim_event(slack_event, event_id)
+    if duplicate_response:
+        return duplicate_response
+
+    task = {"event_id": event_id, "slack_event": slack_event}
+    try:
+        dispatch_task(task, context)
+    except Exception as e:
+        # イベントは確保済みのため、再送を待たずにこの場で処理する
+        logger.warning(
+            f"Failed to dispatch task, processing inline: event_id={event_id}, "
+            f"error={str(e)}"
+        )
+        return worker_handler({WORKER_TASK_KEY: task}, context)
+
+    return {"statusCode": 200, "body": json.dumps({"message": "Accepted"})}
+
+
+def worker_handler(event, context):
+    """
+    非同期モードのワーカー処理：確保済みのイベントについて応答を生成して送信する
+
+    Lambdaの非同期呼び出しは失敗時に再実行されるため、例外は送出せずに
+    エラーをSlackへ通知して終了する
+
+    Args:
+        event: ワーカー用のイベント（queue_utils.build_worker_event で作成）
+        context: Lambdaコンテキスト
+
+    Returns:
+        dict: 処理結果
+    """
+    task = event[WORKER_TASK_KEY]
+    event_id = task["event_id"]
+    slack_event = task["slack_event"]
+
+    try:
+        # 非同期呼び出しの再実行では、処理中または処理済みのイベントを再び処理しない
+        if not start_event_work(event_id):
+            return {
+                "statusCode": 200,
+                "body": json.dumps({"message": "Already processed"}),
+            }
+
+        channel_id, user_id, message, thread_ts = handle_slack_event(slack_event)
+
+        # 最新のユーザーメッセージをログに記録
+        log_event(logging.INFO, "User message", message=Payload(message))
+
+        process_event(channel_id, message, thread_ts, event_id)
+
+        return {"statusCode": 200, "body": json.dumps({"message": "OK"})}
+
+    except Exception as e:
+        thread_ts = slack_event.get("thread_ts", slack_event["ts"])
+        notify_error(slack_event["channel"], thread_ts, e)
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": "Internal Server Error"}),
+        }
+
+
+def lambda_handler(event, context):
+    # 大きな値を全体出力する呼び出しかどうかを抽選する
+    begin_invocation()
+
+    # 処理段階ごとの時間と件数を集計し、終了時にまとめて出力する
+    begin_metrics()
+    try:
+        with timed("total"):
+            return handle_event(event, context)
+    finally:
+        flush_metrics(get_handler_type(event))
+
+
+def get_handler_type(event):
+    if is_worker_event(event):
+        return "worker"
+    return "front" if ASYNC_PROCESSING_ENABLED else "sync"
+
+
+def handle_event(event, context):
+    # ワーカーとしての呼び出し
+    if is_worker_event(event):
+        return worker_handler(event, context)
+
+    try:
+        # このコンテナで受け付け済みのイベントの再送はAWS・Slackに触れずに打ち切る
+        retry_response = admit_retry(event)
+        if retry_response:
+            return retry_response
+
+        # デバッグ: リクエスト全体をログに出力
+        log_event(logging.INFO, "Received event", event=Payload(event))
+
+        # 非同期モードではイベントを受け付けてすぐに応答する
+        if ASYNC_PROCESSING_ENABLED:
+            return accept_event(event, context)
+
+        # イベントの解析
+        result = parse_event_body(event)
+
+        # チャレンジレスポンスまたは無視すべきイベントの場合は早期リターン
+        if isinstance(result, dict):
+            return result
+
+        slack_event, event_id = result
+
+        # 仮のエントリをDynamoDBに保存（ボットIDの取得や添付ファイルの取得より前に行う）
+        duplicate_response = claim_event(slack_event, event_id)
+        if duplicate_response:
+            return duplicate_response
+
+        # Slackイベントの処理
+        channel_id, user_id, message, thread_ts = handle_slack_event(slack_event)
+
+        # 最新のユーザーメッセージをログに記録
+        log_event(logging.INFO, "User message", message=Payload(message))
+
+        process_event(channel_id, message, thread_ts, event_id)
+
         return {"statusCode": 200, "body": json.dumps({"message": "OK"})}
 
     except Exception as e:
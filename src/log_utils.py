@@ -0,0 +1,153 @@
+import json
+import logging
+import random
+from config import (
+    LOG_PAYLOAD_POLICIES,
+    LOG_PREVIEW_CHARS,
+    LOG_FULL_MAX_CHARS,
+    LOG_DEBUG_SAMPLE_RATE,
+)
+
+logger = logging.getLogger()
+
+# ペイロードの出力方法
+# size: 文字数のみ / preview: 文字数と先頭部分 / full: 全体（LOG_FULL_MAX_CHARS まで）
+PAYLOAD_MODES = ("size", "preview", "full")
+
+# この呼び出しでペイロード全体を出力するかどうか（begin_invocation で抽選する）
+_sampled = False
+
+
+class Payload:
+    """
+    会話履歴やイベント本文などの大きな値であることを示すラッパー
+
+    log_event のフィールドに渡すと、ログレベルごとの方針に従って大きさを抑えて出力する
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class _LazyFields:
+    """
+    ログが実際に出力される時点で初めてフィールドを文字列化する
+    """
+
+    __slots__ = ("fields", "mode")
+
+    def __init__(self, fields, mode):
+        self.fields = fields
+        self.mode = mode
+
+    def __str__(self):
+        rendered = {
+            key: (
+                render_payload(value.value, self.mode)
+                if isinstance(value, Payload)
+                else value
+            )
+            for key, value in self.fields.items()
+        }
+        return json.dumps(rendered, ensure_ascii=False, default=str)
+
+
+def begin_invocation():
+    """
+    呼び出しごとに、ペイロード全体を出力する対象かどうかを抽選する
+    """
+    global _sampled
+    _sampled = LOG_DEBUG_SAMPLE_RATE > 0 and random.random() < LOG_DEBUG_SAMPLE_RATE
+    if _sampled:
+        logger.info("Debug payload dump enabled for this invocation")
+
+
+def reset_log_sampling():
+    global _sampled
+    _sampled = False
+
+
+def log_event(level, name, **fields):
+    """
+    イベント名とフィールドを1行のJSONとして出力する
+
+    Payload で包んだフィールドは、出力するレベルに応じた方針（LOG_PAYLOAD_POLICIES）で
+    大きさを抑える。抽選された呼び出しではレベルによらず全体を出力する。
+    ログレベルが無効な場合は文字列化を行わない
+
+    Args:
+        level: ログレベル（logging.INFO など）
+        name: イベント名（メッセージの先頭に出力する）
+        **fields: 出力するフィールド
+    """
+    if not logger.isEnabledFor(level):
+        return
+    mode = "full" if _sampled else payload_mode(level)
+    logger.log(level, "%s: %s", name, _LazyFields(fields, mode))
+
+
+def payload_mode(level):
+    mode = LOG_PAYLOAD_POLICIES.get(logging.getLevelName(level), "size")
+    return mode if mode in PAYLOAD_MODES else "size"
+
+
+def render_payload(value, mode):
+    """
+    ペイロードを出力方法に応じた大きさの値に変換する
+
+    大きな値を丸ごとシリアライズしないよう、文字数は値をたどって数え、
+    先頭部分は上限までに切り詰めた値からのみ作成する
+    """
+    chars = measure_chars(value)
+    if mode == "size":
+        return {"chars": chars}
+
+    limit = LOG_PREVIEW_CHARS if mode == "preview" else LOG_FULL_MAX_CHARS
+    if chars <= limit:
+        return value
+    text = value if isinstance(value, str) else to_json(truncate_value(value, limit))
+    return {"chars": chars, "preview": text[:limit]}
+
+
+def measure_chars(value):
+    """
+    値に含まれる文字列の合計文字数を求める（シリアライズせずに数える）
+    """
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(str(key)) + measure_chars(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(measure_chars(item) for item in value)
+    return len(str(value))
+
+
+def truncate_value(value, limit):
+    """
+    文字列を limit 文字までに、要素を出力に収まる範囲までに切り詰めた値を返す
+    """
+    if isinstance(value, str):
+        return value[:limit]
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if limit <= 0:
+                break
+            result[key] = truncate_value(item, limit)
+            limit -= len(str(key)) + measure_chars(result[key])
+        return result
+    if isinstance(value, (list, tuple)):
+        result = []
+        for item in value:
+            if limit <= 0:
+                break
+            result.append(truncate_value(item, limit))
+            limit -= measure_chars(result[-1])
+        return result
+    return value
+
+
+def to_json(value):
+    return json.dumps(value, ensure_ascii=False, default=str)
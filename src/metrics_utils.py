@@ -0,0 +1,98 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from config import METRICS_ENABLED, METRICS_NAMESPACE
+
+# 1回の呼び出しで集計する処理段階ごとの時間（ミリ秒）と件数
+# 会話履歴の取得とURLの取得は並行して行うため、更新はロックで保護する
+_lock = threading.Lock()
+_stages = {}
+_counts = {}
+
+
+def begin_metrics():
+    """
+    呼び出しの開始時に、前回の呼び出しの集計を破棄する
+    """
+    with _lock:
+        _stages.clear()
+        _counts.clear()
+
+
+@contextmanager
+def timed(stage):
+    """
+    with ブロックの処理時間を処理段階の時間に加算する
+
+    同じ段階を複数回実行した場合（DynamoDBの読み書きなど）は合計を記録する
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, (time.perf_counter() - start) * 1000)
+
+
+def record_stage(stage, elapsed_ms):
+    with _lock:
+        _stages[stage] = _stages.get(stage, 0.0) + elapsed_ms
+
+
+def add_count(name, value=1):
+    if not value:
+        return
+    with _lock:
+        _counts[name] = _counts.get(name, 0) + value
+
+
+def get_metrics():
+    with _lock:
+        return dict(_stages), dict(_counts)
+
+
+def flush_metrics(handler, **properties):
+    """
+    集計した時間と件数をCloudWatch Embedded Metric Format（EMF）で出力する
+
+    EMFは標準出力に書いたJSON行からCloudWatch Logsがメトリクスを作成するため、
+    追加のAPI呼び出しは発生しない。段階ごとの時間は "<段階>Ms"、件数はそのままの名前になる
+
+    Args:
+        handler: 呼び出しの種類（"sync", "front", "worker"）。ディメンションとして使う
+        **properties: 検索用にログに含める値（event_idなど。メトリクスにはならない）
+    """
+    stages, counts = get_metrics()
+    begin_metrics()
+    if not METRICS_ENABLED or not (stages or counts):
+        return
+
+    metrics = [
+        {"Name": f"{to_metric_name(stage)}Ms", "Unit": "Milliseconds"}
+        for stage in stages
+    ] + [{"Name": to_metric_name(name), "Unit": "Count"} for name in counts]
+    document = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["Handler"]],
+                    "Metrics": metrics,
+                }
+            ],
+        },
+        "Handler": handler,
+        **properties,
+        **{f"{to_metric_name(stage)}Ms": round(ms, 1) for stage, ms in stages.items()},
+        **{to_metric_name(name): value for name, value in counts.items()},
+    }
+    # Lambdaのロガーは行頭に時刻などを付けるため、EMFは print で出力する
+    print(json.dumps(document), flush=True)
+
+
+def to_metric_name(name):
+    """
+    "thread_history" のような名前を "ThreadHistory" に変換する
+    """
+    return "".join(part.capitalize() for part in name.split("_"))
@@ -0,0 +1,81 @@
+import json
+import logging
+from config import WORKER_FUNCTION_NAME
+
+logger = logging.getLogger()
+
+# ワーカー呼び出しであることを示すペイロードのキー
+WORKER_TASK_KEY = "worker_task"
+
+_lambda_client = None
+_task_queue = None
+
+
+class InProcessQueue:
+    """
+    テストやローカル実行用のインプロセスキュー
+
+    dispatch_task で積まれたタスクを保持し、drain で順に処理する
+    """
+
+    def __init__(self):
+        self.tasks = []
+
+    def put(self, task, context=None):
+        self.tasks.append(task)
+
+    def drain(self, handler):
+        results = []
+        while self.tasks:
+            task = self.tasks.pop(0)
+            results.append(handler(build_worker_event(task), None))
+        return results
+
+
+def get_lambda_client():
+    global _lambda_client
+    if _lambda_client is None:
+        import boto3
+
+        _lambda_client = boto3.client("lambda")
+    return _lambda_client
+
+
+def set_task_queue(queue):
+    """
+    タスクの送信先キューを差し替える（None の場合はLambdaの非同期呼び出しに戻す）
+    """
+    global _task_queue
+    _task_queue = queue
+
+
+def build_worker_event(task):
+    return {WORKER_TASK_KEY: task}
+
+
+def is_worker_event(event):
+    return isinstance(event, dict) and WORKER_TASK_KEY in event
+
+
+def dispatch_task(task, context):
+    """
+    ワーカーにタスクを送信する
+
+    Args:
+        task: ワーカーに渡すタスク（JSONシリアライズ可能なdict）
+        context: フロントのLambdaコンテキスト（関数名の解決に使用）
+    """
+    if _task_queue is not None:
+        _task_queue.put(task, context)
+        return
+
+    function_name = WORKER_FUNCTION_NAME or getattr(context, "function_name", None)
+    if not function_name:
+        raise RuntimeError("Worker function name could not be resolved")
+
+    get_lambda_client().invoke(
+        FunctionName=function_name,
+        InvocationType="Event",
+        Payload=json.dumps(build_worker_event(task)).encode("utf-8"),
+    )
+    logger.info(f"Task dispatched to worker: event_id={task.get('event_id')}")
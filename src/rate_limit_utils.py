@@ -0,0 +1,223 @@
+import logging
+import random
+import time
+import uuid
+from config import (
+    AI_MODEL_ID,
+    BEDROCK_ADMISSION_ENABLED,
+    BEDROCK_REQUESTS_PER_MINUTE,
+    BEDROCK_TOKENS_PER_MINUTE,
+    BEDROCK_MAX_CONCURRENCY,
+    BEDROCK_SLOT_LEASE_SECONDS,
+    BEDROCK_ADMISSION_MAX_WAIT_SECONDS,
+    BEDROCK_ADMISSION_POLL_SECONDS,
+)
+from dynamodb_utils import get_table
+
+logger = logging.getLogger()
+
+WINDOW_SECONDS = 60
+
+
+class BedrockBusyError(Exception):
+    """
+    Bedrockの呼び出し枠が空かず、リクエストを受け付けられない場合の例外
+    """
+
+
+def is_conditional_check_failed(error):
+    return error.response["Error"]["Code"] == "ConditionalCheckFailedException"
+
+
+def acquire_bedrock_capacity(estimated_tokens, model_id=AI_MODEL_ID):
+    """
+    Bedrockの呼び出し前に、1分あたりの呼び出し数・トークン数と同時実行数の枠を確保する
+
+    枠が空くまで最大 BEDROCK_ADMISSION_MAX_WAIT_SECONDS 待機し、空かない場合は
+    BedrockBusyError を送出する。DynamoDBのエラー時は制限せずに呼び出しを許可する
+
+    Args:
+        estimated_tokens: 入力と最大出力を合わせた推定トークン数
+        model_id: モデルID
+
+    Returns:
+        dict: 確保した枠（release_bedrock_capacity に渡す。制限が無効な場合はNone）
+    """
+    from botocore.exceptions import ClientError
+
+    if not BEDROCK_ADMISSION_ENABLED:
+        return None
+
+    deadline = time.monotonic() + BEDROCK_ADMISSION_MAX_WAIT_SECONDS
+    try:
+        window = wait_until(
+            lambda: reserve_rate_window(model_id, estimated_tokens), deadline
+        )
+        if window is None:
+            raise BedrockBusyError("Bedrock rate limit reached")
+
+        try:
+            slot = wait_until(lambda: acquire_slot(model_id), deadline)
+        except ClientError:
+            # 制限せずに呼び出す（使用量を補正しない）ため、加算した分を戻す
+            refund_rate_window(model_id, window, estimated_tokens)
+            raise
+        if slot is None:
+            # 呼び出さなかった分を1分間の集計から戻す
+            refund_rate_window(model_id, window, estimated_tokens)
+            raise BedrockBusyError("Bedrock concurrency limit reached")
+    except ClientError as e:
+        logger.warning(f"Bedrock admission unavailable, allowing request: {e}")
+        return None
+
+    return {
+        "model_id": model_id,
+        "window": window,
+        "slot": slot,
+        "estimated_tokens": estimated_tokens,
+    }
+
+
+def release_bedrock_capacity(capacity, actual_tokens=None):
+    """
+    確保した同時実行枠を解放し、実際のトークン数との差を1分あたりの集計に反映する
+    """
+    from botocore.exceptions import ClientError
+
+    if not capacity:
+        return
+
+    index, owner = capacity["slot"]
+    try:
+        get_table().delete_item(
+            Key={"event_id": get_slot_key(capacity["model_id"], index)},
+            ConditionExpression="slot_owner = :owner",
+            ExpressionAttributeValues={":owner": owner},
+        )
+    except ClientError as e:
+        if not is_conditional_check_failed(e):
+            logger.warning(f"Error releasing Bedrock slot: {e}")
+
+    if actual_tokens is not None:
+        try:
+            adjust_rate_window(
+                capacity["model_id"],
+                capacity["window"],
+                0,
+                actual_tokens - capacity["estimated_tokens"],
+            )
+        except ClientError as e:
+            logger.warning(f"Error adjusting Bedrock token usage: {e}")
+
+
+def wait_until(attempt, deadline):
+    """
+    attempt が値を返すか、期限に達するまで繰り返す
+    """
+    while True:
+        result = attempt()
+        if result is not None:
+            return result
+        if time.monotonic() + BEDROCK_ADMISSION_POLL_SECONDS > deadline:
+            return None
+        time.sleep(BEDROCK_ADMISSION_POLL_SECONDS)
+
+
+def get_window_key(model_id, window):
+    return f"bedrock_rate#{model_id}#{window}"
+
+
+def get_slot_key(model_id, index):
+    return f"bedrock_slot#{model_id}#{index}"
+
+
+def reserve_rate_window(model_id, estimated_tokens):
+    """
+    現在の1分間の枠に呼び出し1回と推定トークン数を加算する
+
+    Returns:
+        int: 加算した枠の番号（上限に達している場合はNone）
+    """
+    from botocore.exceptions import ClientError
+
+    now = time.time()
+    window = int(now // WINDOW_SECONDS)
+    try:
+        get_table().update_item(
+            Key={"event_id": get_window_key(model_id, window)},
+            UpdateExpression="ADD requests :one, tokens :tokens SET expires_at = :ttl",
+            ConditionExpression=(
+                "(attribute_not_exists(requests) OR requests < :max_requests) AND "
+                "(attribute_not_exists(tokens) OR tokens <= :max_tokens)"
+            ),
+            ExpressionAttributeValues={
+                ":one": 1,
+                ":tokens": estimated_tokens,
+                ":max_requests": BEDROCK_REQUESTS_PER_MINUTE,
+                ":max_tokens": BEDROCK_TOKENS_PER_MINUTE - estimated_tokens,
+                ":ttl": (window + 2) * WINDOW_SECONDS,
+            },
+        )
+        return window
+    except ClientError as e:
+        if is_conditional_check_failed(e):
+            return None
+        raise
+
+
+def adjust_rate_window(model_id, window, requests, tokens):
+    """
+    1分間の枠の呼び出し数・トークン数を補正する
+    """
+    get_table().update_item(
+        Key={"event_id": get_window_key(model_id, window)},
+        UpdateExpression="ADD requests :requests, tokens :tokens",
+        ExpressionAttributeValues={":requests": requests, ":tokens": tokens},
+    )
+
+
+def refund_rate_window(model_id, window, estimated_tokens):
+    """
+    呼び出さなかったリクエストの分を1分間の枠から戻す（失敗しても処理は続ける）
+    """
+    from botocore.exceptions import ClientError
+
+    try:
+        adjust_rate_window(model_id, window, -1, -estimated_tokens)
+    except ClientError as e:
+        logger.warning(f"Error refunding Bedrock rate window: {e}")
+
+
+def acquire_slot(model_id):
+    """
+    同時実行枠（BEDROCK_MAX_CONCURRENCY 個の枠アイテム）のうち1つを選び、空いていれば確保する
+
+    混雑時に待機中のリクエストが全ての枠へ書き込むと、DynamoDBへの書き込みが
+    待機数×枠数で増えるため、1回の試行では無作為に選んだ1つの枠のみを確保しようとする
+
+    Returns:
+        tuple: (枠の番号, 所有者トークン)（選んだ枠が使用中の場合はNone）
+    """
+    from botocore.exceptions import ClientError
+
+    owner = uuid.uuid4().hex
+    now = int(time.time())
+    index = random.randrange(BEDROCK_MAX_CONCURRENCY)
+    try:
+        get_table().put_item(
+            Item={
+                "event_id": get_slot_key(model_id, index),
+                "slot_owner": owner,
+                "slot_expires_at": now + BEDROCK_SLOT_LEASE_SECONDS,
+                "expires_at": now + BEDROCK_SLOT_LEASE_SECONDS * 2,
+            },
+            ConditionExpression=(
+                "attribute_not_exists(event_id) OR slot_expires_at < :now"
+            ),
+            ExpressionAttributeValues={":now": now},
+        )
+        return index, owner
+    except ClientError as e:
+        if is_conditional_check_failed(e):
+            return None
+        raise
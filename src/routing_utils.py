@@ -0,0 +1,115 @@
+import json
+import logging
+import time
+from config import (
+    MODEL_TIERS,
+    MODEL_ROUTING_RULES,
+    MODEL_ROUTING_DEFAULT_TIER,
+    MODEL_ROUTING_CHANNEL_OVERRIDES,
+)
+from slack_utils import ATTACHMENT_HEADER
+from utils import extract_url
+
+logger = logging.getLogger()
+
+# ルールのうち条件として扱わないキー
+RULE_META_KEYS = {"name", "tier"}
+
+
+def extract_features(message, conversation_history):
+    """
+    モデルの振り分けに使う特徴量を、モデルを呼び出さずにメッセージから求める
+
+    Args:
+        message: ユーザーメッセージ（添付ファイルの内容を含み、URLの内容は含まない）
+        conversation_history: スレッドの会話履歴（最新のメッセージを除く）
+
+    Returns:
+        dict: 特徴量
+    """
+    text, _, attachment = message.partition(ATTACHMENT_HEADER)
+    return {
+        "message_chars": len(text.strip()),
+        "attachment_chars": len(attachment),
+        "has_attachment": bool(attachment),
+        "has_url": extract_url(text) is not None,
+        "has_code": "```" in message,
+        "thread_depth": len(conversation_history),
+    }
+
+
+def route_model(channel_id, features):
+    """
+    特徴量とルールから、応答に使うモデルと最大出力トークン数を決める
+
+    チャンネルごとの指定があればそれを優先し、なければルールを上から順に評価して
+    最初に条件をすべて満たしたティアを使う。どれにも当てはまらない場合は既定のティアを使う
+
+    Args:
+        channel_id: Slackチャンネルid
+        features: extract_features で求めた特徴量
+
+    Returns:
+        dict: tier, model_id, max_tokens, rule を含む振り分け結果
+    """
+    start = time.perf_counter()
+
+    tier = MODEL_ROUTING_CHANNEL_OVERRIDES.get(channel_id)
+    rule_name = "channel_override" if tier else None
+    if not tier:
+        rule = next(
+            (rule for rule in MODEL_ROUTING_RULES if matches_rule(rule, features)),
+            None,
+        )
+        tier = rule["tier"] if rule else MODEL_ROUTING_DEFAULT_TIER
+        rule_name = rule.get("name", rule["tier"]) if rule else "default"
+
+    if tier not in MODEL_TIERS:
+        logger.warning(f"Unknown model tier '{tier}', using default tier")
+        tier = MODEL_ROUTING_DEFAULT_TIER
+
+    route = {
+        "tier": tier,
+        "model_id": MODEL_TIERS[tier]["model_id"],
+        "max_tokens": MODEL_TIERS[tier]["max_tokens"],
+        "rule": rule_name,
+    }
+    logger.info(
+        f"Model routing: channel={channel_id}, tier={tier}, "
+        f"model={route['model_id']}, max_tokens={route['max_tokens']}, "
+        f"rule={rule_name}, features={json.dumps(features)}, "
+        f"decision_ms={(time.perf_counter() - start) * 1000:.3f}"
+    )
+    return route
+
+
+def matches_rule(rule, features):
+    """
+    特徴量がルールの条件をすべて満たすかどうかを判定する
+
+    "max_" / "min_" で始まる条件は上限・下限（境界を含む）、それ以外は値の一致を判定する。
+    特徴量にない条件を含むルールは満たさないものとする
+    """
+    for key, expected in rule.items():
+        if key in RULE_META_KEYS:
+            continue
+        if key.startswith("max_") and key[4:] in features:
+            if features[key[4:]] > expected:
+                return False
+        elif key.startswith("min_") and key[4:] in features:
+            if features[key[4:]] < expected:
+                return False
+        elif key not in features or features[key] != expected:
+            return False
+    return True
+
+
+def log_route_outcome(route, latency_ms, response):
+    """
+    振り分け結果と応答までの時間を記録する（ルールの調整に使う）
+    """
+    logger.info(
+        f"Model routing outcome: tier={route['tier']}, model={route['model_id']}, "
+        f"rule={route['rule']}, latency_ms={latency_ms:.0f}, "
+        f"response_chars={len(response)}"
+    )
@@ -1,13 +1,49 @@
+import hashlib
 import logging
-import requests
-from slack_sdk import WebClient
-from slack_sdk.errors import SlackApiError
-from config import SLACK_BOT_TOKEN, SLACK_MESSAGE_LIMIT
-from utils import extract_url
+import re
+import time
+from config import (
+    SLACK_BOT_TOKEN,
+    SLACK_BOT_USER_ID,
+    SLACK_API_BASE_URL,
+    SLACK_MESSAGE_LIMIT,
+    BOT_IDENTITY_PERSIST_ENABLED,
+    STREAMING_UPDATE_INTERVAL_SECONDS,
+    STREAMING_PLACEHOLDER_TEXT,
+    STREAMING_INTERRUPTED_TEXT,
+    FILE_EXPANSION_CACHE_TTL_SECONDS,
+    THREAD_HISTORY_PAGE_SIZE,
+    THREAD_HISTORY_INCREMENTAL,
+    THREAD_HISTORY_CACHE_TTL_SECONDS,
+    THREAD_HISTORY_SETTLE_SECONDS,
+    HTTP_READ_TIMEOUT_SECONDS,
+    HTTP_MAX_RETRIES,
+)
+from cache_utils import get_cached, set_cached
+from context_utils import cap_source_text
+from dynamodb_utils import get_state, put_state
+from http_utils import http_get
+from metrics_utils import timed, record_stage, add_count
+from functools import partial
+from utils import extract_url, run_concurrently
 from url_utils import get_url_content
 
 logger = logging.getLogger()
-slack_client = WebClient(token=SLACK_BOT_TOKEN)
+
+# メッセージに添付ファイルの内容を追加する際の見出し
+ATTACHMENT_HEADER = "\n\n添付ファイルの内容:\n"
+
+# 応答の分割で扱うコードブロックの区切りとリストの項目
+FENCE = "```"
+LIST_ITEM_PATTERN = re.compile(r"\s*(?:[-*•]|\d+[.)])\s")
+# 末尾の空行（分割したメッセージでは除かれる）
+TRAILING_BLANK_LINES_PATTERN = re.compile(r"(?:\n[^\S\n]*)*$")
+
+# コールドスタートを短くするため、slack_sdkはクライアントの初回利用時に読み込む
+_slack_client = None
+
+# コンテナ内で解決済みのボットのユーザーID
+_bot_user_id = None
 
 
 def handle_slack_event(slack_event):
@@ -30,102 +66,622 @@ def handle_slack_event(slack_event):
 
     # ファイルの内容をメッセージに追加
     if file_contents:
-        message += "\n\n添付ファイルの内容:\n" + "\n---\n".join(file_contents)
+        message += ATTACHMENT_HEADER + "\n---\n".join(file_contents)
 
     return channel_id, user_id, message, thread_ts
 
 
+def get_slack_client():
+    global _slack_client
+    if _slack_client is None:
+        from slack_sdk import WebClient
+        from slack_sdk.http_retry.builtin_handlers import (
+            ConnectionErrorRetryHandler,
+            RateLimitErrorRetryHandler,
+        )
+
+        # WebClientは独自のHTTP実装を持つため、タイムアウトとリトライのみ揃える
+        _slack_client = WebClient(
+            token=SLACK_BOT_TOKEN,
+            base_url=SLACK_API_BASE_URL or WebClient.BASE_URL,
+            timeout=HTTP_READ_TIMEOUT_SECONDS,
+            retry_handlers=[
+                ConnectionErrorRetryHandler(max_retry_count=HTTP_MAX_RETRIES),
+                RateLimitErrorRetryHandler(max_retry_count=1),
+            ],
+        )
+    return _slack_client
+
+
 def get_bot_user_id():
+    """
+    ボットのユーザーIDを取得する
+
+    コンテナ内で1度だけ解決し、以降はキャッシュした値を返す
+    """
+    global _bot_user_id
+    if _bot_user_id is None:
+        _bot_user_id = resolve_bot_user_id()
+    return _bot_user_id
+
+
+def clear_bot_user_id_cache():
+    global _bot_user_id
+    _bot_user_id = None
+
+
+def resolve_bot_user_id():
+    """
+    環境変数、DynamoDB、auth.testの順にボットのユーザーIDを解決する
+    """
+    if SLACK_BOT_USER_ID:
+        return SLACK_BOT_USER_ID
+
+    state_key = get_bot_identity_key()
+    if BOT_IDENTITY_PERSIST_ENABLED:
+        try:
+            item = get_state(state_key)
+            if item and item.get("bot_user_id"):
+                return item["bot_user_id"]
+        except Exception as e:
+            logger.warning(f"Error loading bot user ID from DynamoDB: {e}")
+
+    bot_user_id = fetch_bot_user_id()
+
+    if bot_user_id and BOT_IDENTITY_PERSIST_ENABLED:
+        try:
+            put_state(state_key, {"bot_user_id": bot_user_id})
+        except Exception as e:
+            logger.warning(f"Error saving bot user ID to DynamoDB: {e}")
+
+    return bot_user_id
+
+
+def get_bot_identity_key():
+    # トークンそのものは保存せず、ハッシュでワークスペース（トークン）を識別する
+    token_hash = hashlib.sha256(SLACK_BOT_TOKEN.encode("utf-8")).hexdigest()[:16]
+    return f"bot_identity#{token_hash}"
+
+
+def fetch_bot_user_id():
+    from slack_sdk.errors import SlackApiError
+
     try:
-        response = slack_client.auth_test()
+        response = get_slack_client().auth_test()
         return response["user_id"]
     except SlackApiError as e:
         logger.error(f"Error getting bot user ID: {e}")
         return None
 
 
-BOT_USER_ID = get_bot_user_id()
+@timed("thread_history")
+def get_thread_history(channel_id, thread_ts):
+    """
+    スレッドの会話履歴を取得し、添付ファイルとURLの内容を本文中に展開する
 
+    インクリメンタルモードでは、前回までに取得・展開した履歴を保持しておき、
+    それ以降のメッセージのみをSlackから取得して結合する。保持した履歴は、
+    返信数と最新のボットのメッセージの編集を確認し、変わっていれば全体を取得し直す
+    """
+    from slack_sdk.errors import SlackApiError
+
+    state_key = f"{channel_id}:{thread_ts}"
+    state = get_cached("thread", state_key) if THREAD_HISTORY_INCREMENTAL else None
+    bot_user_id = get_bot_user_id()
 
-def get_thread_history(channel_id, thread_ts):
     try:
-        response = slack_client.conversations_replies(channel=channel_id, ts=thread_ts)
-        messages = response["messages"]
+        fetched = None
+        if state and state.get("check_ts"):
+            # 確認するメッセージも含めて取得し、保持した履歴が変わっていないか確認する
+            fetched = fetch_thread_replies(
+                channel_id, thread_ts, oldest=state["check_ts"], inclusive=True
+            )
+            if not is_history_unchanged(state, fetched, thread_ts):
+                logger.info(f"Thread history changed, refetching: {state_key}")
+                fetched = None
+        if fetched is None:
+            state = None
+            fetched = fetch_thread_replies(channel_id, thread_ts)
+    except SlackApiError as e:
+        logger.error(f"Error fetching thread history: {e}")
+        return []
 
-        # 各メッセージの添付ファイル、URLを本文中に展開
-        for msg in messages:
-            # ボットのメッセージの場合はスキップ
-            if msg.get("user") == BOT_USER_ID:
-                continue
+    prefix = state["messages"] if state else []
+    last_ts = state["last_ts"] if state else None
+
+    # 取得済みのメッセージ（親メッセージは毎回返される）を除外
+    new_messages = [
+        msg for msg in fetched if not last_ts or ts_key(msg["ts"]) > ts_key(last_ts)
+    ]
+
+    # 各メッセージの添付ファイル、URLを本文中に展開（ボットのメッセージは除く）
+    expand_messages([msg for msg in new_messages if msg.get("user") != bot_user_id])
+
+    messages = prefix + new_messages
+
+    if THREAD_HISTORY_INCREMENTAL and messages:
+        check_message = get_check_message(messages, bot_user_id)
+        # 生成中の応答は後から更新されるため、確定するまで保持しない
+        if not is_message_streaming(check_message):
+            set_cached(
+                "thread",
+                state_key,
+                {
+                    "messages": messages,
+                    "last_ts": messages[-1]["ts"],
+                    "check_ts": check_message["ts"],
+                    "check_edited": get_edited_ts(check_message),
+                },
+                THREAD_HISTORY_CACHE_TTL_SECONDS,
+            )
+
+    return messages
+
+
+def get_check_message(messages, bot_user_id):
+    """
+    保持した履歴が変わっていないか確認するメッセージ（最新のボットのメッセージ、
+    なければ最後のメッセージ）を返す
+    """
+    for msg in reversed(messages):
+        if msg.get("user") == bot_user_id:
+            return msg
+    return messages[-1]
+
+
+def is_history_unchanged(state, fetched, thread_ts):
+    """
+    保持した履歴以降に取得したメッセージから、保持した履歴が変わっていないか確認する
+
+    親メッセージの返信数が履歴の件数と一致し（削除がない）、
+    確認するメッセージが前回から編集されていない場合にTrueを返す
+    """
+    if not fetched or fetched[0]["ts"] != thread_ts:
+        return False
+
+    last_ts = ts_key(state["last_ts"])
+    new_count = sum(1 for msg in fetched if ts_key(msg["ts"]) > last_ts)
+    # 保持した履歴は親メッセージを含む
+    if fetched[0].get("reply_count", 0) != len(state["messages"]) - 1 + new_count:
+        return False
+
+    for msg in fetched:
+        if msg["ts"] == state["check_ts"]:
+            return get_edited_ts(msg) == state["check_edited"]
+    return False
+
+
+def get_edited_ts(message):
+    return (message.get("edited") or {}).get("ts")
 
-            # 添付ファイルを取得
-            files = msg.get("files", [])
-            file_contents = process_files(files)
-            if file_contents:
-                msg["text"] += "\n\n添付ファイルの内容:\n" + "\n---\n".join(
-                    file_contents
+
+def is_message_streaming(message):
+    """
+    メッセージがまだ生成中（プレースホルダー、または最近更新された）かどうかを返す
+    """
+    if message.get("text") == STREAMING_PLACEHOLDER_TEXT:
+        return True
+    last_activity = get_edited_ts(message) or message["ts"]
+    return time.time() - float(last_activity) < THREAD_HISTORY_SETTLE_SECONDS
+
+
+def fetch_thread_replies(channel_id, thread_ts, oldest=None, inclusive=False):
+    """
+    conversations.replies をカーソルでページングしてスレッドのメッセージを取得する
+
+    Args:
+        channel_id: Slackチャンネルid
+        thread_ts: スレッドts
+        oldest: 指定した場合、このts以降のメッセージのみを取得する
+        inclusive: Trueの場合、oldestのメッセージ自体も取得する
+
+    Returns:
+        list: tsの昇順に並んだメッセージ（重複なし）
+    """
+    messages = []
+    seen = set()
+    cursor = None
+
+    while True:
+        params = {
+            "channel": channel_id,
+            "ts": thread_ts,
+            "limit": THREAD_HISTORY_PAGE_SIZE,
+        }
+        if oldest:
+            params["oldest"] = oldest
+            if inclusive:
+                params["inclusive"] = True
+        if cursor:
+            params["cursor"] = cursor
+
+        response = get_slack_client().conversations_replies(**params)
+
+        # 親メッセージは各ページの先頭に含まれるため、重複を除く
+        for msg in response["messages"]:
+            if msg["ts"] not in seen:
+                seen.add(msg["ts"])
+                messages.append(msg)
+
+        cursor = (response.get("response_metadata") or {}).get("next_cursor")
+        if not response.get("has_more") or not cursor:
+            break
+
+    return messages
+
+
+def expand_messages(messages):
+    """
+    メッセージの添付ファイル、URLの内容を本文中に展開する
+
+    全メッセージの取得処理をまとめて並行実行し、結果は元の順序で本文に追加する。
+    取得の件数と時間は、現在のメッセージと同じメトリクス（files/urls、
+    file_download/url_fetch）に加算する
+    """
+    fetch_file = timed("file_download")(get_cached_file_content)
+    fetch_url = timed("url_fetch")(try_get_url_content)
+    plans = []
+    tasks = []
+    for msg in messages:
+        text_files = [file for file in msg.get("files", []) if is_text_file(file)]
+        url = extract_url(msg["text"])
+        plans.append((msg, text_files, url))
+        tasks.extend(partial(fetch_file, file) for file in text_files)
+        if url:
+            tasks.append(partial(fetch_url, url))
+    add_count("files", sum(len(text_files) for _, text_files, _ in plans))
+    add_count("urls", sum(1 for _, _, url in plans if url))
+
+    results = iter(run_concurrently(tasks))
+
+    for msg, text_files, url in plans:
+        # 添付ファイルの内容を追加
+        file_contents = [
+            format_file_content(file, content)
+            for file, content in zip(text_files, results)
+            if content
+        ]
+        if file_contents:
+            msg["text"] += ATTACHMENT_HEADER + "\n---\n".join(file_contents)
+
+        # URLの内容を追加
+        if url:
+            url_content, error = next(results)
+            if error is None:
+                url_title, url_content = url_content
+                url_content = cap_source_text(url_content, "url")
+                msg[
+                    "text"
+                ] += f"\n\nURLの内容：\n\nタイトル:{url_title}\n本文:{url_content}"
+            else:
+                logger.error(f"Error processing URL {url}: {str(error)}")
+                msg["text"] += (
+                    f"\n\n【システムメッセージ】URL内容取得を試みましたが、失敗しました。\n"
+                    f"対象URL: {url}\n"
+                    f"エラーメッセージ: {str(error)}\n"
                 )
 
-            # URLを取得
-            url = extract_url(msg["text"])
-            if url:
-                try:
-                    url_title, url_content = get_url_content(url)
-                    msg[
-                        "text"
-                    ] += f"\n\nURLの内容：\n\nタイトル:{url_title}\n本文:{url_content}"
-                except Exception as e:
-                    logger.error(f"Error processing URL {url}: {str(e)}")
-                    msg["text"] += (
-                        f"\n\n【システムメッセージ】URL内容取得を試みましたが、失敗しました。\n"
-                        f"対象URL: {url}\n"
-                        f"エラーメッセージ: {str(e)}\n"
-                    )
-
-        return messages
 
-    except SlackApiError as e:
-        logger.error(f"Error fetching thread history: {e}")
-        return []
+def try_get_url_content(url):
+    """
+    get_url_content の結果を (内容, 例外) の組で返す
+
+    URLの内容のキャッシュと再検証は get_url_content が行う
+    """
+    try:
+        return get_url_content(url), None
+    except Exception as e:
+        return None, e
+
+
+def ts_key(ts):
+    """Slackのts（"秒.マイクロ秒"）を比較可能なタプルに変換する"""
+    seconds, _, micros = ts.partition(".")
+    return int(seconds), int(micros or 0)
+
+
+def slack_length(text):
+    """
+    Slackと同じ数え方（UTF-16のコード単位）で文字数を求める
+
+    絵文字などの基本多言語面外の文字は2文字として数える
+    """
+    if text.isascii():
+        return len(text)
+    return len(text.encode("utf-16-le")) // 2
 
 
 def split_message(text, limit=SLACK_MESSAGE_LIMIT):
-    """メッセージを指定文字数で分割（改行位置を考慮）"""
-    if len(text) <= limit:
+    """
+    メッセージをSlackの1メッセージの上限（limit）以内に分割する
+
+    行を先頭から1回だけ走査し、上限を超える時点で、段落の区切り・コードブロックの前後・
+    リストの項目の前を優先して分割する（前半が上限の半分に満たない場合は1行の途中で分割する）。
+    コードブロックの途中で分割した場合は、前のメッセージでブロックを閉じ、
+    次のメッセージで同じ言語指定のまま開き直す
+    """
+    if slack_length(text) <= limit:
         return [text]
 
+    lines = scan_message_lines(text, limit)
     messages = []
-    while text:
-        if len(text) <= limit:
-            messages.append(text)
+    i = 0
+    while i < len(lines):
+        start = i
+        # コードブロックの途中から始まる場合は開き直す
+        fence = lines[i][2]
+        chunk = [fence] if fence else []
+        size = slack_length(fence) if fence else 0
+        best = None
+        latest = None
+        while i < len(lines):
+            line, length, _, score = lines[i]
+            if i > start and score:
+                # この行の前で分割する候補（点数が高く、後ろにあるものを優先する）
+                latest = i
+                if size >= limit // 2 and (best is None or score >= lines[best][3]):
+                    best = i
+            new_size = size + (1 if chunk else 0) + length
+            # この行で終える場合にコードブロックを閉じる分も含めて上限に収める
+            fence_after = lines[i + 1][2] if i + 1 < len(lines) else None
+            if new_size + (len(FENCE) + 1 if fence_after else 0) > limit:
+                break
+            chunk.append(line)
+            size = new_size
+            i += 1
+        else:
+            _append_message(messages, chunk, None)
             break
 
-        # 改行位置で分割を試みる
-        split_pos = text.rfind("\n", 0, limit)
-        if split_pos == -1 or split_pos < limit // 2:
-            # 改行がない場合や位置が前すぎる場合はスペースで分割
-            split_pos = text.rfind(" ", 0, limit)
-        if split_pos == -1:
-            split_pos = limit
-
-        messages.append(text[:split_pos])
-        text = text[split_pos:].lstrip()
+        if best is None:
+            line, length, fence_before, _ = lines[i]
+            available = limit - size - (1 if chunk else 0)
+            available -= len(FENCE) + 1 if fence_before else 0
+            if available > 0 and (i == start or length > limit // 2):
+                # 長い行は残りに収まる分だけを前のメッセージに含める
+                head, rest = split_line(line, available, fence_before is not None)
+                chunk.append(head)
+                # 残りの文字数は、切り出した部分（上限以内）を数えて差し引く
+                consumed = slack_length(line[: len(line) - len(rest)])
+                lines[i] = (rest, length - consumed, fence_before, 0)
+                _append_message(messages, chunk, fence_before)
+                continue
+            best = latest if latest is not None else i
+        _append_message(messages, chunk[: len(chunk) - (i - best)], lines[best][2])
+        i = best
 
     return messages
 
 
+def scan_message_lines(text, limit):
+    """
+    メッセージを行に分け、各行の直前で分割する場合の情報を求める
+
+    Returns:
+        list: (行, 文字数, 行の直前で開いているコードブロックの開始行, 分割の優先度) のリスト。
+              優先度は 3: 段落・コードブロックの前後、2: リストの項目・見出しの前、
+              1: その他の行の前、0: コードブロックを閉じる行の前（分割しない）
+    """
+    # 基本多言語面外の文字を含まなければ、各行の文字数は len と一致する
+    measure = len if slack_length(text) == len(text) else slack_length
+    lines = []
+    fence = None
+    previous_blank = False
+    previous_fence = False
+    for line in text.split("\n"):
+        stripped = line.strip()
+        is_fence = stripped.startswith(FENCE) and not (
+            len(stripped) > 2 * len(FENCE) - 1 and stripped.endswith(FENCE)
+        )
+        if fence is not None:
+            score = 0 if is_fence else 1
+        elif not stripped or previous_blank or previous_fence or is_fence:
+            score = 3
+        elif LIST_ITEM_PATTERN.match(line) or stripped.startswith("#"):
+            score = 2
+        else:
+            score = 1
+        lines.append((line, measure(line), fence, score))
+
+        if is_fence:
+            # 開き直す際に上限を圧迫しないよう、長すぎる開始行は言語指定を省く
+            opener = stripped if slack_length(stripped) <= limit // 4 else FENCE
+            fence = opener if fence is None else None
+        previous_blank = not stripped
+        previous_fence = is_fence and fence is None
+    return lines
+
+
+def split_line(line, available, in_code):
+    """
+    1行を available 文字以内の先頭部分と残りに分ける
+
+    コードブロックの外では後半の空白で区切り、区切った空白は取り除く
+    """
+    if line.isascii():
+        cut = available
+    else:
+        cut = 0
+        used = 0
+        for ch in line:
+            used += 2 if ord(ch) > 0xFFFF else 1
+            if used > available:
+                break
+            cut += 1
+    if not in_code:
+        space = line.rfind(" ", 0, cut + 1)
+        if space >= cut // 2 and space > 0:
+            return line[:space], line[space:].lstrip()
+    return line[:cut], line[cut:]
+
+
+def _append_message(messages, chunk, fence):
+    # 前後の空行を除き、コードブロックの途中で終わる場合は閉じる
+    begin, end = 0, len(chunk)
+    while begin < end and not chunk[begin].strip():
+        begin += 1
+    while end > begin and not chunk[end - 1].strip():
+        end -= 1
+    if begin == end:
+        return
+    body = chunk[begin:end]
+    if fence:
+        body.append(FENCE)
+    messages.append("\n".join(body))
+
+
 def send_slack_message(channel_id, text, thread_ts):
+    from slack_sdk.errors import SlackApiError
+
     try:
         messages = split_message(text)
-        for msg in messages:
-            slack_client.chat_postMessage(
-                channel=channel_id, text=msg, thread_ts=thread_ts
-            )
+        add_count("response_chunks", len(messages))
+        with timed("slack_send"):
+            for msg in messages:
+                get_slack_client().chat_postMessage(
+                    channel=channel_id, text=msg, thread_ts=thread_ts
+                )
     except SlackApiError as e:
         logger.error(f"Error sending message to Slack: {e}")
         raise
 
 
+class StreamingMessage:
+    """
+    生成中の応答をSlackのメッセージとして順次表示するライター
+
+    プレースホルダーを投稿し、追加されたテキストで chat_update を一定間隔ごとに行う。
+    1メッセージの上限を超えた場合は確定した部分を残し、続きを新しいメッセージに投稿する
+    """
+
+    def __init__(
+        self,
+        channel_id,
+        thread_ts,
+        limit=SLACK_MESSAGE_LIMIT,
+        interval=STREAMING_UPDATE_INTERVAL_SECONDS,
+    ):
+        self.channel_id = channel_id
+        self.thread_ts = thread_ts
+        self.limit = limit
+        self.interval = interval
+        # 現在更新中のメッセージのtsと表示するテキスト
+        self.message_ts = None
+        self.text = ""
+        self.shown_text = None
+        self.last_update = 0.0
+        self.attempted = False
+        self.started_at = None
+        self.first_token_ms = None
+
+    def start(self):
+        """
+        プレースホルダーを投稿する
+        """
+        self.started_at = time.monotonic()
+        self.message_ts = self._post(STREAMING_PLACEHOLDER_TEXT)
+        self.last_update = self.started_at
+
+    def append(self, text):
+        """
+        テキストを追加し、必要に応じてメッセージを更新する
+        """
+        self.text += text
+        if slack_length(self.text) > self.limit:
+            self._rollover()
+        elif not self.attempted or time.monotonic() - self.last_update >= self.interval:
+            # 最初の出力は待たずに表示する
+            self._update()
+
+    def finish(self):
+        """
+        残りのテキストでメッセージを確定する
+        """
+        self.text = self.text.strip()
+        if self.text:
+            self._update(raise_on_error=True)
+        elif self.shown_text is None:
+            # 何も出力されなかった場合はプレースホルダーを削除する
+            get_slack_client().chat_delete(channel=self.channel_id, ts=self.message_ts)
+
+    def fail(self):
+        """
+        生成が中断されたことを、出力済みのメッセージに追記する
+        （まだ何も出力していない場合はプレースホルダーを削除する）
+        """
+        if self.message_ts is None:
+            return
+        if self.shown_text is None and not self.text.strip():
+            # 何も表示していない場合はプレースホルダーを削除し、エラーの通知のみを残す
+            try:
+                get_slack_client().chat_delete(
+                    channel=self.channel_id, ts=self.message_ts
+                )
+            except Exception as e:
+                logger.warning(f"Error deleting placeholder message: {e}")
+            return
+        self.text = f"{self.text.strip()}\n{STREAMING_INTERRUPTED_TEXT}".strip()
+        self._update()
+
+    def _rollover(self):
+        # 確定した部分は現在のメッセージと新しいメッセージに書き込み、
+        # 最後の断片を次に更新するメッセージとする
+        pieces = split_message(self.text, self.limit)
+        # 分割では末尾の空行が除かれるため、続きの出力の前に元の空行を戻す
+        trailing = TRAILING_BLANK_LINES_PATTERN.search(self.text).group()
+        self.text = pieces[0]
+        self._update(raise_on_error=True)
+        for piece in pieces[1:]:
+            self.message_ts = self._post(piece)
+            self.text = self.shown_text = piece
+        self.text += trailing
+
+    def _post(self, text):
+        from slack_sdk.errors import SlackApiError
+
+        try:
+            with timed("slack_send"):
+                response = get_slack_client().chat_postMessage(
+                    channel=self.channel_id, text=text, thread_ts=self.thread_ts
+                )
+        except SlackApiError as e:
+            logger.error(f"Error sending message to Slack: {e}")
+            raise
+        add_count("response_chunks")
+        self._record_first_token(text)
+        return response["ts"]
+
+    def _update(self, raise_on_error=False):
+        from slack_sdk.errors import SlackApiError
+
+        if self.text == self.shown_text:
+            return
+        self.attempted = True
+        self.last_update = time.monotonic()
+        try:
+            with timed("slack_send"):
+                get_slack_client().chat_update(
+                    channel=self.channel_id, ts=self.message_ts, text=self.text
+                )
+        except SlackApiError as e:
+            # 途中の更新に失敗しても、次の更新で最新の内容を表示できる
+            if raise_on_error:
+                logger.error(f"Error updating Slack message: {e}")
+                raise
+            logger.warning(f"Error updating Slack message, will retry: {e}")
+            return
+        self.shown_text = self.text
+        self._record_first_token(self.text)
+
+    def _record_first_token(self, text):
+        if self.first_token_ms is not None or self.started_at is None:
+            return
+        if text and text != STREAMING_PLACEHOLDER_TEXT:
+            self.first_token_ms = (time.monotonic() - self.started_at) * 1000
+            record_stage("first_visible_token", self.first_token_ms)
+            logger.info(f"Time to first visible token: {self.first_token_ms:.0f}ms")
+
+
 def is_text_file(file):
     mimetype = file.get("mimetype", "")
     filetype = file.get("filetype", "")
@@ -148,12 +704,15 @@ def is_text_file(file):
 
 
 def get_file_content(file_id):
+    import requests
+    from slack_sdk.errors import SlackApiError
+
     try:
-        response = slack_client.files_info(file=file_id)
+        response = get_slack_client().files_info(file=file_id)
         file_url = response["file"]["url_private"]
 
         headers = {"Authorization": f"Bearer {SLACK_BOT_TOKEN}"}
-        content_response = requests.get(file_url, headers=headers)
+        content_response = http_get(file_url, headers=headers)
 
         if content_response.status_code == 200:
             return content_response.text
@@ -163,16 +722,40 @@ def get_file_content(file_id):
                 f"Status code: {content_response.status_code}"
             )
             return None
-    except SlackApiError as e:
+    except (SlackApiError, requests.RequestException) as e:
         logger.error(f"Error fetching file content: {e}")
         return None
 
 
+def get_cached_file_content(file):
+    """
+    ファイルの内容を取得する（ファイルIDと更新日時ごとにキャッシュする）
+    """
+    version = file.get("updated") or file.get("created") or ""
+    cache_key = f"{file['id']}:{version}"
+    content = get_cached("file", cache_key)
+    if content is not None:
+        return content
+
+    content = get_file_content(file["id"])
+    if content:
+        set_cached("file", cache_key, content, FILE_EXPANSION_CACHE_TTL_SECONDS)
+    return content
+
+
 def process_files(files):
-    file_contents = []
-    for file in files:
-        if is_text_file(file):
-            content = get_file_content(file["id"])
-            if content:
-                file_contents.append(f"ファイル名: {file['name']}\n内容:\n{content}")
-    return file_contents
+    text_files = [file for file in files if is_text_file(file)]
+    add_count("files", len(text_files))
+    # スレッド履歴の展開と同じく、ファイルごとの取得時間を合計する
+    fetch_file = timed("file_download")(get_cached_file_content)
+    contents = run_concurrently([partial(fetch_file, file) for file in text_files])
+    return [
+        format_file_content(file, content)
+        for file, content in zip(text_files, contents)
+        if content
+    ]
+
+
+def format_file_content(file, content):
+    content = cap_source_text(content, "file")
+    return f"ファイル名: {file['name']}\n内容:\n{content}"
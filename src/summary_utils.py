@@ -0,0 +1,141 @@
+import logging
+import time
+from config import (
+    THREAD_SUMMARY_TRIGGER_TOKENS,
+    THREAD_SUMMARY_KEEP_RECENT,
+    THREAD_SUMMARY_MAX_TOKENS,
+    THREAD_SUMMARY_INPUT_TOKEN_CAP,
+    THREAD_SUMMARY_TTL_SECONDS,
+)
+from bedrock_utils import invoke_claude_model
+from context_utils import estimate_tokens, truncate_to_tokens
+from dynamodb_utils import get_state, put_state
+from slack_utils import ts_key
+
+logger = logging.getLogger()
+
+SUMMARY_SYSTEM_PROMPT = (
+    "あなたはSlackのスレッドの会話を要約するアシスタントです。"
+    "後続の会話で参照できるように、質問の内容、回答の要点、決定事項、未解決の事項、"
+    "固有名詞や数値などの重要な情報を漏らさずに、日本語で簡潔にまとめてください。"
+)
+SUMMARY_HEADER = "【システムメッセージ】これまでの会話の要約です。\n"
+
+
+def get_summary_key(channel_id, thread_ts):
+    return f"summary#{channel_id}:{thread_ts}"
+
+
+def compact_history(channel_id, thread_ts, conversation_history):
+    """
+    スレッドの古い会話を要約に置き換えた会話履歴を返す
+
+    保存済みの要約があれば、要約済みのメッセージを要約1件に置き換える。
+    要約されていない部分が大きくなった場合は、直近のメッセージを残して
+    それより前の会話を前回の要約と合わせて要約し直し、DynamoDBに保存する
+
+    Args:
+        channel_id: Slackチャンネルid
+        thread_ts: スレッドts
+        conversation_history: 会話履歴（最新のメッセージを除く）
+
+    Returns:
+        list: 要約（先頭）と要約されていないメッセージからなる会話履歴
+    """
+    key = get_summary_key(channel_id, thread_ts)
+    state = load_summary(key)
+    last_ts = state["last_ts"] if state else None
+
+    remaining = [
+        msg
+        for msg in conversation_history
+        if not last_ts or ts_key(msg["ts"]) > ts_key(last_ts)
+    ]
+
+    unsummarized_tokens = sum(estimate_tokens(msg["text"]) for msg in remaining)
+    if (
+        unsummarized_tokens > THREAD_SUMMARY_TRIGGER_TOKENS
+        and len(remaining) > THREAD_SUMMARY_KEEP_RECENT
+    ):
+        to_summarize = remaining[:-THREAD_SUMMARY_KEEP_RECENT]
+        try:
+            state = refresh_summary(key, state, to_summarize)
+            remaining = remaining[-THREAD_SUMMARY_KEEP_RECENT:]
+        except Exception as e:
+            # 要約に失敗した場合は、前回の要約のまま処理を続ける
+            logger.warning(f"Error summarizing thread {key}: {e}")
+
+    if not state:
+        return remaining
+
+    summary_message = {
+        "summary": True,
+        "ts": state["last_ts"],
+        "text": SUMMARY_HEADER + state["summary"],
+        "assistant_count": int(state.get("assistant_count", 0)),
+    }
+    return [summary_message] + remaining
+
+
+def load_summary(key):
+    try:
+        item = get_state(key)
+    except Exception as e:
+        logger.warning(f"Error loading thread summary {key}: {e}")
+        return None
+    if not item or int(item.get("expires_at", 0)) < time.time():
+        return None
+    return item
+
+
+def refresh_summary(key, state, messages):
+    """
+    前回の要約と新たなメッセージから要約を作成し、保存する
+
+    Returns:
+        dict: 保存した要約のアイテム
+    """
+    start = time.perf_counter()
+    summary = summarize_messages(state["summary"] if state else None, messages)
+
+    previous_count = int(state.get("assistant_count", 0)) if state else 0
+    new_state = {
+        "summary": summary,
+        "last_ts": messages[-1]["ts"],
+        "assistant_count": previous_count
+        + sum(1 for msg in messages if msg.get("bot_id")),
+        "expires_at": int(time.time()) + THREAD_SUMMARY_TTL_SECONDS,
+    }
+    put_state(key, new_state)
+    logger.info(
+        f"Thread summary refreshed: key={key}, summarized_messages={len(messages)}, "
+        f"last_ts={new_state['last_ts']}, "
+        f"elapsed_ms={(time.perf_counter() - start) * 1000:.0f}"
+    )
+    return new_state
+
+
+def summarize_messages(previous_summary, messages):
+    """
+    前回の要約と会話をモデルに渡して要約を作成する
+    """
+    # 大きなメッセージ（添付ファイルなど）が他の会話を押し出さないよう、1件ずつ上限を設ける
+    per_message_cap = THREAD_SUMMARY_INPUT_TOKEN_CAP // len(messages)
+    transcript = "\n".join(
+        f"{'アシスタント' if msg.get('bot_id') else 'ユーザー'}: "
+        f"{truncate_to_tokens(msg['text'], per_message_cap)[0]}"
+        for msg in messages
+    )
+    prompt = ""
+    if previous_summary:
+        prompt += f"これまでの会話の要約:\n{previous_summary}\n\n"
+    prompt += (
+        f"続きの会話:\n{transcript}\n\n"
+        "上記の内容を1つの要約にまとめてください。要約のみを出力してください。"
+    )
+
+    return invoke_claude_model(
+        [{"role": "user", "content": prompt}],
+        system=SUMMARY_SYSTEM_PROMPT,
+        max_tokens=THREAD_SUMMARY_MAX_TOKENS,
+    )
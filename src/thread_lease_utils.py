@@ -0,0 +1,181 @@
+import logging
+import time
+from config import THREAD_LEASE_SECONDS
+from dynamodb_utils import get_table
+
+logger = logging.getLogger()
+
+# 条件付き更新が競合した場合の再試行回数
+MAX_LEASE_ATTEMPTS = 5
+
+
+def get_lease_key(channel_id, thread_ts):
+    return f"thread_lease#{channel_id}:{thread_ts}"
+
+
+def is_conditional_check_failed(error):
+    return error.response["Error"]["Code"] == "ConditionalCheckFailedException"
+
+
+def acquire_thread_lease(channel_id, thread_ts, event_id):
+    """
+    スレッドのリースを取得する
+
+    他のイベントがリースを保持している場合は、イベントIDを保留中のメンションとして
+    リースに追加する（保持しているイベントが応答後にまとめて処理する）。
+    リースのアイテムが大きくならないよう、メッセージはイベントの記録から読み込む
+
+    Args:
+        channel_id: Slackチャンネルid
+        thread_ts: スレッドts
+        event_id: イベントID
+
+    Returns:
+        bool: リースを取得できた場合はTrue、保留中のメンションとして追加した場合はFalse
+    """
+    from botocore.exceptions import ClientError
+
+    key = get_lease_key(channel_id, thread_ts)
+
+    for _ in range(MAX_LEASE_ATTEMPTS):
+        now = int(time.time())
+        try:
+            get_table().update_item(
+                Key={"event_id": key},
+                UpdateExpression=(
+                    "SET lease_owner = :owner, lease_expires_at = :lease, "
+                    "expires_at = :ttl REMOVE pending_mentions"
+                ),
+                ConditionExpression=(
+                    "attribute_not_exists(event_id) OR lease_expires_at < :now"
+                ),
+                ExpressionAttributeValues={
+                    ":owner": event_id,
+                    ":lease": now + THREAD_LEASE_SECONDS,
+                    ":ttl": now + THREAD_LEASE_SECONDS * 2,
+                    ":now": now,
+                },
+            )
+            logger.info(f"Thread lease acquired: key={key}, event_id={event_id}")
+            return True
+        except ClientError as e:
+            if not is_conditional_check_failed(e):
+                raise
+
+        try:
+            get_table().update_item(
+                Key={"event_id": key},
+                UpdateExpression=(
+                    "SET pending_mentions = "
+                    "list_append(if_not_exists(pending_mentions, :empty), :mention)"
+                ),
+                ConditionExpression=(
+                    "attribute_exists(event_id) AND lease_expires_at >= :now"
+                ),
+                ExpressionAttributeValues={
+                    ":empty": [],
+                    ":mention": [{"event_id": event_id}],
+                    ":now": now,
+                },
+            )
+            logger.info(
+                f"Mention queued on thread lease: key={key}, event_id={event_id}"
+            )
+            return False
+        except ClientError as e:
+            # リースが解放された直後の場合は、取得からやり直す
+            if not is_conditional_check_failed(e):
+                raise
+
+    raise RuntimeError(f"Could not acquire or join thread lease: {key}")
+
+
+def release_thread_lease(channel_id, thread_ts, event_id):
+    """
+    リースを解放する。保留中のメンションがある場合はリースを延長して取り出す
+
+    Args:
+        channel_id: Slackチャンネルid
+        thread_ts: スレッドts
+        event_id: リースを保持しているイベントID
+
+    Returns:
+        list: 保留中のメンション（{"event_id"} のリスト。ない場合は空）
+    """
+    from botocore.exceptions import ClientError
+
+    key = get_lease_key(channel_id, thread_ts)
+
+    for _ in range(MAX_LEASE_ATTEMPTS):
+        try:
+            get_table().delete_item(
+                Key={"event_id": key},
+                ConditionExpression=(
+                    "lease_owner = :owner AND "
+                    "(attribute_not_exists(pending_mentions) "
+                    "OR size(pending_mentions) = :zero)"
+                ),
+                ExpressionAttributeValues={":owner": event_id, ":zero": 0},
+            )
+            logger.info(f"Thread lease released: key={key}, event_id={event_id}")
+            return []
+        except ClientError as e:
+            if not is_conditional_check_failed(e):
+                raise
+
+        now = int(time.time())
+        try:
+            response = get_table().update_item(
+                Key={"event_id": key},
+                UpdateExpression=(
+                    "SET lease_expires_at = :lease, expires_at = :ttl "
+                    "REMOVE pending_mentions"
+                ),
+                ConditionExpression="lease_owner = :owner",
+                ExpressionAttributeValues={
+                    ":owner": event_id,
+                    ":lease": now + THREAD_LEASE_SECONDS,
+                    ":ttl": now + THREAD_LEASE_SECONDS * 2,
+                },
+                ReturnValues="UPDATED_OLD",
+            )
+        except ClientError as e:
+            # リースの期限が切れて他のイベントに取得された場合
+            if is_conditional_check_failed(e):
+                logger.warning(f"Thread lease lost: key={key}, event_id={event_id}")
+                return []
+            raise
+
+        pending = response.get("Attributes", {}).get("pending_mentions", [])
+        if pending:
+            logger.info(
+                f"Taking {len(pending)} pending mentions: key={key}, "
+                f"event_id={event_id}"
+            )
+            return pending
+
+    return []
+
+
+def abandon_thread_lease(channel_id, thread_ts, event_id):
+    """
+    エラー時にリースを削除し、保留中のメンションを返す
+
+    Returns:
+        list: 応答されずに残っていた保留中のメンション（{"event_id"} のリスト）
+    """
+    from botocore.exceptions import ClientError
+
+    key = get_lease_key(channel_id, thread_ts)
+    try:
+        response = get_table().delete_item(
+            Key={"event_id": key},
+            ConditionExpression="lease_owner = :owner",
+            ExpressionAttributeValues={":owner": event_id},
+            ReturnValues="ALL_OLD",
+        )
+    except ClientError as e:
+        if not is_conditional_check_failed(e):
+            logger.error(f"Error abandoning thread lease {key}: {e}")
+        return []
+    return response.get("Attributes", {}).get("pending_mentions", [])
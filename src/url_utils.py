@@ -1,41 +1,156 @@
-import requests
-from bs4 import BeautifulSoup
+import hashlib
 import re
 import logging
+import threading
+import time
+from concurrent.futures import Future
+from cache_utils import get_cached, set_cached
+from config import (
+    URL_CONTENT_FRESH_SECONDS,
+    URL_CONTENT_CACHE_TTL_SECONDS,
+    URL_MAX_BYTES,
+    URL_DOWNLOAD_CHUNK_BYTES,
+    URL_SUPPORTED_CONTENT_TYPES,
+    URL_SUMMARY_CACHE_TTL_SECONDS,
+)
+from html_extractors import extract_html_content
+from http_utils import http_get
+from log_utils import log_event, Payload
+from utils import normalize_url
 
 logger = logging.getLogger()
 
+# URLの内容のキャッシュの利用状況（コンテナ内の累計）
+# URLの展開は複数のスレッドで並行して行われるため、集計はロックで保護する
+_cache_stats = {"fresh": 0, "revalidated": 0, "miss": 0}
+_cache_stats_lock = threading.Lock()
+
+# 取得中のURL（正規化したURL → 結果を受け取るFuture）
+# スレッド履歴の展開と現在のメッセージのURL処理が同じページを並行して取得しないよう、
+# 取得中のURLは先に始めた取得の結果を待って共有する
+_inflight_fetches = {}
+_inflight_lock = threading.Lock()
+
+# 取得に失敗した場合などのタイトル（要約をキャッシュしない）
+UNCACHEABLE_TITLES = ("Error", "Unsupported content")
+
 
 def get_url_content(url):
+    """
+    URLのタイトルと本文を取得する
+
+    同じURLの取得が別のスレッドで進行中の場合は、新たに取得せずにその結果を返す
+
+    Returns:
+        tuple: (title, content)
+    """
+    key = normalize_url(url.strip("<>"))
+    with _inflight_lock:
+        future = _inflight_fetches.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight_fetches[key] = Future()
+    if not owner:
+        return future.result()
+
+    try:
+        result = fetch_url_content(url)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _inflight_lock:
+            del _inflight_fetches[key]
+
+
+def fetch_url_content(url):
+    # 重いライブラリはURL取得が必要になった時点で読み込む
+    import requests
+
     try:
         # URLから余分な文字（< >）を削除
         url = url.strip("<>")
+
+        # キャッシュが新しければサーバーに問い合わせずに返す
+        cache_key = normalize_url(url)
+        cached = get_cached("page", cache_key)
+        if cached and cached["fetched_at"] + URL_CONTENT_FRESH_SECONDS > time.time():
+            record_cache_result("fresh", cached)
+            return cached["title"], cached["content"]
+
         logger.info(f"Attempting to fetch content from URL: {url}")
+        start = time.perf_counter()
 
-        response = requests.get(url)
+        # キャッシュがあれば条件付きリクエストで再検証する
+        # 本文はストリーミングで受信し、必要な分だけ読み込む
+        headers = get_validator_headers(cached)
+        if headers:
+            response = http_get(url, headers=headers, stream=True)
+        else:
+            response = http_get(url, stream=True)
         logger.info(f"Response status code: {response.status_code}")
 
-        soup = BeautifulSoup(response.content, "html.parser")
+        try:
+            if cached and response.status_code == 304:
+                cached["fetched_at"] = int(time.time())
+                set_cached("page", cache_key, cached, URL_CONTENT_CACHE_TTL_SECONDS)
+                record_cache_result("revalidated", cached)
+                return cached["title"], cached["content"]
+
+            # 本文を読み込む前にContent-Typeを確認し、バイナリなどは読み込まない
+            mimetype = get_mimetype(response)
+            if mimetype and mimetype not in URL_SUPPORTED_CONTENT_TYPES:
+                logger.info(f"Unsupported content type: {mimetype}")
+                return "Unsupported content", (
+                    "【システムメッセージ】このURLの内容はテキストではないため"
+                    f"読み込みませんでした（Content-Type: {mimetype}）"
+                )
 
-        # メタデータの取得
-        title = soup.title.string if soup.title else "No title found"
-        logger.info(f"Title: {title}")
+            body, truncated = read_limited(response, URL_MAX_BYTES)
+        finally:
+            response.close()
 
-        # body タグ内の全てのテキストを取得
-        body = soup.body
-        if body:
-            # スクリプトとスタイルタグを除去
-            for script_or_style in body(["script", "style"]):
-                script_or_style.decompose()
-            content = body.get_text()
+        if mimetype in ("text/plain", "text/markdown"):
+            # charset指定がない場合、requestsはISO-8859-1とみなすためUTF-8を使う
+            encoding = get_charset(response) or "utf-8"
+            title = "No title found"
+            content = re.sub(r"\s+", " ", body.decode(encoding, errors="replace"))
+            content = content.strip()
         else:
-            content = "No body content found"
+            title, content = extract_content(body, get_charset(response))
 
-        # 不要な空白文字の削除
-        content = re.sub(r"\s+", " ", content).strip()
+        if truncated:
+            content += (
+                f"\n【システムメッセージ】ページが大きいため、"
+                f"先頭の{URL_MAX_BYTES // 1024}KBのみを読み込みました。"
+            )
 
-        logger.info(f"Content length: {len(content)} characters")
-        logger.info(f"Content preview: {content[:200]}...")
+        log_event(
+            logging.INFO,
+            "URL content",
+            url=url,
+            title=title,
+            content=Payload(content),
+        )
+
+        if response.status_code == 200:
+            set_cached(
+                "page",
+                cache_key,
+                {
+                    "title": title,
+                    "content": content,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "fetched_at": int(time.time()),
+                    "fetch_ms": int((time.perf_counter() - start) * 1000),
+                },
+                URL_CONTENT_CACHE_TTL_SECONDS,
+            )
+        record_cache_result("miss")
 
         return title, content
     except requests.RequestException as e:
@@ -46,3 +161,144 @@ def get_url_content(url):
         error_message = f"Unexpected error while fetching URL content: {str(e)}"
         logger.error(error_message)
         return "Error", error_message
+
+
+def extract_content(html, encoding=None):
+    """
+    HTMLからタイトルと本文のテキストを抽出する
+
+    Args:
+        html: HTMLのバイト列
+        encoding: Content-Typeヘッダーで指定された文字コード（なければNone）
+
+    Returns:
+        tuple: (title, content)
+    """
+    title, content = extract_html_content(html, encoding=encoding)
+    logger.info(f"Title: {title}")
+    return title, content
+
+
+def get_mimetype(response):
+    content_type = response.headers.get("Content-Type") or ""
+    return content_type.split(";")[0].strip().lower()
+
+
+def get_charset(response):
+    """
+    Content-Typeヘッダーのcharset指定を返す（指定がなければNone）
+    """
+    content_type = response.headers.get("Content-Type") or ""
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.partition("=")
+        if key.strip().lower() == "charset":
+            return value.strip().strip("\"'") or None
+    return None
+
+
+def read_limited(response, max_bytes):
+    """
+    レスポンスの本文を最大 max_bytes まで読み込む
+
+    Content-Lengthが上限を超える場合や、上限に達した場合はそこで読み込みを打ち切る
+
+    Returns:
+        tuple: (本文のバイト列, 打ち切ったかどうか)
+    """
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        logger.info(
+            f"Content-Length {content_length} exceeds limit {max_bytes}, "
+            "reading only the beginning"
+        )
+
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(chunk_size=URL_DOWNLOAD_CHUNK_BYTES):
+        remaining = max_bytes - size
+        if len(chunk) >= remaining:
+            chunks.append(chunk[:remaining])
+            # ちょうど上限で終わる場合も、続きは確認せずに打ち切りとして扱う
+            return b"".join(chunks), True
+        chunks.append(chunk)
+        size += len(chunk)
+    return b"".join(chunks), False
+
+
+def get_validator_headers(cached):
+    """
+    キャッシュしたETag/Last-Modifiedから条件付きリクエスト用のヘッダーを作成する
+    """
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    return headers
+
+
+def record_cache_result(result, cached=None):
+    """
+    キャッシュの利用結果を集計し、ヒット率と省略できた取得時間をログに出力する
+    """
+    with _cache_stats_lock:
+        _cache_stats[result] += 1
+        total = sum(_cache_stats.values())
+        hits = _cache_stats["fresh"] + _cache_stats["revalidated"]
+    message = (
+        f"URL content cache: result={result}, "
+        f"hit_rate={hits / total:.2f} ({hits}/{total})"
+    )
+    if cached and cached.get("fetch_ms") is not None:
+        message += f", saved_ms~{cached['fetch_ms']}"
+    logger.info(message)
+
+
+def get_cache_stats():
+    with _cache_stats_lock:
+        return dict(_cache_stats)
+
+
+def reset_cache_stats():
+    with _cache_stats_lock:
+        for key in _cache_stats:
+            _cache_stats[key] = 0
+
+
+def get_summary_cache_key(url, title, content):
+    """
+    ページの要約をキャッシュするキーを作成する
+
+    正規化したURLとページの内容のハッシュを組み合わせるため、内容が変わると別のキーになる
+
+    Returns:
+        str: キャッシュキー（取得に失敗したページの場合はNone）
+    """
+    if title in UNCACHEABLE_TITLES:
+        return None
+    digest = hashlib.sha256(f"{title}\n{content}".encode("utf-8")).hexdigest()
+    return f"{normalize_url(url.strip('<>'))}#{digest}"
+
+
+def get_url_summary(key, model_id):
+    """
+    保存済みのページの要約を取得する（チャンネル・スレッドをまたいで共有する）
+    """
+    cached = get_cached("url_summary", f"{key}#{model_id}", persist=True)
+    if not cached:
+        return None
+    logger.info(
+        f"URL summary cache hit: model={model_id}, created_at={cached['created_at']}"
+    )
+    return cached["summary"]
+
+
+def save_url_summary(key, model_id, summary):
+    set_cached(
+        "url_summary",
+        f"{key}#{model_id}",
+        {"summary": summary, "created_at": int(time.time())},
+        URL_SUMMARY_CACHE_TTL_SECONDS,
+        persist=True,
+    )
@@ -1,4 +1,6 @@
 import re
+from concurrent.futures import ThreadPoolExecutor
+from config import EXPANSION_MAX_WORKERS
 
 
 def create_error_message(error_type, details):
@@ -8,3 +10,47 @@ def create_error_message(error_type, details):
 def extract_url(message):
     url_match = re.search(r"<(https?://[^|>]+)(?:\|[^>]+)?>", message)
     return url_match.group(1) if url_match else None
+
+
+def normalize_url(url):
+    """
+    キャッシュキーとして使うためにURLを正規化する
+
+    スキームとホストの小文字化、既定ポート・フラグメント・utm_*パラメータの除去を行う
+    """
+    from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+    parts = urlsplit(url.strip("<>"))
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, parts.port) in (("http", 80), ("https", 443)):
+        netloc = netloc.rsplit(":", 1)[0]
+    query = urlencode(
+        [
+            (k, v)
+            for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if not k.startswith("utm_")
+        ]
+    )
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+def run_concurrently(tasks, max_workers=EXPANSION_MAX_WORKERS):
+    """
+    引数なしで呼び出せる処理をスレッドプールで並行実行する
+
+    Args:
+        tasks: 実行する処理（callable）のリスト
+        max_workers: 同時に実行する最大数
+
+    Returns:
+        list: tasks と同じ順序の実行結果（例外は呼び出し元に送出する）
+    """
+    if len(tasks) <= 1 or max_workers <= 1:
+        return [task() for task in tasks]
+
+    # 呼び出し元自身がプール内で動いている場合のデッドロックを避けるため、
+    # プールは呼び出しごとに作成する
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
+        futures = [executor.submit(task) for task in tasks]
+        return [future.result() for future in futures]
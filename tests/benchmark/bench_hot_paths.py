@@ -0,0 +1,390 @@
+"""
+応答のたびに実行される純粋な処理（ネットワークを使わないもの）のベンチマーク
+
+日本語・英語の合成データで入力の大きさを変えながら処理時間を計測し、
+大きさに対する伸び方（スケーリング指数）を求める。保存済みのベースラインと比較して、
+処理時間または伸び方が悪化したケースを報告する
+
+- split_message: 1KB〜1,000KBの応答（コードブロック・箇条書きを含む）
+- format_conversation_for_claude: 10〜5,000件のメッセージからなるスレッド
+- strip_thinking_tags: <thinking>タグを含む1KB〜100KBの応答
+- extract_url: URLを含む・含まないメッセージ
+- normalize_whitespace: URLの本文抽出で使う空白の正規化
+
+使い方:
+    python tests/benchmark/bench_hot_paths.py [--quick] [--json 出力先]
+    python tests/benchmark/bench_hot_paths.py --check            # ベースラインと比較
+    python tests/benchmark/bench_hot_paths.py --update-baseline  # ベースラインを更新
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.abspath(os.path.join(BENCH_DIR, "..", "..", "src"))
+BASELINE_PATH = os.path.join(BENCH_DIR, "baselines", "hot_paths.json")
+
+# ベースラインに対して処理時間がこの倍率を超えた場合に悪化とみなす
+DEFAULT_TIME_THRESHOLD = 2.0
+# スケーリング指数がこの値を超えて大きくなった場合に悪化とみなす（線形→二乗の検出）
+DEFAULT_EXPONENT_THRESHOLD = 0.3
+# これより短い処理時間はばらつきが大きいため、処理時間の比較から除く（ミリ秒）
+MIN_COMPARABLE_MS = 0.05
+
+RESPONSE_KB = [1, 10, 100]
+THREAD_MESSAGES = [10, 100, 1000, 5000]
+QUICK_RESPONSE_KB = [1, 10]
+# 応答の分割は100KBを超える長い出力でも線形に伸びることを確認する
+# 1KBの応答は SLACK_MESSAGE_LIMIT より短く分割せずに返るため、指数が大きく出ないよう除く
+SPLIT_RESPONSE_KB = [10, 100, 1000]
+QUICK_SPLIT_RESPONSE_KB = [10, 100]
+QUICK_THREAD_MESSAGES = [10, 100, 1000]
+
+JA_SENTENCES = [
+    "本日の会議では、来期の予算配分について議論しました。",
+    "このエラーは設定ファイルの読み込み順序が原因と考えられます。",
+    "ご指摘の点について、改めて確認したうえでご連絡いたします。",
+    "まずは小さな範囲で試験的に導入し、効果を測定しましょう。",
+    "ログを確認したところ、タイムアウトが断続的に発生していました。",
+]
+EN_SENTENCES = [
+    "The deployment finished without errors, but latency increased slightly.",
+    "Could you check whether the cache is invalidated after the update?",
+    "We should split the migration into smaller, reversible steps.",
+    "The benchmark shows a clear improvement for large documents.",
+    "Please review the attached design before the meeting tomorrow.",
+]
+
+
+def generate_text(language, chars, rng):
+    """
+    段落・箇条書き・コードブロックを含む、おおよそ chars 文字の応答を作る
+    """
+    sentences = JA_SENTENCES if language == "ja" else EN_SENTENCES
+    separator = "" if language == "ja" else " "
+    blocks = []
+    size = 0
+    while size < chars:
+        kind = rng.random()
+        if kind < 0.6:
+            block = separator.join(rng.choice(sentences) for _ in range(4))
+        elif kind < 0.85:
+            block = "\n".join(f"- {rng.choice(sentences)}" for _ in range(3))
+        else:
+            block = "```python\nfor i in range(10):\n    print(i)\n```"
+        blocks.append(block)
+        size += len(block) + 2
+    return "\n\n".join(blocks)[:chars]
+
+
+def generate_thread(language, count, rng):
+    """
+    ユーザーとボットが交互に発言するスレッドの会話履歴を作る
+    """
+    history = []
+    for i in range(count):
+        message = {"ts": f"1700000000.{i:06d}"}
+        if i % 2:
+            message["bot_id"] = "BBENCH"
+            message["text"] = generate_text(language, rng.randint(200, 800), rng)
+        else:
+            message["text"] = "<@UBENCH> " + generate_text(
+                language, rng.randint(20, 200), rng
+            )
+        history.append(message)
+    return history
+
+
+def with_thinking(text):
+    return f"<thinking>{text[: len(text) // 4]}</thinking>{text}"
+
+
+def with_url(text):
+    middle = len(text) // 2
+    return f"{text[:middle]} <https://example.com/path?q=1|example> {text[middle:]}"
+
+
+def build_cases(modules, quick):
+    """
+    計測するケースを (関数名, 言語, 大きさ, 大きさの単位, 呼び出し) の形で作る
+    """
+    bedrock_utils, slack_utils, utils, html_extractors = modules
+    response_kb = QUICK_RESPONSE_KB if quick else RESPONSE_KB
+    thread_messages = QUICK_THREAD_MESSAGES if quick else THREAD_MESSAGES
+    cases = []
+    for language in ("ja", "en"):
+        rng = random.Random(f"{language}-bench")
+        for kb in response_kb:
+            text = generate_text(language, kb * 1024, rng)
+            thinking = with_thinking(text)
+            url_text = with_url(text)
+            spaced = text.replace(" ", " \t \n ")
+            cases += [
+                (
+                    "strip_thinking_tags",
+                    language,
+                    kb,
+                    "KB",
+                    _call(bedrock_utils.strip_thinking_tags, thinking),
+                ),
+                ("extract_url", language, kb, "KB", _call(utils.extract_url, url_text)),
+                (
+                    "extract_url_miss",
+                    language,
+                    kb,
+                    "KB",
+                    _call(utils.extract_url, text),
+                ),
+                (
+                    "normalize_whitespace",
+                    language,
+                    kb,
+                    "KB",
+                    _call(html_extractors.normalize_whitespace, spaced),
+                ),
+            ]
+        for kb in QUICK_SPLIT_RESPONSE_KB if quick else SPLIT_RESPONSE_KB:
+            text = generate_text(language, kb * 1024, rng)
+            cases.append(
+                (
+                    "split_message",
+                    language,
+                    kb,
+                    "KB",
+                    _call(slack_utils.split_message, text),
+                )
+            )
+        for count in thread_messages:
+            history = generate_thread(language, count, rng)
+            cases.append(
+                (
+                    "format_conversation_for_claude",
+                    language,
+                    count,
+                    "messages",
+                    _call(
+                        bedrock_utils.format_conversation_for_claude,
+                        history,
+                        "最新の質問です",
+                    ),
+                )
+            )
+    return cases
+
+
+def _call(function, *args):
+    return lambda: function(*args)
+
+
+def measure(call, repeat):
+    """
+    1回あたりの処理時間（ミリ秒）の中央値を求める
+
+    短い処理は合計0.2秒程度になる回数をまとめて実行し、1回あたりに換算する
+    """
+    timer = timeit.Timer(call)
+    number, _ = timer.autorange()
+    samples = timer.repeat(repeat=repeat, number=number)
+    return statistics.median(samples) / number * 1000
+
+
+def scaling_exponents(results):
+    """
+    関数・言語ごとに、最小と最大の入力での処理時間から伸び方の指数を求める
+
+    1.0 なら入力の大きさに比例、2.0 なら二乗で増えることを表す。
+    最大の入力でも処理時間が短い（ばらつきが大きい）場合は求めない
+    """
+    groups = {}
+    for r in results:
+        groups.setdefault((r["function"], r["language"]), []).append(r)
+    exponents = {}
+    for (function, language), rows in groups.items():
+        rows = sorted(rows, key=lambda r: r["size"])
+        if len(rows) < 2:
+            continue
+        first, last = rows[0], rows[-1]
+        if last["ms"] < MIN_COMPARABLE_MS or first["ms"] <= 0:
+            continue
+        exponents[f"{function}/{language}"] = math.log(
+            last["ms"] / first["ms"]
+        ) / math.log(last["size"] / first["size"])
+    return exponents
+
+
+def run(repeat, quick):
+    os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-benchmark")
+    os.environ.setdefault("DYNAMODB_TABLE_NAME", "benchmark-table")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+    # ボットのユーザーIDを指定し、Slack APIを呼び出さないようにする
+    os.environ.setdefault("SLACK_BOT_USER_ID", "UBENCH")
+    sys.path.insert(0, SRC_DIR)
+    import bedrock_utils
+    import html_extractors
+    import slack_utils
+    import utils
+
+    results = []
+    for function, language, size, unit, call in build_cases(
+        (bedrock_utils, slack_utils, utils, html_extractors), quick
+    ):
+        results.append(
+            {
+                "function": function,
+                "language": language,
+                "size": size,
+                "unit": unit,
+                "ms": measure(call, repeat),
+            }
+        )
+    return {
+        # 処理時間は実行環境に依存するため、比較の参考として記録する
+        "environment": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "system": platform.system(),
+        },
+        "results": results,
+        "exponents": scaling_exponents(results),
+    }
+
+
+def compare(report, baseline, time_threshold, exponent_threshold):
+    """
+    ベースラインと比較し、悪化したケースの説明のリストを返す
+
+    スケーリング指数は、今回計測した大きさと同じ範囲のベースラインから求め直して比較する
+    （--quick で大きな入力を省略した場合も比較できるようにする）
+    """
+    regressions = []
+    comparable = comparable_results(report, baseline)
+    baseline_ms = {
+        (r["function"], r["language"], r["size"]): r["ms"] for r in comparable
+    }
+    for r in report["results"]:
+        previous = baseline_ms.get((r["function"], r["language"], r["size"]))
+        if (
+            previous
+            and max(previous, r["ms"]) >= MIN_COMPARABLE_MS
+            and r["ms"] > previous * time_threshold
+        ):
+            regressions.append(
+                f"{r['function']}/{r['language']} {r['size']}{r['unit']}: "
+                f"{previous:.4f}ms -> {r['ms']:.4f}ms ({r['ms'] / previous:.2f}x)"
+            )
+    baseline_exponents = scaling_exponents(comparable)
+    for name, exponent in report["exponents"].items():
+        previous = baseline_exponents.get(name)
+        if previous is not None and exponent > previous + exponent_threshold:
+            regressions.append(
+                f"{name}: scaling exponent {previous:.2f} -> {exponent:.2f}"
+            )
+    return regressions
+
+
+def comparable_results(report, baseline):
+    """
+    ベースラインの結果のうち、今回計測したケースと同じものを返す
+    """
+    measured = {(r["function"], r["language"], r["size"]) for r in report["results"]}
+    return [
+        r
+        for r in baseline["results"]
+        if (r["function"], r["language"], r["size"]) in measured
+    ]
+
+
+def print_report(report, baseline=None):
+    comparable = comparable_results(report, baseline) if baseline else []
+    baseline_ms = {
+        (r["function"], r["language"], r["size"]): r["ms"] for r in comparable
+    }
+    baseline_exponents = scaling_exponents(comparable)
+    print(f"{'function':<32}{'lang':<6}{'size':>14}{'ms':>12}{'baseline':>12}")
+    for r in report["results"]:
+        previous = baseline_ms.get((r["function"], r["language"], r["size"]))
+        print(
+            f"{r['function']:<32}{r['language']:<6}"
+            f"{str(r['size']) + ' ' + r['unit']:>14}{r['ms']:>12.4f}"
+            f"{'-' if previous is None else f'{previous:.4f}':>12}"
+        )
+    print()
+    print(f"{'scaling exponent':<38}{'current':>10}{'baseline':>10}")
+    for name, exponent in report["exponents"].items():
+        previous = baseline_exponents.get(name)
+        print(
+            f"{name:<38}{exponent:>10.2f}"
+            f"{'-' if previous is None else f'{previous:.2f}':>10}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="計測回数（中央値を採用）"
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="大きな入力を省略して短時間で計測する"
+    )
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="ベースラインのパス")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="ベースラインより悪化したケースがあれば終了コード1で終了する",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="結果をベースラインとして保存する",
+    )
+    parser.add_argument("--time-threshold", type=float, default=DEFAULT_TIME_THRESHOLD)
+    parser.add_argument(
+        "--exponent-threshold", type=float, default=DEFAULT_EXPONENT_THRESHOLD
+    )
+    args = parser.parse_args()
+
+    report = run(args.repeat, args.quick)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"\nBaseline updated: {args.baseline}")
+        return
+
+    if baseline:
+        regressions = compare(
+            report, baseline, args.time_threshold, args.exponent_threshold
+        )
+        print()
+        if regressions:
+            print("Regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+        else:
+            print("No regressions against baseline")
+        if args.check and regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
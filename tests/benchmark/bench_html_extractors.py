@@ -0,0 +1,134 @@
+"""
+HTML本文抽出エンジンのスループットを比較するベンチマーク
+
+tests/benchmark/fixtures/html 以下の保存済みHTMLを、エンジンごとに抽出して
+1文書あたりの処理時間、スループット（MB/s）、抽出後の文字数を計測する。
+大きなページでの挙動を見るため、body内を複製して拡大した文書も計測する
+
+使い方:
+    python tests/benchmark/bench_html_extractors.py [--repeat N] [--scale 1 20] [--json 出力先]
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(BENCH_DIR, "fixtures", "html")
+SRC_DIR = os.path.abspath(os.path.join(BENCH_DIR, "..", "..", "src"))
+
+BODY_PATTERN = re.compile(rb"(<body[^>]*>)(.*)(</body>)", re.S | re.I)
+
+
+def load_fixtures():
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.html"))):
+        with open(path, "rb") as f:
+            fixtures[os.path.splitext(os.path.basename(path))[0]] = f.read()
+    return fixtures
+
+
+def scale_document(html, factor):
+    """
+    body内の要素を factor 回繰り返した文書を作る
+    """
+    if factor == 1:
+        return html
+    return BODY_PATTERN.sub(
+        lambda m: m.group(1) + m.group(2) * factor + m.group(3), html, count=1
+    )
+
+
+def available_backends(extractors):
+    backends = []
+    for name in ("bs4", "stream", "lxml"):
+        try:
+            extractors.EXTRACTORS[name]("<html><body>probe</body></html>")
+        except ImportError:
+            continue
+        backends.append(name)
+    return backends
+
+
+def measure(extract, html, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _, content = extract(html)
+        samples.append((time.perf_counter() - start) * 1000)
+    ms = statistics.median(samples)
+    return {
+        "ms": ms,
+        "mb_per_s": (len(html) / 1024 / 1024) / (ms / 1000) if ms else None,
+        "output_chars": len(content),
+    }
+
+
+def run(repeat, scales):
+    os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-benchmark")
+    os.environ.setdefault("DYNAMODB_TABLE_NAME", "benchmark-table")
+    sys.path.insert(0, SRC_DIR)
+    import html_extractors
+
+    backends = available_backends(html_extractors)
+    results = []
+    for name, html in load_fixtures().items():
+        for factor in scales:
+            document = scale_document(html, factor)
+            for backend in backends:
+                result = measure(html_extractors.EXTRACTORS[backend], document, repeat)
+                results.append(
+                    {
+                        "fixture": name,
+                        "scale": factor,
+                        "bytes": len(document),
+                        "backend": backend,
+                        **result,
+                    }
+                )
+    return results
+
+
+def print_report(results):
+    print(
+        f"{'fixture':<16}{'scale':>6}{'KB':>9}  {'backend':<8}"
+        f"{'ms':>9}{'MB/s':>9}{'chars':>9}"
+    )
+    for r in results:
+        print(
+            f"{r['fixture']:<16}{r['scale']:>6}{r['bytes'] / 1024:>9.1f}  "
+            f"{r['backend']:<8}{r['ms']:>9.2f}{r['mb_per_s']:>9.1f}"
+            f"{r['output_chars']:>9}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="計測回数（中央値を採用）"
+    )
+    parser.add_argument(
+        "--scale",
+        type=int,
+        nargs="+",
+        default=[1, 50],
+        help="body内の要素を複製する倍率",
+    )
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.scale)
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
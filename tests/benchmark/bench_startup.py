@@ -0,0 +1,110 @@
+"""
+コールドスタートのコストを計測するベンチマーク
+
+モジュールごとに新しいPythonプロセスを起動し、import時間と、ネットワークを
+使わない代表的な処理の初回呼び出し時間を計測する
+
+使い方:
+    python tests/benchmark/bench_startup.py [--repeat N] [--json 出力先]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+# 初回呼び出しで計測する処理（ネットワーク呼び出しを伴わないもの）
+FIRST_INVOKE = {
+    "config": None,
+    "utils": "module.extract_url('<https://example.com>')",
+    "url_utils": None,
+    "queue_utils": "module.build_worker_event({'event_id': 'Ev1'})",
+    "admission_utils": "module.admit_retry({'headers': {}, 'body': '{}'})",
+    "dynamodb_utils": "module.get_table()",
+    "bedrock_utils": "module.get_bedrock_runtime()",
+    "slack_utils": "module.split_message('a' * 10000)",
+    "lambda_function": (
+        "module.lambda_handler(" "{'body': json.dumps({'challenge': 'token'})}, None)"
+    ),
+}
+
+HEAVY_MODULES = ["boto3", "botocore", "slack_sdk", "bs4", "requests"]
+
+PROBE = """
+import importlib, json, sys, time
+start = time.perf_counter()
+module = importlib.import_module({module!r})
+import_ms = (time.perf_counter() - start) * 1000
+invoke_ms = None
+if {invoke!r}:
+    start = time.perf_counter()
+    eval({invoke!r})
+    invoke_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{
+    "import_ms": import_ms,
+    "first_invoke_ms": invoke_ms,
+    "heavy_modules": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure(module, invoke):
+    env = dict(os.environ)
+    env.setdefault("SLACK_BOT_TOKEN", "xoxb-benchmark")
+    env.setdefault("DYNAMODB_TABLE_NAME", "benchmark-table")
+    env.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+    env["PYTHONPATH"] = SRC_DIR
+    code = PROBE.format(module=module, invoke=invoke, heavy=HEAVY_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{module}: {result.stderr.strip()}")
+    return json.loads(result.stdout)
+
+
+def run(repeat):
+    results = {}
+    for module, invoke in FIRST_INVOKE.items():
+        samples = [measure(module, invoke) for _ in range(repeat)]
+        invoke_samples = [s["first_invoke_ms"] for s in samples]
+        results[module] = {
+            "import_ms": statistics.median(s["import_ms"] for s in samples),
+            "first_invoke_ms": (
+                statistics.median(invoke_samples) if invoke is not None else None
+            ),
+            "heavy_modules": samples[-1]["heavy_modules"],
+        }
+    return results
+
+
+def print_report(results):
+    print(f"{'module':<18}{'import (ms)':>14}{'first invoke (ms)':>20}  heavy modules")
+    for module, r in results.items():
+        invoke = "-" if r["first_invoke_ms"] is None else f"{r['first_invoke_ms']:.1f}"
+        heavy = ",".join(r["heavy_modules"]) or "-"
+        print(f"{module:<18}{r['import_ms']:>14.1f}{invoke:>20}  {heavy}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="計測回数（中央値を採用）"
+    )
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -47,3 +47,24 @@ def aws_credentials():
     os.environ["AWS_SECURITY_TOKEN"] = "testing"
     os.environ["AWS_SESSION_TOKEN"] = "testing"
     os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+
+
+# ウォームコンテナ内のキャッシュをテストごとにリセット
+@pytest.fixture(autouse=True)
+def reset_warm_container_state():
+    """テスト間でコンテナ内の状態が共有されないようにする"""
+    from admission_utils import clear_recent_events
+    from cache_utils import clear_memory_cache
+    from endpoint_utils import reset_endpoint_health
+    from log_utils import reset_log_sampling
+    from metrics_utils import begin_metrics
+    from slack_utils import clear_bot_user_id_cache
+    from url_utils import reset_cache_stats
+
+    clear_recent_events()
+    clear_memory_cache()
+    reset_endpoint_health()
+    reset_log_sampling()
+    begin_metrics()
+    clear_bot_user_id_cache()
+    reset_cache_stats()
@@ -0,0 +1,494 @@
+"""
+lambda_handler をローカルで並行に呼び出す負荷試験のドライバー
+
+Slack Web API・Bedrock Runtimeのスタンドイン（tests/load/standins.py）と、motoの
+DynamoDBサーバーを起動し、合成したapp_mentionイベントを指定した並行数で送信する。
+Slackと同様に、一部のイベントは再送ヘッダー付きで再送・同時に重複して送信する。
+
+終了後に、スループット、エンドツーエンドのレイテンシ（p50/p95/p99）、レスポンスの内訳、
+重複・再送の扱い（重複した応答、応答のないイベント）、スタンドインへの呼び出し数を報告する。
+
+すべての呼び出しは1つのプロセス内で行うため、ウォームコンテナ1つを共有する状態に相当する
+（コンテナ内のキャッシュや受け付け済みイベントの記録はすべての呼び出しで共有される）。
+
+使い方:
+    python tests/load/run_load_test.py --events 200 --concurrency 20
+    python tests/load/run_load_test.py --bedrock-throttle-rate 0.1 \\
+        --env BEDROCK_ADMISSION_ENABLED=true --env THREAD_LEASE_ENABLED=true
+    python tests/load/run_load_test.py --async --streaming --json result.json
+
+必要なパッケージ: requirements.txt と moto[server]（requirements-dev.txt）
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+LOAD_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.abspath(os.path.join(LOAD_DIR, "..", "..", "src"))
+sys.path.insert(0, LOAD_DIR)
+
+from standins import (  # noqa: E402
+    BedrockHandler,
+    BedrockState,
+    Faults,
+    SlackHandler,
+    SlackState,
+    StandInServer,
+    start_dynamodb,
+)
+
+TABLE_NAME = "load-test-events"
+CHANNELS = ["CLOAD01", "CLOAD02", "CLOAD03"]
+MESSAGES = [
+    "このエラーの原因を教えてください",
+    "来週の会議の議題を整理して",
+    "Summarize the discussion so far, please.",
+    "この設計で問題になりそうな点はありますか？",
+    "Can you suggest a better name for this function?",
+]
+
+
+class Recorder:
+    """
+    イベントごとの送信時刻と処理の完了時刻、レスポンスの内訳を記録する
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.first_sent = {}
+        self.completed = {}
+        self.responses = {}
+        self.delivery_ms = []
+
+    def sent(self, event_id):
+        with self.lock:
+            self.first_sent.setdefault(event_id, time.perf_counter())
+
+    def complete(self, event_id):
+        with self.lock:
+            self.completed.setdefault(event_id, time.perf_counter())
+
+    def response(self, kind, elapsed_ms):
+        with self.lock:
+            self.responses[kind] = self.responses.get(kind, 0) + 1
+            self.delivery_ms.append(elapsed_ms)
+
+    def latencies_ms(self):
+        with self.lock:
+            return [
+                (self.completed[event_id] - start) * 1000
+                for event_id, start in self.first_sent.items()
+                if event_id in self.completed
+            ]
+
+
+class WorkerQueue:
+    """
+    非同期モードで、ワーカーへのタスクをスレッドプールで実行するキュー
+    """
+
+    def __init__(self, executor, handler, recorder):
+        self.executor = executor
+        self.handler = handler
+        self.recorder = recorder
+        self.futures = []
+
+    def put(self, task, context=None):
+        from queue_utils import build_worker_event
+
+        def run():
+            response = self.handler(build_worker_event(task), None)
+            if response.get("statusCode") == 200:
+                self.recorder.complete(task["event_id"])
+
+        self.futures.append(self.executor.submit(run))
+
+
+def build_deliveries(args):
+    """
+    送信するイベントを作る
+
+    最初の args.threads 件はそれぞれ新しいスレッドを始め、以降はいずれかのスレッドへの
+    返信として送信する。本文には応答との対応を取るための印（[EvNNNNNN]）を含める
+
+    Returns:
+        list: event_id、チャンネル、スレッドの番号、本文、送信時刻（開始からの秒数）のリスト
+    """
+    rng = random.Random(args.seed)
+    thread_channels = []
+    deliveries = []
+    for i in range(args.events):
+        event_id = f"Ev{i:06d}"
+        if len(thread_channels) < args.threads:
+            thread_index = len(thread_channels)
+            thread_channels.append(rng.choice(CHANNELS))
+        else:
+            thread_index = rng.randrange(len(thread_channels))
+
+        deliveries.append(
+            {
+                "event_id": event_id,
+                "channel": thread_channels[thread_index],
+                "thread_index": thread_index,
+                "text": f"<@UBOT> [{event_id}] {rng.choice(MESSAGES)}",
+                "at": i / args.rate if args.rate else 0.0,
+            }
+        )
+    return deliveries
+
+
+def make_lambda_event(event_id, slack_event, retry_num=None):
+    headers = {"Content-Type": "application/json"}
+    if retry_num:
+        headers["X-Slack-Retry-Num"] = str(retry_num)
+        headers["X-Slack-Retry-Reason"] = "http_timeout"
+    return {
+        "headers": headers,
+        "body": json.dumps(
+            {
+                "type": "event_callback",
+                "event_id": event_id,
+                "event": slack_event,
+            }
+        ),
+    }
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run(args):
+    # motoサーバーのアクセスログは結果の表示の妨げになるため出力しない
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    # スタンドインの起動
+    slack = SlackState(
+        Faults(
+            args.slack_latency_ms,
+            args.slack_jitter_ms,
+            args.slack_error_rate,
+            args.slack_throttle_rate,
+            seed=args.seed,
+        )
+    )
+    bedrock = BedrockState(
+        Faults(
+            args.bedrock_latency_ms,
+            args.bedrock_jitter_ms,
+            args.bedrock_error_rate,
+            args.bedrock_throttle_rate,
+            seed=args.seed,
+        ),
+        response_chars=args.response_chars,
+        stream_chunks=args.stream_chunks,
+    )
+    # 実際のAWSへ接続しないよう、スタンドインの起動前に認証情報を差し替える
+    os.environ.update(
+        {
+            "AWS_DEFAULT_REGION": "ap-northeast-1",
+            "AWS_ACCESS_KEY_ID": "testing",
+            "AWS_SECRET_ACCESS_KEY": "testing",
+        }
+    )
+    os.environ.pop("AWS_PROFILE", None)
+    os.environ.pop("AWS_SESSION_TOKEN", None)
+    slack_server = StandInServer(SlackHandler, slack).start()
+    bedrock_server = StandInServer(BedrockHandler, bedrock).start()
+    dynamodb_server, dynamodb_url = start_dynamodb(TABLE_NAME)
+
+    # lambda_function の読み込み前に接続先と機能の設定を行う
+    os.environ.update(
+        {
+            "SLACK_BOT_TOKEN": "xoxb-load-test",
+            "SLACK_BOT_USER_ID": "UBOT",
+            "DYNAMODB_TABLE_NAME": TABLE_NAME,
+            "SLACK_API_BASE_URL": f"{slack_server.url}/api/",
+            "BEDROCK_ENDPOINT_URL": bedrock_server.url,
+            "DYNAMODB_ENDPOINT_URL": dynamodb_url,
+            "BEDROCK_ENDPOINTS": "ap-northeast-1:global",
+            "ASYNC_PROCESSING_ENABLED": "true" if args.async_mode else "false",
+            "STREAMING_RESPONSE_ENABLED": "true" if args.streaming else "false",
+            "LOG_LEVEL": args.log_level,
+        }
+    )
+    for item in args.env:
+        key, _, value = item.partition("=")
+        os.environ[key] = value
+    sys.path.insert(0, SRC_DIR)
+    logging.basicConfig(level=args.log_level)
+    import lambda_function
+    import queue_utils
+
+    recorder = Recorder()
+    rng = random.Random(args.seed + 1)
+    thread_ts = {}
+    thread_lock = threading.Lock()
+
+    executor = ThreadPoolExecutor(max_workers=args.concurrency)
+    worker_executor = ThreadPoolExecutor(max_workers=args.concurrency)
+    worker_queue = WorkerQueue(
+        worker_executor, lambda_function.lambda_handler, recorder
+    )
+    if args.async_mode:
+        queue_utils.set_task_queue(worker_queue)
+
+    def deliver(event_id, lambda_event, first):
+        if first:
+            recorder.sent(event_id)
+        start = time.perf_counter()
+        response = lambda_function.lambda_handler(lambda_event, None)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        body = json.loads(response.get("body") or "{}")
+        kind = (
+            f"{response.get('statusCode')} {body.get('message') or body.get('error')}"
+        )
+        recorder.response(kind, elapsed_ms)
+        if not args.async_mode and body.get("message") == "OK":
+            recorder.complete(event_id)
+
+    def post_and_deliver(delivery):
+        # ユーザーのメッセージをスレッドに追加してからメンションを送信する
+        channel = delivery["channel"]
+        index = delivery["thread_index"]
+        ts = slack.next_ts()
+        with thread_lock:
+            parent_ts = thread_ts.setdefault(index, ts)
+        slack_event = {
+            "type": "app_mention",
+            "user": "ULOAD",
+            "channel": channel,
+            "text": delivery["text"],
+            "ts": ts,
+            "event_ts": ts,
+        }
+        if parent_ts != ts:
+            slack_event["thread_ts"] = parent_ts
+        slack.add_message(
+            channel,
+            parent_ts,
+            {"type": "message", "user": "ULOAD", "text": delivery["text"], "ts": ts},
+        )
+
+        event_id = delivery["event_id"]
+        futures = [
+            executor.submit(
+                deliver, event_id, make_lambda_event(event_id, slack_event), True
+            )
+        ]
+        draw = rng.random()
+        if draw < args.duplicate_rate:
+            # 同じイベントが同時に届く場合（再送ヘッダーなし）
+            futures.append(
+                executor.submit(
+                    deliver, event_id, make_lambda_event(event_id, slack_event), False
+                )
+            )
+        elif draw < args.duplicate_rate + args.retry_rate:
+            # Slackの再送（応答が遅いと判断された場合の再送を模す）
+            def retry():
+                time.sleep(args.retry_delay_ms / 1000)
+                deliver(event_id, make_lambda_event(event_id, slack_event, 1), False)
+
+            futures.append(executor.submit(retry))
+        return futures
+
+    deliveries = build_deliveries(args)
+    started = time.perf_counter()
+    futures = []
+    for delivery in deliveries:
+        delay = delivery["at"] - (time.perf_counter() - started)
+        if delay > 0:
+            time.sleep(delay)
+        futures.extend(post_and_deliver(delivery))
+    wait(futures)
+    while True:
+        # 非同期モードでは、ワーカーの処理がすべて終わるまで待つ
+        pending = [f for f in worker_queue.futures if not f.done()]
+        if not pending:
+            break
+        wait(pending)
+    elapsed = time.perf_counter() - started
+
+    executor.shutdown()
+    worker_executor.shutdown()
+    report = build_report(args, recorder, slack, bedrock, elapsed, dynamodb_url)
+
+    slack_server.stop()
+    bedrock_server.stop()
+    dynamodb_server.stop()
+    return report
+
+
+def build_report(args, recorder, slack, bedrock, elapsed, dynamodb_url):
+    import boto3
+
+    latencies = recorder.latencies_ms()
+    replies = slack.replies_by_event()
+    table = boto3.resource("dynamodb", endpoint_url=dynamodb_url).Table(TABLE_NAME)
+    items = []
+    scan = {}
+    while True:
+        page = table.scan(**scan)
+        items += page["Items"]
+        if "LastEvaluatedKey" not in page:
+            break
+        scan = {"ExclusiveStartKey": page["LastEvaluatedKey"]}
+    statuses = {}
+    for item in items:
+        if item["event_id"].startswith("Ev"):
+            statuses[item.get("status")] = statuses.get(item.get("status"), 0) + 1
+
+    return {
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("json",)
+        },
+        "elapsed_s": round(elapsed, 3),
+        "throughput_events_per_s": round(args.events / elapsed, 2),
+        "end_to_end_ms": {
+            "count": len(latencies),
+            "p50": _round(percentile(latencies, 50)),
+            "p95": _round(percentile(latencies, 95)),
+            "p99": _round(percentile(latencies, 99)),
+            "max": _round(max(latencies) if latencies else None),
+            "mean": _round(statistics.mean(latencies) if latencies else None),
+        },
+        "handler_response_ms": {
+            "p50": _round(percentile(recorder.delivery_ms, 50)),
+            "p99": _round(percentile(recorder.delivery_ms, 99)),
+        },
+        "responses": dict(sorted(recorder.responses.items())),
+        "events": {
+            "sent": args.events,
+            "completed": len(recorder.completed),
+            "dynamodb_status": statuses,
+            # 応答の先頭に付いた印から、同じイベントに2回以上応答したものを数える
+            "answered": len(replies),
+            "duplicate_replies": sum(1 for count in replies.values() if count > 1),
+            # スレッドのリースで他のメンションとまとめて応答したものも含む
+            "without_own_reply": args.events - len(replies),
+        },
+        "slack_calls": dict(slack.calls),
+        "slack_injected": dict(slack.injected),
+        "bedrock_calls": dict(bedrock.calls),
+        "bedrock_injected": dict(bedrock.injected),
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 1)
+
+
+def print_report(report):
+    e2e = report["end_to_end_ms"]
+    events = report["events"]
+    print(
+        f"elapsed: {report['elapsed_s']}s, "
+        f"throughput: {report['throughput_events_per_s']} events/s"
+    )
+    print(
+        f"end-to-end latency (ms): p50={e2e['p50']} p95={e2e['p95']} "
+        f"p99={e2e['p99']} max={e2e['max']} (n={e2e['count']})"
+    )
+    print(
+        f"handler response (ms): p50={report['handler_response_ms']['p50']} "
+        f"p99={report['handler_response_ms']['p99']}"
+    )
+    print("responses:")
+    for kind, count in report["responses"].items():
+        print(f"  {count:>6}  {kind}")
+    print(
+        f"events: sent={events['sent']} completed={events['completed']} "
+        f"answered={events['answered']} duplicate_replies={events['duplicate_replies']} "
+        f"without_own_reply={events['without_own_reply']}"
+    )
+    print(f"dynamodb status: {events['dynamodb_status']}")
+    print(f"slack calls: {report['slack_calls']} injected: {report['slack_injected']}")
+    print(
+        f"bedrock calls: {report['bedrock_calls']} "
+        f"injected: {report['bedrock_injected']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--events", type=int, default=200, help="送信するイベント数")
+    parser.add_argument("--concurrency", type=int, default=20, help="同時実行数")
+    parser.add_argument(
+        "--threads", type=int, default=50, help="イベントを振り分けるスレッドの数"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="1秒あたりの送信イベント数（0の場合は間隔をあけずに送信）",
+    )
+    parser.add_argument(
+        "--retry-rate", type=float, default=0.1, help="再送ヘッダー付きで再送する割合"
+    )
+    parser.add_argument(
+        "--retry-delay-ms", type=int, default=3000, help="再送までの時間（ミリ秒）"
+    )
+    parser.add_argument(
+        "--duplicate-rate", type=float, default=0.05, help="同時に重複して送信する割合"
+    )
+    parser.add_argument("--slack-latency-ms", type=int, default=80)
+    parser.add_argument("--slack-jitter-ms", type=int, default=40)
+    parser.add_argument("--slack-error-rate", type=float, default=0.0)
+    parser.add_argument("--slack-throttle-rate", type=float, default=0.0)
+    parser.add_argument("--bedrock-latency-ms", type=int, default=1500)
+    parser.add_argument("--bedrock-jitter-ms", type=int, default=1000)
+    parser.add_argument("--bedrock-error-rate", type=float, default=0.0)
+    parser.add_argument("--bedrock-throttle-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--response-chars", type=int, default=800, help="Bedrockの応答の文字数"
+    )
+    parser.add_argument(
+        "--stream-chunks", type=int, default=20, help="ストリーミング応答の断片の数"
+    )
+    parser.add_argument(
+        "--async",
+        dest="async_mode",
+        action="store_true",
+        help="非同期モード（ASYNC_PROCESSING_ENABLED）で実行する",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="ストリーミング応答（STREAMING_RESPONSE_ENABLED）で実行する",
+    )
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="lambda_function の読み込み前に設定する環境変数（複数指定可）",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
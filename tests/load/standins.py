@@ -0,0 +1,415 @@
+"""
+負荷試験用のSlack Web API・Bedrock Runtimeのローカルスタンドイン
+
+どちらも127.0.0.1の空いているポートで起動するHTTPサーバーで、応答の遅延、
+エラー、スロットリングを指定した割合で発生させる。DynamoDBはmotoのサーバーを使う
+"""
+
+import base64
+import binascii
+import json
+import random
+import re
+import socket
+import struct
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Bedrockのスタンドインが応答に含める、応答対象のイベントを示す印
+EVENT_MARKER_PATTERN = re.compile(r"\[(Ev\w+)\]")
+
+BOT_USER_ID = "UBOT"
+BOT_ID = "BBOT"
+
+
+class Faults:
+    """
+    スタンドインが発生させる遅延・エラー・スロットリングの設定
+    """
+
+    def __init__(
+        self, latency_ms=0, jitter_ms=0, error_rate=0.0, throttle_rate=0.0, seed=None
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sleep(self):
+        with self.lock:
+            jitter = self.random.uniform(0, self.jitter_ms)
+        time.sleep((self.latency_ms + jitter) / 1000)
+
+    def draw(self):
+        """
+        Returns:
+            str: "throttle", "error" または None
+        """
+        with self.lock:
+            value = self.random.random()
+        if value < self.throttle_rate:
+            return "throttle"
+        if value < self.throttle_rate + self.error_rate:
+            return "error"
+        return None
+
+
+class StandInServer:
+    """
+    スタンドインのHTTPサーバーを別スレッドで起動・停止する
+    """
+
+    def __init__(self, handler_class, state):
+        handler = type(handler_class.__name__, (handler_class,), {"state": state})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        # 大量のリクエストを出力しない
+        pass
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class SlackState:
+    """
+    スレッドごとのメッセージと、APIの呼び出し回数を保持する
+    """
+
+    def __init__(self, faults):
+        self.faults = faults
+        self.lock = threading.Lock()
+        self.threads = {}
+        self.messages = {}
+        self.calls = Counter()
+        self.injected = Counter()
+        self.sequence = 0
+
+    def next_ts(self):
+        with self.lock:
+            self.sequence += 1
+            return f"{int(time.time())}.{self.sequence:06d}"
+
+    def add_message(self, channel, thread_ts, message):
+        with self.lock:
+            self.threads.setdefault((channel, thread_ts), []).append(message)
+            self.messages[(channel, message["ts"])] = message
+
+    def replies(self, channel, thread_ts, oldest=None):
+        with self.lock:
+            messages = list(self.threads.get((channel, thread_ts), []))
+        if oldest:
+            messages = [m for m in messages if float(m["ts"]) > float(oldest)]
+        return messages
+
+    def replies_by_event(self):
+        """
+        ボットの投稿のうち、応答の先頭（印を含むもの）をイベントごとに数える
+        """
+        counts = Counter()
+        with self.lock:
+            messages = list(self.messages.values())
+        for message in messages:
+            if message.get("bot_id"):
+                match = EVENT_MARKER_PATTERN.match(message.get("text", ""))
+                if match:
+                    counts[match.group(1)] += 1
+        return counts
+
+
+class SlackHandler(_Handler):
+    """
+    ボットが使うSlack Web APIのメソッドのみを実装する
+    """
+
+    def do_GET(self):
+        self.handle_api(urlsplit(self.path), {})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        body = self.read_body()
+        content_type = self.headers.get("Content-Type") or ""
+        if "json" in content_type:
+            params = json.loads(body or b"{}")
+        else:
+            params = {k: v[0] for k, v in parse_qs(body.decode("utf-8")).items()}
+        self.handle_api(url, params)
+
+    def handle_api(self, url, params):
+        state = self.state
+        params = {
+            **{k: v[0] for k, v in parse_qs(url.query).items()},
+            **params,
+        }
+        method = url.path.rstrip("/").rsplit("/", 1)[-1]
+        state.calls[method] += 1
+
+        state.faults.sleep()
+        fault = state.faults.draw()
+        if fault == "throttle":
+            state.injected["throttle"] += 1
+            self.send_json(
+                429, {"ok": False, "error": "ratelimited"}, {"Retry-After": "1"}
+            )
+            return
+        if fault == "error":
+            state.injected["error"] += 1
+            self.send_json(500, {"ok": False, "error": "internal_error"})
+            return
+
+        handler = getattr(self, f"api_{method.replace('.', '_')}", None)
+        if handler is None:
+            self.send_json(200, {"ok": False, "error": "unknown_method"})
+            return
+        self.send_json(200, {"ok": True, **handler(params)})
+
+    def api_auth_test(self, params):
+        return {"user_id": BOT_USER_ID, "bot_id": BOT_ID}
+
+    def api_conversations_replies(self, params):
+        messages = self.state.replies(
+            params["channel"], params["ts"], params.get("oldest")
+        )
+        return {"messages": messages, "has_more": False}
+
+    def api_chat_postMessage(self, params):
+        ts = self.state.next_ts()
+        message = {
+            "type": "message",
+            "user": BOT_USER_ID,
+            "bot_id": BOT_ID,
+            "text": params.get("text", ""),
+            "ts": ts,
+            "thread_ts": params.get("thread_ts") or ts,
+        }
+        self.state.add_message(params["channel"], message["thread_ts"], message)
+        return {"channel": params["channel"], "ts": ts, "message": message}
+
+    def api_chat_update(self, params):
+        with self.state.lock:
+            message = self.state.messages.get((params["channel"], params["ts"]))
+            if message:
+                message["text"] = params.get("text", "")
+        return {"channel": params["channel"], "ts": params["ts"]}
+
+    def api_chat_delete(self, params):
+        with self.state.lock:
+            message = self.state.messages.pop((params["channel"], params["ts"]), None)
+            if message:
+                thread = self.state.threads.get(
+                    (params["channel"], message["thread_ts"])
+                )
+                if thread and message in thread:
+                    thread.remove(message)
+        return {"channel": params["channel"], "ts": params["ts"]}
+
+
+class BedrockState:
+    def __init__(self, faults, response_chars=800, stream_chunks=20):
+        self.faults = faults
+        self.response_chars = response_chars
+        self.stream_chunks = stream_chunks
+        self.calls = Counter()
+        self.injected = Counter()
+
+
+class BedrockHandler(_Handler):
+    """
+    InvokeModel / InvokeModelWithResponseStream を実装する
+
+    応答の先頭には、リクエストの最後のユーザーメッセージに含まれるイベントの印
+    （"[Ev...]"）を付ける。負荷試験のドライバーはこれを使って重複した応答を数える
+    """
+
+    def do_POST(self):
+        state = self.state
+        request = json.loads(self.read_body() or b"{}")
+        streaming = self.path.endswith("/invoke-with-response-stream")
+        operation = "InvokeModelWithResponseStream" if streaming else "InvokeModel"
+        state.calls[operation] += 1
+
+        state.faults.sleep()
+        fault = state.faults.draw()
+        if fault == "throttle":
+            state.injected["throttle"] += 1
+            self.send_json(
+                429,
+                {"message": "Too many requests"},
+                {"x-amzn-ErrorType": "ThrottlingException"},
+            )
+            return
+        if fault == "error":
+            state.injected["error"] += 1
+            self.send_json(
+                500,
+                {"message": "Internal server error"},
+                {"x-amzn-ErrorType": "InternalServerException"},
+            )
+            return
+
+        text = self.build_text(request)
+        usage = {
+            "input_tokens": len(json.dumps(request, ensure_ascii=False)) // 3,
+            "output_tokens": len(text) // 3,
+        }
+        if streaming:
+            self.send_stream(text, usage)
+        else:
+            self.send_json(
+                200,
+                {
+                    "type": "message",
+                    "role": "assistant",
+                    "content": [{"type": "text", "text": text}],
+                    "stop_reason": "end_turn",
+                    "usage": usage,
+                },
+            )
+
+    def build_text(self, request):
+        marker = ""
+        for message in reversed(request.get("messages", [])):
+            if message.get("role") != "user":
+                continue
+            content = message.get("content")
+            if isinstance(content, list):
+                content = " ".join(part.get("text", "") for part in content)
+            found = EVENT_MARKER_PATTERN.findall(content or "")
+            if found:
+                marker = f"[{found[-1]}] "
+            break
+        filler = "これは負荷試験用の応答です。" * (self.state.response_chars // 14 + 1)
+        return (marker + filler)[: max(self.state.response_chars, len(marker))]
+
+    def send_stream(self, text, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        size = max(1, len(text) // max(self.state.stream_chunks, 1))
+        events = [
+            {"type": "message_start", "message": {"usage": usage}},
+            *(
+                {
+                    "type": "content_block_delta",
+                    "delta": {"type": "text_delta", "text": text[i : i + size]},
+                }
+                for i in range(0, len(text), size)
+            ),
+            {
+                "type": "message_delta",
+                "usage": {"output_tokens": usage["output_tokens"]},
+            },
+            {"type": "message_stop"},
+        ]
+        # 1つ目の断片までの遅延は faults.sleep で済んでいるため、以降は断片ごとに分配する
+        interval = self.state.faults.latency_ms / 1000 / max(len(events), 1)
+        for event in events:
+            self.write_chunk(encode_chunk_event(event))
+            time.sleep(interval)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def encode_chunk_event(data):
+    """
+    Bedrockのストリーミング応答の1イベントをAWS event stream形式でエンコードする
+    """
+    payload = json.dumps(
+        {"bytes": base64.b64encode(json.dumps(data).encode("utf-8")).decode("ascii")}
+    ).encode("utf-8")
+    headers = b"".join(
+        encode_header(name, value)
+        for name, value in (
+            (":event-type", "chunk"),
+            (":content-type", "application/json"),
+            (":message-type", "event"),
+        )
+    )
+    total_length = 12 + len(headers) + len(payload) + 4
+    prelude = struct.pack(">II", total_length, len(headers))
+    message = prelude + struct.pack(">I", binascii.crc32(prelude)) + headers + payload
+    return message + struct.pack(">I", binascii.crc32(message))
+
+
+def encode_header(name, value):
+    name = name.encode("utf-8")
+    value = value.encode("utf-8")
+    # 値の型 7 は文字列
+    return (
+        struct.pack("B", len(name))
+        + name
+        + b"\x07"
+        + struct.pack(">H", len(value))
+        + value
+    )
+
+
+def start_dynamodb(table_name):
+    """
+    motoのDynamoDBサーバーを起動し、イベントテーブルを作成する
+
+    Returns:
+        tuple: (サーバー, エンドポイントURL)
+    """
+    import boto3
+    from moto.server import ThreadedMotoServer
+
+    port = find_free_port()
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    url = f"http://127.0.0.1:{port}"
+
+    boto3.client("dynamodb", endpoint_url=url).create_table(
+        TableName=table_name,
+        KeySchema=[{"AttributeName": "event_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "event_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    return server, url
+
+
+def find_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
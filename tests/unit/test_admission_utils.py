@@ -0,0 +1,72 @@
+import json
+from unittest.mock import patch
+from admission_utils import (
+    get_retry_info,
+    peek_event_id,
+    remember_event,
+    is_recent_event,
+    admit_retry,
+)
+
+
+def _retry_event(event_id="Ev123", retry_num="1"):
+    return {
+        "headers": {
+            "x-slack-retry-num": retry_num,
+            "x-slack-retry-reason": "http_timeout",
+        },
+        "body": json.dumps({"event_id": event_id, "event": {}}),
+    }
+
+
+def test_get_retry_info():
+    """get_retry_info関数が再送ヘッダーを大文字小文字を問わず取得できることをテスト"""
+    event = {
+        "headers": {"X-Slack-Retry-Num": "2", "X-Slack-Retry-Reason": "http_error"}
+    }
+    assert get_retry_info(event) == (2, "http_error")
+    assert get_retry_info({"headers": {}}) == (None, None)
+    assert get_retry_info({}) == (None, None)
+
+
+def test_peek_event_id():
+    """peek_event_id関数がevent_idを取り出し、不正なbodyではNoneを返すことをテスト"""
+    assert peek_event_id(_retry_event("Ev999")) == "Ev999"
+    assert peek_event_id({"body": "不正なJSON"}) is None
+    assert peek_event_id({}) is None
+
+
+@patch("admission_utils.RECENT_EVENT_CACHE_SIZE", 2)
+def test_remember_event_evicts_oldest():
+    """remember_event関数が上限を超えた古いevent_idを破棄することをテスト"""
+    remember_event("Ev1")
+    remember_event("Ev2")
+    remember_event("Ev3")
+
+    assert is_recent_event("Ev1") is False
+    assert is_recent_event("Ev2") is True
+    assert is_recent_event("Ev3") is True
+
+
+def test_admit_retry_known_event():
+    """受け付け済みイベントの再送がX-Slack-No-Retry付きで打ち切られることをテスト"""
+    remember_event("Ev123")
+
+    response = admit_retry(_retry_event("Ev123"))
+
+    assert response["statusCode"] == 200
+    assert response["headers"]["X-Slack-No-Retry"] == "1"
+
+
+def test_admit_retry_unknown_event():
+    """未知のイベントの再送は通常の処理に進むことをテスト"""
+    assert admit_retry(_retry_event("Ev456")) is None
+
+
+def test_admit_retry_first_delivery():
+    """再送でないイベントは通常の処理に進むことをテスト"""
+    remember_event("Ev123")
+    event = _retry_event("Ev123")
+    del event["headers"]
+
+    assert admit_retry(event) is None
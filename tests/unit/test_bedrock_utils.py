@@ -1,10 +1,14 @@
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 from bedrock_utils import invoke_claude_model, format_conversation_for_claude, strip_thinking_tags
+from bedrock_utils import stream_claude_model, ThinkingTagFilter
+import json
+import pytest
 
 
-@patch("bedrock_utils.bedrock_runtime.invoke_model")
-def test_invoke_claude_model_success(mock_invoke_model, mock_bedrock_response):
+@patch("bedrock_utils.get_bedrock_runtime")
+def test_invoke_claude_model_success(mock_get_bedrock_runtime, mock_bedrock_response):
     """invoke_claude_model関数が正常にAIモデルを呼び出せることをテスト"""
+    mock_invoke_model = mock_get_bedrock_runtime.return_value.invoke_model
     # モックレスポンスの設定
     mock_invoke_model.return_value = {"body": mock_bedrock_response}
 
@@ -17,9 +21,10 @@ def test_invoke_claude_model_success(mock_invoke_model, mock_bedrock_response):
     assert result == "これはテスト応答です"
 
 
-@patch("bedrock_utils.bedrock_runtime.invoke_model")
-def test_invoke_claude_model_error(mock_invoke_model):
+@patch("bedrock_utils.get_bedrock_runtime")
+def test_invoke_claude_model_error(mock_get_bedrock_runtime):
     """invoke_claude_model関数がエラー時に例外を発生させることをテスト"""
+    mock_invoke_model = mock_get_bedrock_runtime.return_value.invoke_model
     # エラーをシミュレート
     mock_invoke_model.side_effect = Exception("API error")
 
@@ -41,7 +46,8 @@ def test_format_conversation_for_claude_empty():
     assert count == 0
 
 
-def test_format_conversation_for_claude_with_history():
+@patch("slack_utils.get_bot_user_id", return_value="UBOT")
+def test_format_conversation_for_claude_with_history(mock_get_bot_user_id):
     """format_conversation_for_claude関数が会話履歴を正しくフォーマットできることをテスト"""
     conversation_history = [
         {"bot_id": None, "text": "<@U123> こんにちは"},
@@ -61,7 +67,8 @@ def test_format_conversation_for_claude_with_history():
     assert count == 1
 
 
-def test_format_conversation_for_claude_with_append_message():
+@patch("slack_utils.get_bot_user_id", return_value="UBOT")
+def test_format_conversation_for_claude_with_append_message(mock_get_bot_user_id):
     """format_conversation_for_claude関数が追加メッセージを正しく処理できることをテスト"""
     conversation_history = [
         {"bot_id": None, "text": "<@U123> こんにちは"},
@@ -79,7 +86,8 @@ def test_format_conversation_for_claude_with_append_message():
     assert count == 1
 
 
-def test_format_conversation_for_claude_consecutive_same_role():
+@patch("slack_utils.get_bot_user_id", return_value="UBOT")
+def test_format_conversation_for_claude_consecutive_same_role(mock_get_bot_user_id):
     """format_conversation_for_claude関数が同じロールの連続メッセージを結合できることをテスト"""
     conversation_history = [
         {"bot_id": None, "text": "<@U123> 最初の質問"},
@@ -120,3 +128,266 @@ def test_strip_thinking_tags_no_tag():
     """strip_thinking_tags関数がタグなしのテキストをそのまま返すことをテスト"""
     text = "タグなしの回答"
     assert strip_thinking_tags(text) == "タグなしの回答"
+
+
+@patch("slack_utils.get_bot_user_id", return_value="U123")
+def test_format_conversation_for_claude_strips_bot_mention(mock_get_bot_user_id):
+    """format_conversation_for_claude関数がボットメンションを除去し、IDを1度だけ解決することをテスト"""
+    conversation_history = [
+        {"bot_id": None, "text": "<@U123> こんにちは"},
+        {"bot_id": "B123", "text": "こんにちは"},
+        {"bot_id": None, "text": "<@U123> 天気について教えて"},
+    ]
+
+    messages, count = format_conversation_for_claude(conversation_history)
+
+    assert messages[0]["content"] == "こんにちは"
+    assert messages[2]["content"] == "天気について教えて"
+    mock_get_bot_user_id.assert_called_once()
+
+
+def _stream_event(data):
+    return {"chunk": {"bytes": json.dumps(data).encode()}}
+
+
+def _text_delta(text):
+    return _stream_event(
+        {"type": "content_block_delta", "delta": {"type": "text_delta", "text": text}}
+    )
+
+
+@patch("bedrock_utils.get_bedrock_runtime")
+def test_stream_claude_model(mock_get_bedrock_runtime):
+    """stream_claude_model関数がテキストの差分を順に返すことをテスト"""
+    # モックの設定
+    mock_stream = (
+        mock_get_bedrock_runtime.return_value.invoke_model_with_response_stream
+    )
+    mock_stream.return_value = {
+        "body": [
+            _stream_event({"type": "message_start"}),
+            _text_delta("こんにちは"),
+            _text_delta("、世界"),
+            _stream_event(
+                {
+                    "type": "message_stop",
+                    "amazon-bedrock-invocationMetrics": {"firstByteLatency": 100},
+                }
+            ),
+        ]
+    }
+
+    # 関数の実行
+    result = list(stream_claude_model([{"role": "user", "content": "こんにちは"}]))
+
+    # 検証
+    mock_stream.assert_called_once()
+    assert result == ["こんにちは", "、世界"]
+
+
+@patch("bedrock_utils.get_bedrock_runtime")
+def test_stream_claude_model_strips_thinking(mock_get_bedrock_runtime):
+    """stream_claude_model関数がチャンクをまたぐthinkingタグを除去することをテスト"""
+    # モックの設定
+    mock_stream = (
+        mock_get_bedrock_runtime.return_value.invoke_model_with_response_stream
+    )
+    mock_stream.return_value = {
+        "body": [
+            _text_delta("<think"),
+            _text_delta("ing>考え中</thi"),
+            _text_delta("nking>\n回答"),
+            _text_delta("です"),
+        ]
+    }
+
+    # 関数の実行
+    result = "".join(stream_claude_model([{"role": "user", "content": "質問"}]))
+
+    # 検証
+    assert result == "回答です"
+
+
+def test_thinking_tag_filter_matches_strip_thinking_tags():
+    """ThinkingTagFilterを1文字ずつ通した結果がstrip_thinking_tagsと一致することをテスト"""
+    text = "<thinking>a</thinking>前半 < 記号 <thinking>b</thinking>後半<thin"
+
+    # 関数の実行
+    thinking_filter = ThinkingTagFilter()
+    result = "".join(thinking_filter.feed(c) for c in text) + thinking_filter.flush()
+
+    # 検証
+    assert result == strip_thinking_tags(text)
+
+
+@patch("slack_utils.get_bot_user_id", return_value="UBOT")
+def test_format_conversation_for_claude_cache_prefix(mock_get_bot_user_id):
+    """format_conversation_for_claude関数が最新の発言の直前にキャッシュのブレークポイントを付けることをテスト"""
+    conversation_history = [
+        {"bot_id": None, "text": "こんにちは"},
+        {"bot_id": "B123", "text": "何かお手伝いできますか？"},
+    ]
+
+    messages, count = format_conversation_for_claude(
+        conversation_history, "天気について教えて", cache_prefix=True
+    )
+
+    assert messages[0] == {"role": "user", "content": "こんにちは"}
+    assert messages[1]["content"] == [
+        {
+            "type": "text",
+            "text": "何かお手伝いできますか？",
+            "cache_control": {"type": "ephemeral"},
+        }
+    ]
+    assert messages[2] == {"role": "user", "content": "天気について教えて"}
+    assert count == 1
+
+
+def test_format_conversation_for_claude_cache_prefix_single_turn():
+    """会話が最新の発言のみの場合はブレークポイントを付けないことをテスト"""
+    messages, count = format_conversation_for_claude(
+        [], "こんにちは", cache_prefix=True
+    )
+
+    assert messages == [{"role": "user", "content": "こんにちは"}]
+
+
+@patch("context_utils.CONTEXT_INPUT_TOKEN_BUDGET", 0)
+@patch("bedrock_utils.fit_messages")
+def test_format_conversation_for_claude_uses_routed_budget(mock_fit_messages):
+    """振り分けたモデルと最大出力トークン数から入力トークンの上限を決めることをテスト"""
+    mock_fit_messages.side_effect = lambda messages, budget: (messages, {})
+
+    format_conversation_for_claude([], "こんにちは")
+    format_conversation_for_claude(
+        [],
+        "こんにちは",
+        model_id="global.anthropic.claude-haiku-4-5-20251001-v1:0",
+        max_tokens=1024,
+    )
+
+    default_budget, light_budget = [
+        call.kwargs["budget"] for call in mock_fit_messages.call_args_list
+    ]
+    assert light_budget != default_budget
+
+
+@patch("bedrock_utils.get_bedrock_runtime")
+def test_invoke_claude_model_caches_system_prompt(
+    mock_get_bedrock_runtime, mock_bedrock_response
+):
+    """プロンプトキャッシュが有効な場合、システムプロンプトにブレークポイントを付けることをテスト"""
+    mock_invoke_model = mock_get_bedrock_runtime.return_value.invoke_model
+    mock_bedrock_response.read.return_value = json.dumps(
+        {
+            "content": [{"text": "応答"}],
+            "usage": {"input_tokens": 10, "cache_read_input_tokens": 2000},
+        }
+    )
+    mock_invoke_model.return_value = {"body": mock_bedrock_response}
+
+    # 関数の実行
+    with patch("bedrock_utils.PROMPT_CACHE_ENABLED", True):
+        result = invoke_claude_model([{"role": "user", "content": "こんにちは"}])
+
+    # 検証
+    body = json.loads(mock_invoke_model.call_args.kwargs["body"])
+    assert body["system"][0]["cache_control"] == {"type": "ephemeral"}
+    assert result == "応答"
+
+
+@patch("bedrock_utils.get_bedrock_runtime")
+def test_invoke_claude_model_throttling_raises_busy(mock_get_bedrock_runtime):
+    """再試行後もスロットリングされた場合にBedrockBusyErrorを送出することをテスト"""
+    from botocore.exceptions import ClientError
+    from rate_limit_utils import BedrockBusyError
+
+    mock_get_bedrock_runtime.return_value.invoke_model.side_effect = ClientError(
+        {"Error": {"Code": "ThrottlingException"}}, "InvokeModel"
+    )
+
+    with pytest.raises(BedrockBusyError):
+        invoke_claude_model([{"role": "user", "content": "こんにちは"}])
+
+
+@patch("bedrock_utils.release_bedrock_capacity")
+@patch("bedrock_utils.acquire_bedrock_capacity")
+@patch("bedrock_utils.get_bedrock_runtime")
+def test_invoke_claude_model_releases_capacity(
+    mock_get_bedrock_runtime,
+    mock_acquire_bedrock_capacity,
+    mock_release_bedrock_capacity,
+    mock_bedrock_response,
+):
+    """呼び出し後に確保した枠を実際のトークン数とともに解放することをテスト"""
+    mock_bedrock_response.read.return_value = json.dumps(
+        {
+            "content": [{"text": "応答"}],
+            "usage": {"input_tokens": 100, "output_tokens": 20},
+        }
+    )
+    mock_get_bedrock_runtime.return_value.invoke_model.return_value = {
+        "body": mock_bedrock_response
+    }
+
+    # 関数の実行
+    invoke_claude_model([{"role": "user", "content": "こんにちは"}])
+
+    # 検証
+    mock_release_bedrock_capacity.assert_called_once_with(
+        mock_acquire_bedrock_capacity.return_value, 120
+    )
+
+
+@patch("bedrock_utils.get_bedrock_runtime")
+def test_invoke_claude_model_fails_over(mock_get_bedrock_runtime, mock_bedrock_response):
+    """スロットリングされた場合に次のエンドポイントで呼び出すことをテスト"""
+    import endpoint_utils
+    from botocore.exceptions import ClientError
+
+    endpoints = endpoint_utils.parse_endpoints("ap-northeast-1:global,ap-northeast-3:jp")
+    clients = {
+        "ap-northeast-1": MagicMock(),
+        "ap-northeast-3": MagicMock(),
+    }
+    clients["ap-northeast-1"].invoke_model.side_effect = ClientError(
+        {"Error": {"Code": "ThrottlingException"}}, "InvokeModel"
+    )
+    clients["ap-northeast-3"].invoke_model.return_value = {
+        "body": mock_bedrock_response
+    }
+    mock_get_bedrock_runtime.side_effect = lambda region: clients[region]
+
+    # 関数の実行
+    with patch.object(endpoint_utils, "_endpoints", endpoints):
+        result = invoke_claude_model([{"role": "user", "content": "こんにちは"}])
+
+    # 検証
+    assert result == "これはテスト応答です"
+    model_id = clients["ap-northeast-3"].invoke_model.call_args.kwargs["modelId"]
+    assert model_id.startswith("jp.")
+    assert endpoints[0].cooldown_until > 0
+    assert endpoints[1].latency_ewma_ms is not None
+
+
+@patch("bedrock_utils.get_bedrock_runtime")
+def test_invoke_claude_model_with_model_id(
+    mock_get_bedrock_runtime, mock_bedrock_response
+):
+    """model_id と max_tokens を指定したモデル・出力上限で呼び出すことをテスト"""
+    mock_get_bedrock_runtime.return_value.invoke_model.return_value = {
+        "body": mock_bedrock_response
+    }
+
+    # 関数の実行
+    invoke_claude_model(
+        [{"role": "user", "content": "こんにちは"}],
+        max_tokens=512,
+        model_id="global.anthropic.claude-haiku-4-5-20251001-v1:0",
+    )
+
+    # 検証
+    call_kwargs = mock_get_bedrock_runtime.return_value.invoke_model.call_args.kwargs
+    assert call_kwargs["modelId"] == "global.anthropic.claude-haiku-4-5-20251001-v1:0"
+    assert json.loads(call_kwargs["body"])["max_tokens"] == 512
@@ -0,0 +1,97 @@
+import json
+from unittest.mock import patch
+from cache_utils import get_cached, set_cached, get_state_key
+
+
+def test_memory_cache_hit():
+    """set_cachedで保存した値をget_cachedで取得できることをテスト"""
+    set_cached("url", "https://example.com/", {"title": "t"}, 60)
+
+    assert get_cached("url", "https://example.com/") == {"title": "t"}
+    assert get_cached("file", "https://example.com/") is None
+
+
+@patch("cache_utils.time.time")
+def test_memory_cache_expired(mock_time):
+    """有効期限を過ぎた値が返されないことをテスト"""
+    mock_time.return_value = 1000
+    set_cached("file", "F123:1", "内容", 60)
+
+    mock_time.return_value = 1061
+    assert get_cached("file", "F123:1") is None
+
+
+@patch("cache_utils.CACHE_MEMORY_MAX_ENTRIES", 2)
+def test_memory_cache_evicts_least_recently_used():
+    """上限を超えた場合に最も古く使われた値が破棄されることをテスト"""
+    set_cached("file", "a", "A", 60)
+    set_cached("file", "b", "B", 60)
+    get_cached("file", "a")
+    set_cached("file", "c", "C", 60)
+
+    assert get_cached("file", "a") == "A"
+    assert get_cached("file", "b") is None
+    assert get_cached("file", "c") == "C"
+
+
+@patch("cache_utils.CACHE_DYNAMODB_ENABLED", True)
+@patch("cache_utils.put_state")
+@patch("cache_utils.time.time", return_value=1000)
+def test_set_cached_writes_dynamodb(mock_time, mock_put_state):
+    """DynamoDBキャッシュが有効な場合にハッシュ化したキーとTTLで保存することをテスト"""
+    set_cached("url", "https://example.com/", {"title": "タイトル"}, 60)
+
+    args, kwargs = mock_put_state.call_args
+    assert args[0] == get_state_key("url#https://example.com/")
+    assert args[0].startswith("cache#url#")
+    assert args[1]["expires_at"] == 1060
+    assert json.loads(args[1]["value"]) == {"title": "タイトル"}
+
+
+@patch("cache_utils.CACHE_DYNAMODB_ENABLED", True)
+@patch("cache_utils.CACHE_DYNAMODB_MAX_VALUE_BYTES", 10)
+@patch("cache_utils.put_state")
+def test_set_cached_skips_large_value(mock_put_state):
+    """DynamoDBの上限を超える値はメモリにのみ保存することをテスト"""
+    set_cached("file", "F123:1", "a" * 100, 60)
+
+    mock_put_state.assert_not_called()
+    assert get_cached("file", "F123:1") == "a" * 100
+
+
+@patch("cache_utils.CACHE_DYNAMODB_ENABLED", True)
+@patch("cache_utils.get_state")
+@patch("cache_utils.time.time", return_value=1000)
+def test_get_cached_reads_dynamodb(mock_time, mock_get_state):
+    """メモリにない値をDynamoDBから取得し、メモリにも保持することをテスト"""
+    mock_get_state.return_value = {"value": json.dumps("内容"), "expires_at": 2000}
+
+    assert get_cached("file", "F123:1") == "内容"
+    assert get_cached("file", "F123:1") == "内容"
+    mock_get_state.assert_called_once()
+
+
+@patch("cache_utils.CACHE_DYNAMODB_ENABLED", True)
+@patch("cache_utils.get_state")
+@patch("cache_utils.time.time", return_value=1000)
+def test_get_cached_ignores_expired_dynamodb_item(mock_time, mock_get_state):
+    """TTLで削除される前の期限切れアイテムを無視することをテスト"""
+    mock_get_state.return_value = {"value": json.dumps("内容"), "expires_at": 999}
+
+    assert get_cached("file", "F123:1") is None
+
+
+@patch("cache_utils.CACHE_DYNAMODB_ENABLED", True)
+@patch("cache_utils.get_state", side_effect=Exception("DynamoDB error"))
+def test_get_cached_dynamodb_error(mock_get_state):
+    """DynamoDBの読み込みに失敗してもキャッシュミスとして扱うことをテスト"""
+    assert get_cached("file", "F123:1") is None
+
+
+@patch("cache_utils.CACHE_DYNAMODB_ENABLED", False)
+@patch("cache_utils.put_state")
+def test_set_cached_persist(mock_put_state):
+    """persist=True の場合、DynamoDBキャッシュが無効でも保存することをテスト"""
+    set_cached("url_summary", "key", {"summary": "要約"}, 60, persist=True)
+
+    mock_put_state.assert_called_once()
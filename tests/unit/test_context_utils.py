@@ -0,0 +1,122 @@
+from unittest.mock import patch
+from config import AI_SYSTEM_PROMPT
+from context_utils import (
+    estimate_tokens,
+    truncate_to_tokens,
+    cap_source_text,
+    get_input_token_budget,
+    fit_messages,
+)
+
+
+def test_estimate_tokens_japanese_and_english():
+    """日本語は1文字あたり、英語は数文字あたり1トークンとして推定することをテスト"""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("こんにちは") == 5
+    assert estimate_tokens("a" * 100) == 30
+    assert estimate_tokens("天気 weather") == 2 + 3
+
+
+def test_truncate_to_tokens():
+    """上限を超えるテキストの先頭部分を残し、省略した旨を追記することをテスト"""
+    # 関数の実行
+    text, truncated = truncate_to_tokens("あ" * 1000, 100)
+
+    # 検証
+    assert truncated
+    assert text.startswith("あ" * 50)
+    assert "省略" in text
+    assert estimate_tokens(text) <= 100
+
+
+def test_truncate_to_tokens_within_limit():
+    """上限以下のテキストはそのまま返すことをテスト"""
+    assert truncate_to_tokens("short text", 100) == ("short text", False)
+
+
+@patch.dict("context_utils.SOURCE_TOKEN_CAPS", {"url": 50})
+def test_cap_source_text():
+    """情報源ごとの上限でテキストを切り詰めることをテスト"""
+    assert estimate_tokens(cap_source_text("本文" * 100, "url")) <= 50
+
+
+@patch("context_utils.CONTEXT_INPUT_TOKEN_BUDGET", 0)
+def test_get_input_token_budget_from_model():
+    """モデルのコンテキストウィンドウから出力・システムプロンプトの分を差し引くことをテスト"""
+    budget = get_input_token_budget("global.anthropic.claude-opus-4-8")
+    assert 0 < budget < 150000
+
+
+@patch("context_utils.CONTEXT_INPUT_TOKEN_BUDGET", 0)
+@patch.dict(
+    "context_utils.MODEL_CONTEXT_WINDOW_TOKENS",
+    {"claude-haiku": 100000, "claude-haiku-4-5": 50000},
+    clear=True,
+)
+def test_get_input_token_budget_per_model():
+    """モデルごとのコンテキストウィンドウ（より具体的な指定を優先）と最大出力トークン数から上限を求めることをテスト"""
+    light = get_input_token_budget(
+        "global.anthropic.claude-haiku-4-5-20251001-v1:0", max_tokens=1024
+    )
+    heavy = get_input_token_budget("global.anthropic.claude-opus-4-8")
+
+    assert light < heavy
+    assert light == int(50000 * 0.75) - 1024 - estimate_tokens(AI_SYSTEM_PROMPT)
+
+
+@patch("context_utils.CONTEXT_INPUT_TOKEN_BUDGET", 5000)
+def test_get_input_token_budget_override():
+    """上限が明示されている場合はその値を使うことをテスト"""
+    assert get_input_token_budget("any-model") == 5000
+
+
+def test_fit_messages_within_budget():
+    """上限に収まる場合はメッセージをそのまま返すことをテスト"""
+    messages = [
+        {"role": "user", "content": "こんにちは"},
+        {"role": "assistant", "content": "何かお手伝いできますか？"},
+        {"role": "user", "content": "天気について教えて"},
+    ]
+
+    # 関数の実行
+    fitted, report = fit_messages(messages, budget=1000)
+
+    # 検証
+    assert fitted == messages
+    assert report["dropped_messages"] == 0
+    assert report["truncated_messages"] == []
+
+
+def test_fit_messages_drops_oldest_turns():
+    """上限を超える場合、親メッセージと新しい会話を残して途中の会話を省略することをテスト"""
+    messages = [{"role": "user", "content": "親メッセージ"}]
+    for i in range(10):
+        messages.append({"role": "assistant", "content": f"回答{i}" + "あ" * 100})
+        messages.append({"role": "user", "content": f"質問{i}" + "い" * 100})
+
+    # 関数の実行
+    fitted, report = fit_messages(messages, budget=800)
+
+    # 検証
+    assert fitted[0]["content"].startswith("親メッセージ\n【システムメッセージ】")
+    assert fitted[-1]["content"].startswith("質問9")
+    assert fitted[1]["role"] == "assistant"
+    assert report["dropped_messages"] > 0
+    assert report["input_tokens"] <= 800
+    assert all(a["role"] != b["role"] for a, b in zip(fitted, fitted[1:]))
+
+    # 同じ入力に対して同じ結果になる
+    assert fit_messages(messages, budget=800) == (fitted, report)
+
+
+def test_fit_messages_truncates_huge_newest_message():
+    """最新の発言が大きすぎる場合は切り詰めて残すことをテスト"""
+    messages = [{"role": "user", "content": "あ" * 5000}]
+
+    # 関数の実行
+    fitted, report = fit_messages(messages, budget=1000)
+
+    # 検証
+    assert len(fitted) == 1
+    assert report["truncated_messages"] == [0]
+    assert report["input_tokens"] <= 1000
@@ -1,12 +1,22 @@
 from unittest.mock import patch
 import pytest
 from botocore.exceptions import ClientError
-from dynamodb_utils import save_initial_event, update_event
-
-
-@patch("dynamodb_utils.table.put_item")
-def test_save_initial_event_success(mock_put_item):
+from dynamodb_utils import (
+    save_initial_event,
+    update_event,
+    save_event_message,
+    get_event_message,
+    fail_event,
+    start_event_work,
+    get_state,
+    put_state,
+)
+
+
+@patch("dynamodb_utils.get_table")
+def test_save_initial_event_success(mock_get_table):
     """save_initial_event関数が正常にデータを保存できることをテスト"""
+    mock_put_item = mock_get_table.return_value.put_item
     # 関数の実行
     result = save_initial_event(
         "event123", "user123", "channel123", "1234567890.123456", "テストメッセージ"
@@ -26,9 +36,10 @@ def test_save_initial_event_success(mock_put_item):
     assert "ConditionExpression" in kwargs
 
 
-@patch("dynamodb_utils.table.put_item")
-def test_save_initial_event_duplicate(mock_put_item):
+@patch("dynamodb_utils.get_table")
+def test_save_initial_event_duplicate(mock_get_table):
     """save_initial_event関数が重複イベントを正しく処理できることをテスト"""
+    mock_put_item = mock_get_table.return_value.put_item
     # モックの設定
     error_response = {"Error": {"Code": "ConditionalCheckFailedException"}}
     mock_put_item.side_effect = ClientError(error_response, "PutItem")
@@ -43,9 +54,10 @@ def test_save_initial_event_duplicate(mock_put_item):
     mock_put_item.assert_called_once()
 
 
-@patch("dynamodb_utils.table.put_item")
-def test_save_initial_event_other_error(mock_put_item):
+@patch("dynamodb_utils.get_table")
+def test_save_initial_event_other_error(mock_get_table):
     """save_initial_event関数が他のエラーを正しく処理できることをテスト"""
+    mock_put_item = mock_get_table.return_value.put_item
     # モックの設定
     error_response = {"Error": {"Code": "InternalServerError"}}
     mock_put_item.side_effect = ClientError(error_response, "PutItem")
@@ -57,9 +69,10 @@ def test_save_initial_event_other_error(mock_put_item):
         )
 
 
-@patch("dynamodb_utils.table.update_item")
-def test_update_event_success(mock_update_item):
+@patch("dynamodb_utils.get_table")
+def test_update_event_success(mock_get_table):
     """update_event関数が正常にデータを更新できることをテスト"""
+    mock_update_item = mock_get_table.return_value.update_item
     # 関数の実行
     update_event("event123", "AIからの応答")
 
@@ -73,9 +86,10 @@ def test_update_event_success(mock_update_item):
     assert kwargs["ExpressionAttributeValues"][":c"] == "completed"
 
 
-@patch("dynamodb_utils.table.update_item")
-def test_update_event_already_processed(mock_update_item):
+@patch("dynamodb_utils.get_table")
+def test_update_event_already_processed(mock_get_table):
     """update_event関数が既に処理済みのイベントを正しく処理できることをテスト"""
+    mock_update_item = mock_get_table.return_value.update_item
     # モックの設定
     error_response = {"Error": {"Code": "ConditionalCheckFailedException"}}
     mock_update_item.side_effect = ClientError(error_response, "UpdateItem")
@@ -87,9 +101,10 @@ def test_update_event_already_processed(mock_update_item):
     mock_update_item.assert_called_once()
 
 
-@patch("dynamodb_utils.table.update_item")
-def test_update_event_other_error(mock_update_item):
+@patch("dynamodb_utils.get_table")
+def test_update_event_other_error(mock_get_table):
     """update_event関数が他のエラーを正しく処理できることをテスト"""
+    mock_update_item = mock_get_table.return_value.update_item
     # モックの設定
     error_response = {"Error": {"Code": "InternalServerError"}}
     mock_update_item.side_effect = ClientError(error_response, "UpdateItem")
@@ -100,9 +115,10 @@ def test_update_event_other_error(mock_update_item):
 
 
 @patch("dynamodb_utils.time.time")
-@patch("dynamodb_utils.table.put_item")
-def test_save_initial_event_timestamp(mock_put_item, mock_time):
+@patch("dynamodb_utils.get_table")
+def test_save_initial_event_timestamp(mock_get_table, mock_time):
     """save_initial_event関数がタイムスタンプを正しく設定できることをテスト"""
+    mock_put_item = mock_get_table.return_value.put_item
     # モックの設定
     mock_time.return_value = 1234567.89
 
@@ -114,3 +130,89 @@ def test_save_initial_event_timestamp(mock_put_item, mock_time):
     # 検証
     args, kwargs = mock_put_item.call_args
     assert kwargs["Item"]["timestamp"] == 1234567890  # 1000倍されることを確認
+
+
+@patch("dynamodb_utils.get_table")
+def test_get_state(mock_get_table):
+    """get_state関数がキーに対応するアイテムを取得できることをテスト"""
+    mock_get_item = mock_get_table.return_value.get_item
+    mock_get_item.return_value = {"Item": {"event_id": "bot_identity#x", "v": 1}}
+
+    assert get_state("bot_identity#x") == {"event_id": "bot_identity#x", "v": 1}
+    mock_get_item.assert_called_once_with(Key={"event_id": "bot_identity#x"})
+
+
+@patch("dynamodb_utils.get_table")
+def test_get_state_not_found(mock_get_table):
+    """get_state関数がアイテムが存在しない場合にNoneを返すことをテスト"""
+    mock_get_item = mock_get_table.return_value.get_item
+    mock_get_item.return_value = {}
+
+    assert get_state("bot_identity#x") is None
+
+
+@patch("dynamodb_utils.get_table")
+def test_put_state(mock_get_table):
+    """put_state関数がプレフィックス付きキーでアイテムを保存することをテスト"""
+    mock_put_item = mock_get_table.return_value.put_item
+    put_state("bot_identity#x", {"bot_user_id": "UBOT"})
+
+    mock_put_item.assert_called_once_with(
+        Item={"bot_user_id": "UBOT", "event_id": "bot_identity#x"}
+    )
+
+
+@patch("dynamodb_utils.get_table")
+def test_event_message_round_trip(mock_get_table):
+    """イベントの記録にメッセージを保存し、読み込めることをテスト"""
+    mock_table = mock_get_table.return_value
+    mock_table.get_item.return_value = {"Item": {"user_message": "処理済みの質問"}}
+
+    save_event_message("event123", "処理済みの質問")
+
+    kwargs = mock_table.update_item.call_args.kwargs
+    assert kwargs["Key"] == {"event_id": "event123"}
+    assert kwargs["ExpressionAttributeValues"] == {":m": "処理済みの質問"}
+    assert get_event_message("event123") == "処理済みの質問"
+
+
+@patch("dynamodb_utils.get_table")
+def test_get_event_message_missing(mock_get_table):
+    """イベントの記録がない場合はNoneを返すことをテスト"""
+    mock_get_table.return_value.get_item.return_value = {}
+
+    assert get_event_message("event123") is None
+
+
+@patch("dynamodb_utils.get_table")
+def test_fail_event_already_processed(mock_get_table):
+    """処理済みのイベントは失敗として上書きしないことをテスト"""
+    mock_update_item = mock_get_table.return_value.update_item
+    error_response = {"Error": {"Code": "ConditionalCheckFailedException"}}
+    mock_update_item.side_effect = ClientError(error_response, "UpdateItem")
+
+    fail_event("event123", "error")
+
+    kwargs = mock_update_item.call_args.kwargs
+    assert kwargs["ExpressionAttributeValues"][":f"] == "failed"
+
+
+@patch("dynamodb_utils.get_table")
+def test_start_event_work_success(mock_get_table):
+    """処理中で未開始のイベントについて、ワーカーの開始を記録できることをテスト"""
+    assert start_event_work("event123") is True
+
+    kwargs = mock_get_table.return_value.update_item.call_args.kwargs
+    assert kwargs["Key"] == {"event_id": "event123"}
+    assert kwargs["UpdateExpression"] == "set worker_started_at = :t"
+
+
+@patch("dynamodb_utils.get_table")
+def test_start_event_work_already_started(mock_get_table):
+    """開始済みまたは処理済みのイベントではFalseを返すことをテスト"""
+    error_response = {"Error": {"Code": "ConditionalCheckFailedException"}}
+    mock_get_table.return_value.update_item.side_effect = ClientError(
+        error_response, "UpdateItem"
+    )
+
+    assert start_event_work("event123") is False
@@ -0,0 +1,91 @@
+from unittest.mock import patch
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+import endpoint_utils
+from endpoint_utils import (
+    Endpoint,
+    parse_endpoints,
+    get_ordered_endpoints,
+    is_retryable_error,
+)
+
+
+def test_parse_endpoints():
+    """設定文字列からエンドポイントを優先順に作成することをテスト"""
+    endpoints = parse_endpoints("ap-northeast-1:global, ap-northeast-3:jp,us-west-2:")
+
+    assert [(e.region, e.profile, e.priority) for e in endpoints] == [
+        ("ap-northeast-1", "global", 0),
+        ("ap-northeast-3", "jp", 1),
+        ("us-west-2", "", 2),
+    ]
+
+
+def test_parse_endpoints_empty():
+    """エンドポイントが指定されていない場合にValueErrorが発生することをテスト"""
+    with pytest.raises(ValueError):
+        parse_endpoints(" , ")
+
+
+def test_endpoint_model_id():
+    """推論プロファイルの接頭辞をエンドポイントのものに付け替えることをテスト"""
+    model_id = "global.anthropic.claude-opus-4-8"
+
+    assert Endpoint("r", "jp", 0).model_id(model_id) == "jp.anthropic.claude-opus-4-8"
+    assert Endpoint("r", "", 0).model_id(model_id) == "anthropic.claude-opus-4-8"
+    assert (
+        Endpoint("r", "global", 0).model_id("anthropic.claude-3-haiku")
+        == "global.anthropic.claude-3-haiku"
+    )
+
+
+def test_get_ordered_endpoints_prefers_configured_order():
+    """統計がない場合は設定順に並べることをテスト"""
+    endpoints = parse_endpoints("a:global,b:jp")
+    with patch.object(endpoint_utils, "_endpoints", endpoints):
+        assert [e.region for e in get_ordered_endpoints()] == ["a", "b"]
+
+
+def test_get_ordered_endpoints_moves_failed_endpoint_last():
+    """失敗直後のエンドポイントを後ろに回すことをテスト"""
+    endpoints = parse_endpoints("a:global,b:jp")
+    endpoints[0].record_failure()
+    with patch.object(endpoint_utils, "_endpoints", endpoints):
+        assert [e.region for e in get_ordered_endpoints()] == ["b", "a"]
+
+
+def test_get_ordered_endpoints_prefers_faster_endpoint():
+    """レイテンシが大きく劣るエンドポイントより速いものを優先することをテスト"""
+    endpoints = parse_endpoints("a:global,b:jp")
+    endpoints[0].record_success(9000)
+    endpoints[1].record_success(3000)
+    with patch.object(endpoint_utils, "_endpoints", endpoints):
+        assert [e.region for e in get_ordered_endpoints()] == ["b", "a"]
+
+
+def test_record_success_updates_ewma():
+    """成功時にレイテンシの移動平均を更新し、エラー率を下げることをテスト"""
+    endpoint = Endpoint("a", "global", 0)
+    endpoint.record_failure()
+    endpoint.record_success(1000)
+    endpoint.record_success(2000)
+
+    assert endpoint.latency_ewma_ms == pytest.approx(1300)
+    assert endpoint.error_ewma < 0.3
+    assert endpoint.cooldown_until == 0.0
+
+
+def test_is_retryable_error():
+    """スロットリング・5xx・通信エラーのみをフェイルオーバーの対象とすることをテスト"""
+    throttling = ClientError({"Error": {"Code": "ThrottlingException"}}, "InvokeModel")
+    server_error = ClientError(
+        {"Error": {"Code": "Unknown"}, "ResponseMetadata": {"HTTPStatusCode": 503}},
+        "InvokeModel",
+    )
+    validation = ClientError({"Error": {"Code": "ValidationException"}}, "InvokeModel")
+
+    assert is_retryable_error(throttling)
+    assert is_retryable_error(server_error)
+    assert is_retryable_error(EndpointConnectionError(endpoint_url="https://x"))
+    assert not is_retryable_error(validation)
+    assert not is_retryable_error(ValueError("x"))
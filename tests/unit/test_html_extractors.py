@@ -0,0 +1,215 @@
+import pytest
+from unittest.mock import patch
+from html_extractors import (
+    extract_html_content,
+    extract_with_bs4,
+    extract_with_stream,
+    decode_html,
+    resolve_backend,
+)
+
+ARTICLE_HTML = """
+<html>
+<head><title> 記事の タイトル </title><style>body { color: red; }</style></head>
+<body>
+  <header>サイトヘッダー</header>
+  <nav>メニュー1 メニュー2</nav>
+  <article>
+    <header>記事の見出し</header>
+    <p>本文の段落です。</p>
+    <script>console.log("skip");</script>
+    <!-- コメント -->
+  </article>
+  <aside>関連記事</aside>
+  <footer>Copyright</footer>
+</body>
+</html>
+"""
+
+NO_MAIN_HTML = """
+<html>
+<head><title>Blog</title></head>
+<body>
+  <header>Site header</header>
+  <div><p>First paragraph.</p><p>Second   paragraph.</p></div>
+  <footer>Footer links</footer>
+</body>
+</html>
+"""
+
+
+try:
+    import lxml.html  # noqa: F401
+
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+
+def _backends():
+    return [
+        "stream",
+        pytest.param(
+            "lxml",
+            marks=pytest.mark.skipif(not HAS_LXML, reason="lxml is not installed"),
+        ),
+    ]
+
+
+@pytest.mark.parametrize("backend", _backends())
+def test_extract_prefers_article(backend):
+    """article要素があればその内容のみを抽出し、ナビゲーションやスクリプトを除くことをテスト"""
+    # 関数の実行
+    title, content = extract_html_content(ARTICLE_HTML.encode(), backend=backend)
+
+    # 検証
+    assert title == "記事の タイトル"
+    assert content == "記事の見出し 本文の段落です。"
+
+
+@pytest.mark.parametrize("backend", _backends())
+def test_extract_body_without_boilerplate(backend):
+    """main/articleがない場合、ヘッダーとフッターを除いた本文を抽出することをテスト"""
+    # 関数の実行
+    title, content = extract_html_content(NO_MAIN_HTML, backend=backend)
+
+    # 検証
+    assert title == "Blog"
+    assert content == "First paragraph.Second paragraph."
+
+
+@pytest.mark.parametrize("backend", _backends())
+def test_extract_without_title_and_body(backend):
+    """タイトルと本文がないHTMLで既定の文言を返すことをテスト"""
+    # 関数の実行
+    title, content = extract_html_content("<html><head></head></html>", backend=backend)
+
+    # 検証
+    assert title == "No title found"
+    assert content == "No body content found"
+
+
+def test_extract_with_bs4_keeps_original_behavior():
+    """bs4エンジンがbody全体からスクリプトとスタイルのみを除いて抽出することをテスト"""
+    # 関数の実行
+    title, content = extract_with_bs4(ARTICLE_HTML)
+
+    # 検証
+    assert "サイトヘッダー" in content
+    assert "本文の段落です。" in content
+    assert "console.log" not in content
+
+
+@patch("html_extractors.EXTRACTORS")
+def test_extract_falls_back_to_bs4(mock_extractors):
+    """抽出エンジンが失敗した場合にbs4にフォールバックすることをテスト"""
+    # モックの設定
+    mock_extractors.__contains__.return_value = True
+    mock_extractors.__getitem__.return_value.side_effect = ValueError("broken")
+
+    # 関数の実行
+    title, content = extract_html_content(NO_MAIN_HTML, backend="stream")
+
+    # 検証
+    assert title == "Blog"
+    assert "Site header" in content
+
+
+def test_resolve_backend_unknown():
+    """未知の抽出エンジン名でValueErrorが発生することをテスト"""
+    with pytest.raises(ValueError):
+        resolve_backend("unknown")
+
+
+def test_decode_html_meta_charset():
+    """metaタグの文字コード指定に従ってデコードすることをテスト"""
+    # 関数の実行
+    html = '<html><head><meta charset="shift_jis"></head><body>日本語</body></html>'
+    text = decode_html(html.encode("shift_jis"))
+
+    # 検証
+    assert "日本語" in text
+
+
+def test_extract_with_stream_shift_jis():
+    """Shift_JISのページから本文を抽出できることをテスト"""
+    # 関数の実行
+    html = (
+        '<html><head><meta http-equiv="Content-Type" '
+        'content="text/html; charset=Shift_JIS"><title>題名</title></head>'
+        "<body><main>本文</main></body></html>"
+    )
+    title, content = extract_with_stream(html.encode("shift_jis"))
+
+    # 検証
+    assert title == "題名"
+    assert content == "本文"
+
+
+@pytest.mark.parametrize("backend", _backends() + ["bs4"])
+def test_extract_header_charset_euc_jp(backend):
+    """metaタグがなくてもHTTPヘッダーの文字コード指定でデコードすることをテスト"""
+    # 関数の実行
+    html = "<html><head><title>題名</title></head><body><p>日本語の本文</p></body></html>"
+    title, content = extract_html_content(
+        html.encode("euc_jp"), backend=backend, encoding="EUC-JP"
+    )
+
+    # 検証
+    assert title == "題名"
+    assert content == "日本語の本文"
+
+
+def test_decode_html_header_charset_before_meta():
+    """HTTPヘッダーの文字コード指定をmetaタグより優先することをテスト"""
+    # 関数の実行
+    html = '<html><head><meta charset="utf-8"></head><body>日本語</body></html>'
+    text = decode_html(html.encode("shift_jis"), "Shift_JIS")
+
+    # 検証
+    assert "日本語" in text
+
+
+def test_decode_html_detects_encoding():
+    """文字コードの指定がない場合に内容から推定することをテスト"""
+    # 関数の実行
+    html = (
+        "<html><body><p>"
+        + "本日の会議では、来期の予算配分について議論しました。" * 5
+        + "</p></body></html>"
+    )
+    text = decode_html(html.encode("shift_jis"))
+
+    # 検証
+    assert "来期の予算配分" in text
+
+
+@pytest.mark.parametrize("backend", _backends())
+def test_extract_role_main(backend):
+    """role="main" の要素を本文領域とし、その後のフッターを含めないことをテスト"""
+    # 関数の実行
+    html = (
+        "<html><body><nav>Menu</nav>"
+        '<div role="main"><div><p>Docs body</p></div></div>'
+        "<footer>Footer</footer></body></html>"
+    )
+    title, content = extract_html_content(html, backend=backend)
+
+    # 検証
+    assert content == "Docs body"
+
+
+@pytest.mark.parametrize("backend", _backends())
+def test_extract_ignores_svg_title(backend):
+    """本文のsvg内の<title>をページのタイトルに含めないことをテスト"""
+    # 関数の実行
+    html = (
+        "<html><head><title>Real Title</title></head><body>"
+        "<svg><title>Close icon</title></svg><main>Body text</main>"
+        "</body></html>"
+    )
+    title, content = extract_html_content(html, backend=backend)
+
+    # 検証
+    assert title == "Real Title"
+    assert content == "Body text"
@@ -0,0 +1,92 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+import pytest
+from http_utils import get_session, http_get, get_pool_stats, close_session
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    close_session()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    close_session()
+    server.shutdown()
+    server.server_close()
+
+
+def test_get_session_is_shared():
+    """get_session関数がコンテナ内で同じセッションを返すことをテスト"""
+    close_session()
+    try:
+        session = get_session()
+        assert get_session() is session
+        adapter = session.get_adapter("https://example.com")
+        assert adapter.max_retries.total == 2
+        assert 429 in adapter.max_retries.status_forcelist
+    finally:
+        close_session()
+
+
+@patch("http_utils.get_session")
+def test_http_get_default_timeout(mock_get_session):
+    """http_get関数が接続・読み込みのタイムアウトを既定で設定することをテスト"""
+    http_get("https://example.com", headers={"a": "b"})
+
+    args, kwargs = mock_get_session.return_value.get.call_args
+    assert args == ("https://example.com",)
+    assert kwargs["timeout"] == (3.05, 10)
+    assert kwargs["headers"] == {"a": "b"}
+
+
+@patch("http_utils.get_session")
+def test_http_get_custom_timeout(mock_get_session):
+    """http_get関数が指定されたタイムアウトを優先することをテスト"""
+    http_get("https://example.com", timeout=1)
+
+    args, kwargs = mock_get_session.return_value.get.call_args
+    assert kwargs["timeout"] == 1
+
+
+def test_pool_stats_counts_reused_connections(local_server):
+    """同じホストへの2回目以降のリクエストで接続が再利用されることをテスト"""
+    assert get_pool_stats() == {"requests": 0, "misses": 0, "hits": 0}
+
+    for _ in range(3):
+        assert http_get(local_server).text == "ok"
+
+    assert get_pool_stats() == {"requests": 3, "misses": 1, "hits": 2}
+
+
+@patch("http_utils.HTTP_POOL_CONNECTIONS", 1)
+def test_pool_stats_survive_pool_eviction(local_server):
+    """ホスト数が上限を超えてプールが破棄されても、累計が減らないことをテスト"""
+    port = local_server.rsplit(":", 1)[1]
+    other_host = f"http://localhost:{port}"
+
+    for _ in range(2):
+        assert http_get(local_server).text == "ok"
+    assert get_pool_stats() == {"requests": 2, "misses": 1, "hits": 1}
+
+    # 別のホストへの送信で、最初のホストのプールが破棄される
+    assert http_get(other_host).text == "ok"
+    adapter = get_session().get_adapter(local_server)
+    assert len(adapter.poolmanager.pools) == 1
+
+    assert get_pool_stats() == {"requests": 3, "misses": 2, "hits": 1}
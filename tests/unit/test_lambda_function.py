@@ -1,6 +1,18 @@
 import json
+import os
+import subprocess
+import sys
 from unittest.mock import patch
-from lambda_function import lambda_handler
+import pytest
+from lambda_function import (
+    RESPONSE_LIMIT_MESSAGE,
+    generate_reply,
+    lambda_handler,
+    process_event,
+)
+from queue_utils import InProcessQueue, set_task_queue
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "src")
 
 
 @patch("lambda_function.handle_slack_event")
@@ -59,7 +71,11 @@ def test_lambda_handler_success(
     assert json.loads(response["body"])["message"] == "OK"
     mock_handle_slack_event.assert_called_once()
     mock_save_initial_event.assert_called_once_with(
-        "Ev123456", "U123456", "C123456", "1234567890.123456", "こんにちは"
+        "Ev123456",
+        "U123456",
+        "C123456",
+        "1234567890.123456",
+        "<@U123456> こんにちは",
     )
     mock_get_thread_history.assert_called_once_with("C123456", "1234567890.123456")
     mock_format_conversation.assert_called_once()
@@ -121,6 +137,46 @@ def test_lambda_handler_duplicate_event(
     assert response["statusCode"] == 200
     assert json.loads(response["body"])["message"] == "Duplicate event ignored"
     mock_save_initial_event.assert_called_once()
+    mock_handle_slack_event.assert_not_called()
+
+
+@patch("lambda_function.process_event")
+@patch("lambda_function.save_initial_event", return_value=False)
+@patch("slack_utils.get_file_content")
+@patch("slack_utils.get_bot_user_id")
+def test_lambda_handler_retry_on_cold_container_skips_file_download(
+    mock_get_bot_user_id,
+    mock_get_file_content,
+    mock_save_initial_event,
+    mock_process_event,
+):
+    """別のコンテナで受け付け済みのイベントの再送では、添付ファイルを取得しないことをテスト"""
+    # テストデータ（このコンテナでは初めて受け取る再送）
+    event = _app_mention_event()
+    body = json.loads(event["body"])
+    body["event"]["files"] = [
+        {
+            "id": "F123",
+            "name": "memo.txt",
+            "mimetype": "text/plain",
+            "url_private": "https://files.slack.com/memo.txt",
+        }
+    ]
+    event["body"] = json.dumps(body)
+    event["headers"] = {
+        "x-slack-retry-num": "1",
+        "x-slack-retry-reason": "http_timeout",
+    }
+
+    # 関数の実行
+    response = lambda_handler(event, {})
+
+    # 検証
+    assert json.loads(response["body"])["message"] == "Duplicate event ignored"
+    mock_save_initial_event.assert_called_once()
+    mock_get_bot_user_id.assert_not_called()
+    mock_get_file_content.assert_not_called()
+    mock_process_event.assert_not_called()
 
 
 @patch("lambda_function.handle_slack_event")
@@ -468,3 +524,599 @@ def test_lambda_handler_non_app_mention():
     # 検証
     assert response["statusCode"] == 200
     assert json.loads(response["body"])["message"] == "OK"
+
+
+def _app_mention_event():
+    return {
+        "body": json.dumps(
+            {
+                "event": {
+                    "type": "app_mention",
+                    "channel": "C123456",
+                    "user": "U123456",
+                    "text": "<@U123456> こんにちは",
+                    "ts": "1234567890.123456",
+                },
+                "event_id": "Ev123456",
+            }
+        )
+    }
+
+
+@patch("lambda_function.ASYNC_PROCESSING_ENABLED", True)
+@patch("lambda_function.handle_slack_event")
+@patch("lambda_function.save_initial_event")
+@patch("lambda_function.get_thread_history")
+@patch("lambda_function.invoke_claude_model")
+@patch("lambda_function.send_slack_message")
+@patch("lambda_function.update_event")
+@patch("slack_utils.get_bot_user_id", return_value="UBOT")
+@patch("lambda_function.start_event_work", return_value=True)
+def test_lambda_handler_async_accepts_and_worker_processes(
+    mock_start_event_work,
+    mock_get_bot_user_id,
+    mock_update_event,
+    mock_send_slack_message,
+    mock_invoke_claude_model,
+    mock_get_thread_history,
+    mock_save_initial_event,
+    mock_handle_slack_event,
+):
+    """非同期モードでフロントが即座に応答し、ワーカーが残りの処理を行うことをテスト"""
+    # モックの設定
+    mock_save_initial_event.return_value = True
+    mock_handle_slack_event.return_value = (
+        "C123456",
+        "U123456",
+        "こんにちは",
+        "1234567890.123456",
+    )
+    mock_get_thread_history.return_value = [{"text": "こんにちは"}]
+    mock_invoke_claude_model.return_value = "AIからの応答"
+    queue = InProcessQueue()
+    set_task_queue(queue)
+
+    try:
+        # フロントの実行
+        response = lambda_handler(_app_mention_event(), {})
+
+        # 検証：フロントでは確保のみ行い、重い処理は行わない
+        assert response["statusCode"] == 200
+        assert json.loads(response["body"])["message"] == "Accepted"
+        mock_save_initial_event.assert_called_once_with(
+            "Ev123456",
+            "U123456",
+            "C123456",
+            "1234567890.123456",
+            "<@U123456> こんにちは",
+        )
+        mock_handle_slack_event.assert_not_called()
+        mock_get_thread_history.assert_not_called()
+        mock_invoke_claude_model.assert_not_called()
+        assert len(queue.tasks) == 1
+
+        # ワーカーの実行
+        results = queue.drain(lambda_handler)
+    finally:
+        set_task_queue(None)
+
+    # 検証
+    assert results[0]["statusCode"] == 200
+    mock_handle_slack_event.assert_called_once()
+    mock_get_thread_history.assert_called_once_with("C123456", "1234567890.123456")
+    mock_send_slack_message.assert_called_once_with(
+        "C123456", "AIからの応答", "1234567890.123456"
+    )
+    mock_update_event.assert_called_once_with("Ev123456", "AIからの応答")
+
+
+@patch("lambda_function.ASYNC_PROCESSING_ENABLED", True)
+@patch("lambda_function.save_initial_event", return_value=False)
+@patch("lambda_function.dispatch_task")
+def test_lambda_handler_async_duplicate_event(
+    mock_dispatch_task, mock_save_initial_event
+):
+    """非同期モードで重複イベントがワーカーに送信されないことをテスト"""
+    response = lambda_handler(_app_mention_event(), {})
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["message"] == "Duplicate event ignored"
+    mock_dispatch_task.assert_not_called()
+
+
+@patch("lambda_function.ASYNC_PROCESSING_ENABLED", True)
+@patch("lambda_function.save_initial_event", return_value=True)
+@patch("lambda_function.dispatch_task", side_effect=Exception("invoke error"))
+@patch("lambda_function.worker_handler")
+def test_lambda_handler_async_dispatch_failure_falls_back(
+    mock_worker_handler, mock_dispatch_task, mock_save_initial_event
+):
+    """ワーカーへの送信に失敗した場合にその場で処理することをテスト"""
+    mock_worker_handler.return_value = {"statusCode": 200, "body": "{}"}
+
+    response = lambda_handler(_app_mention_event(), {})
+
+    assert response["statusCode"] == 200
+    mock_worker_handler.assert_called_once()
+    args, kwargs = mock_worker_handler.call_args
+    assert args[0]["worker_task"]["event_id"] == "Ev123456"
+
+
+@patch("lambda_function.start_event_work", return_value=True)
+@patch("lambda_function.handle_slack_event", side_effect=Exception("テストエラー"))
+@patch("lambda_function.create_error_message", return_value="エラーメッセージ")
+@patch("lambda_function.send_slack_message")
+def test_worker_handler_error_notifies_slack(
+    mock_send_slack_message,
+    mock_create_error_message,
+    mock_handle_slack_event,
+    mock_start_event_work,
+):
+    """ワーカーがエラー時に例外を送出せずSlackへ通知することをテスト"""
+    body = json.loads(_app_mention_event()["body"])
+    event = {"worker_task": {"event_id": "Ev123456", "slack_event": body["event"]}}
+
+    response = lambda_handler(event, {})
+
+    assert response["statusCode"] == 500
+    mock_send_slack_message.assert_called_once_with(
+        "C123456", "エラーメッセージ", "1234567890.123456"
+    )
+
+
+@patch("lambda_function.process_event")
+@patch("lambda_function.handle_slack_event")
+@patch("lambda_function.start_event_work", return_value=False)
+def test_worker_handler_skips_started_event(
+    mock_start_event_work, mock_handle_slack_event, mock_process_event
+):
+    """非同期呼び出しの再実行で、処理中または処理済みのイベントを処理しないことをテスト"""
+    body = json.loads(_app_mention_event()["body"])
+    event = {"worker_task": {"event_id": "Ev123456", "slack_event": body["event"]}}
+
+    response = lambda_handler(event, {})
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["message"] == "Already processed"
+    mock_start_event_work.assert_called_once_with("Ev123456")
+    mock_handle_slack_event.assert_not_called()
+    mock_process_event.assert_not_called()
+
+
+@patch("lambda_function.handle_slack_event")
+@patch("lambda_function.save_initial_event", return_value=False)
+def test_lambda_handler_duplicate_then_retry_short_circuits(
+    mock_save_initial_event, mock_handle_slack_event
+):
+    """重複検出済みイベントの再送がネットワーク呼び出しなしで打ち切られることをテスト"""
+    mock_handle_slack_event.return_value = (
+        "C123456",
+        "U123456",
+        "こんにちは",
+        "1234567890.123456",
+    )
+
+    # 1回目：DynamoDBで重複が検出される
+    response = lambda_handler(_app_mention_event(), {})
+    assert response["headers"]["X-Slack-No-Retry"] == "1"
+
+    # 2回目：再送ヘッダー付きの配信はこのコンテナで打ち切られる
+    retry_event = _app_mention_event()
+    retry_event["headers"] = {
+        "x-slack-retry-num": "1",
+        "x-slack-retry-reason": "http_timeout",
+    }
+    response = lambda_handler(retry_event, {})
+
+    # 検証
+    assert response["statusCode"] == 200
+    assert response["headers"]["X-Slack-No-Retry"] == "1"
+    assert json.loads(response["body"])["message"] == "Retry ignored"
+    mock_handle_slack_event.assert_not_called()
+    mock_save_initial_event.assert_called_once()
+
+
+def test_import_does_not_load_heavy_dependencies():
+    """lambda_functionのimport時にAWS・Slack・HTML解析ライブラリを読み込まないことをテスト"""
+    code = (
+        "import sys, lambda_function\n"
+        "heavy = ['boto3', 'botocore', 'slack_sdk', 'bs4', 'requests']\n"
+        "print(','.join(m for m in heavy if m in sys.modules))\n"
+    )
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    result = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+@patch("dynamodb_utils.get_table")
+@patch("slack_utils.get_slack_client")
+@patch("bedrock_utils.get_bedrock_runtime")
+def test_lambda_handler_challenge_creates_no_clients(
+    mock_get_bedrock_runtime, mock_get_slack_client, mock_get_table
+):
+    """チャレンジリクエストと無視すべきイベントでクライアントを作成しないことをテスト"""
+    lambda_handler({"body": json.dumps({"challenge": "token"})}, {})
+    body = json.loads(_app_mention_event()["body"])
+    body["event"]["type"] = "message"
+    lambda_handler({"body": json.dumps(body)}, {})
+
+    mock_get_bedrock_runtime.assert_not_called()
+    mock_get_slack_client.assert_not_called()
+    mock_get_table.assert_not_called()
+
+
+@patch("lambda_function.STREAMING_RESPONSE_ENABLED", True)
+@patch("lambda_function.handle_slack_event")
+@patch("lambda_function.save_initial_event")
+@patch("lambda_function.get_thread_history")
+@patch("lambda_function.stream_claude_model")
+@patch("lambda_function.StreamingMessage")
+@patch("lambda_function.update_event")
+@patch("slack_utils.get_bot_user_id", return_value="UBOT")
+def test_lambda_handler_streaming_response(
+    mock_get_bot_user_id,
+    mock_update_event,
+    mock_streaming_message,
+    mock_stream_claude_model,
+    mock_get_thread_history,
+    mock_save_initial_event,
+    mock_handle_slack_event,
+):
+    """ストリーミングモードで出力を順にSlackへ書き込み、全文をDynamoDBに保存することをテスト"""
+    # モックの設定
+    mock_handle_slack_event.return_value = (
+        "C123456",
+        "U123456",
+        "こんにちは",
+        "1234567890.123456",
+    )
+    mock_save_initial_event.return_value = True
+    mock_get_thread_history.return_value = [{"text": "こんにちは"}]
+    mock_stream_claude_model.return_value = iter(["AIからの", "応答"])
+    writer = mock_streaming_message.return_value
+
+    # 関数の実行
+    response = lambda_handler(_app_mention_event(), {})
+
+    # 検証
+    assert response["statusCode"] == 200
+    mock_streaming_message.assert_called_once_with("C123456", "1234567890.123456")
+    writer.start.assert_called_once()
+    assert [c.args[0] for c in writer.append.call_args_list] == ["AIからの", "応答"]
+    writer.finish.assert_called_once()
+    mock_update_event.assert_called_once_with("Ev123456", "AIからの応答")
+
+
+@patch("lambda_function.STREAMING_RESPONSE_ENABLED", True)
+@patch("lambda_function.handle_slack_event")
+@patch("lambda_function.save_initial_event")
+@patch("lambda_function.get_thread_history")
+@patch("lambda_function.stream_claude_model")
+@patch("lambda_function.StreamingMessage")
+@patch("lambda_function.send_slack_message")
+@patch("lambda_function.update_event")
+@patch("slack_utils.get_bot_user_id", return_value="UBOT")
+def test_lambda_handler_streaming_error_marks_message(
+    mock_get_bot_user_id,
+    mock_update_event,
+    mock_send_slack_message,
+    mock_streaming_message,
+    mock_stream_claude_model,
+    mock_get_thread_history,
+    mock_save_initial_event,
+    mock_handle_slack_event,
+):
+    """ストリーミング中にエラーが発生した場合、表示中のメッセージに中断を記録することをテスト"""
+    # モックの設定
+    mock_handle_slack_event.return_value = (
+        "C123456",
+        "U123456",
+        "こんにちは",
+        "1234567890.123456",
+    )
+    mock_save_initial_event.return_value = True
+    mock_get_thread_history.return_value = [{"text": "こんにちは"}]
+    mock_stream_claude_model.side_effect = Exception("stream error")
+    writer = mock_streaming_message.return_value
+
+    # 関数の実行
+    response = lambda_handler(_app_mention_event(), {})
+
+    # 検証
+    assert response["statusCode"] == 500
+    writer.fail.assert_called_once()
+    mock_update_event.assert_not_called()
+    mock_send_slack_message.assert_called_once()
+
+
+@patch("lambda_function.THREAD_LEASE_ENABLED", True)
+@patch("lambda_function.save_event_message")
+@patch(
+    "lambda_function.get_event_message",
+    side_effect=lambda event_id: f"{event_id}の質問",
+)
+@patch("lambda_function.acquire_thread_lease", return_value=True)
+@patch("lambda_function.release_thread_lease")
+@patch("lambda_function.generate_reply")
+def test_process_event_coalesces_pending_mentions(
+    mock_generate_reply,
+    mock_release_thread_lease,
+    mock_acquire_thread_lease,
+    mock_get_event_message,
+    mock_save_event_message,
+):
+    """リースの保持中に届いたメンションを、記録から読み込んだ最新のメッセージへの1回の応答にまとめることをテスト"""
+    # モックの設定
+    mock_release_thread_lease.side_effect = [
+        [{"event_id": "Ev2"}, {"event_id": "Ev3"}],
+        [],
+    ]
+
+    # 関数の実行
+    process_event("C123456", "質問1", "1234567890.123456", "Ev1")
+
+    # 検証
+    assert [c.args for c in mock_generate_reply.call_args_list] == [
+        ("C123456", "質問1", "1234567890.123456", ["Ev1"]),
+        ("C123456", "Ev3の質問", "1234567890.123456", ["Ev2", "Ev3"]),
+    ]
+    assert mock_release_thread_lease.call_count == 2
+    mock_save_event_message.assert_called_once_with("Ev1", "質問1")
+    mock_acquire_thread_lease.assert_called_once_with(
+        "C123456", "1234567890.123456", "Ev1"
+    )
+
+
+@patch("lambda_function.THREAD_LEASE_ENABLED", True)
+@patch("lambda_function.save_event_message")
+@patch("lambda_function.acquire_thread_lease", return_value=False)
+@patch("lambda_function.generate_reply")
+def test_process_event_queued_mention_returns(
+    mock_generate_reply, mock_acquire_thread_lease, mock_save_event_message
+):
+    """他のイベントが応答中の場合は、メッセージを記録して応答を生成せずに終了することをテスト"""
+    # 関数の実行
+    process_event("C123456", "質問2", "1234567890.123456", "Ev2")
+
+    # 検証
+    mock_generate_reply.assert_not_called()
+    mock_save_event_message.assert_called_once_with("Ev2", "質問2")
+
+
+@patch("lambda_function.THREAD_LEASE_ENABLED", True)
+@patch("lambda_function.save_event_message")
+@patch("lambda_function.fail_event")
+@patch("lambda_function.acquire_thread_lease", return_value=True)
+@patch("lambda_function.abandon_thread_lease", return_value=[{"event_id": "Ev2"}])
+@patch("lambda_function.generate_reply", side_effect=Exception("error"))
+def test_process_event_error_abandons_lease(
+    mock_generate_reply,
+    mock_abandon_thread_lease,
+    mock_acquire_thread_lease,
+    mock_fail_event,
+    mock_save_event_message,
+):
+    """応答の生成に失敗した場合はリースを削除し、保留中のメンションを失敗として記録することをテスト"""
+    with pytest.raises(Exception):
+        process_event("C123456", "質問1", "1234567890.123456", "Ev1")
+
+    mock_abandon_thread_lease.assert_called_once_with(
+        "C123456", "1234567890.123456", "Ev1"
+    )
+    mock_fail_event.assert_called_once_with("Ev2", "error")
+
+
+@patch("lambda_function.THREAD_LEASE_ENABLED", True)
+@patch("lambda_function.save_event_message")
+@patch("lambda_function.fail_event")
+@patch("lambda_function.get_event_message", return_value="質問2")
+@patch("lambda_function.acquire_thread_lease", return_value=True)
+@patch("lambda_function.release_thread_lease", return_value=[{"event_id": "Ev2"}])
+@patch("lambda_function.abandon_thread_lease", return_value=[{"event_id": "Ev3"}])
+@patch("lambda_function.generate_reply", side_effect=[None, Exception("error")])
+def test_process_event_error_fails_coalesced_mentions(
+    mock_generate_reply,
+    mock_abandon_thread_lease,
+    mock_release_thread_lease,
+    mock_acquire_thread_lease,
+    mock_get_event_message,
+    mock_fail_event,
+    mock_save_event_message,
+):
+    """まとめた応答の生成に失敗した場合、取り出し済みと保留中のメンションを失敗として記録することをテスト"""
+    with pytest.raises(Exception):
+        process_event("C123456", "質問1", "1234567890.123456", "Ev1")
+
+    assert [c.args[0] for c in mock_fail_event.call_args_list] == ["Ev2", "Ev3"]
+
+
+@patch("lambda_function.handle_response")
+@patch("lambda_function.update_event")
+@patch("lambda_function.process_conversation", return_value="まとめた応答")
+@patch("lambda_function.get_thread_history", return_value=[{"text": "質問3"}])
+def test_generate_reply_records_all_events(
+    mock_get_thread_history,
+    mock_process_conversation,
+    mock_update_event,
+    mock_handle_response,
+):
+    """まとめて処理したすべてのイベントに応答を記録することをテスト"""
+    # 関数の実行
+    generate_reply("C123456", "質問3", "1234567890.123456", ["Ev2", "Ev3"])
+
+    # 検証
+    mock_handle_response.assert_called_once_with(
+        "C123456", "1234567890.123456", "まとめた応答", "Ev2"
+    )
+    mock_update_event.assert_called_once_with("Ev3", "まとめた応答")
+
+
+@patch("lambda_function.send_slack_message")
+def test_notify_error_busy_message(mock_send_slack_message):
+    """Bedrockが混雑している場合は、時間をおいて再度依頼するよう案内することをテスト"""
+    from lambda_function import notify_error, BUSY_MESSAGE
+    from rate_limit_utils import BedrockBusyError
+
+    # 関数の実行
+    notify_error("C123456", "1234567890.123456", BedrockBusyError("busy"))
+
+    # 検証
+    mock_send_slack_message.assert_called_once_with(
+        "C123456", BUSY_MESSAGE, "1234567890.123456"
+    )
+
+
+@patch("lambda_function.MODEL_ROUTING_ENABLED", True)
+@patch("bedrock_utils.get_input_token_budget", return_value=100000)
+@patch("lambda_function.handle_response")
+@patch("lambda_function.update_event")
+@patch("lambda_function.invoke_claude_model", return_value="応答")
+@patch("lambda_function.get_thread_history", return_value=[{"text": "こんにちは"}])
+def test_generate_reply_routes_model(
+    mock_get_thread_history,
+    mock_invoke_claude_model,
+    mock_update_event,
+    mock_handle_response,
+    mock_get_input_token_budget,
+):
+    """振り分けが有効な場合、短いメッセージを軽量なモデルで処理することをテスト"""
+    from config import MODEL_TIERS
+
+    # 関数の実行
+    generate_reply("C123456", "こんにちは", "1234567890.123456", ["Ev1"])
+
+    # 検証
+    call_kwargs = mock_invoke_claude_model.call_args.kwargs
+    assert call_kwargs["model_id"] == MODEL_TIERS["light"]["model_id"]
+    assert call_kwargs["max_tokens"] == MODEL_TIERS["light"]["max_tokens"]
+    # 入力トークンの上限も振り分けたモデルと最大出力トークン数で決める
+    mock_get_input_token_budget.assert_called_once_with(
+        MODEL_TIERS["light"]["model_id"], MODEL_TIERS["light"]["max_tokens"]
+    )
+
+
+@patch("lambda_function.URL_SUMMARY_CACHE_ENABLED", True)
+@patch("lambda_function.handle_response")
+@patch("lambda_function.invoke_claude_model", return_value="ページの要約")
+@patch("lambda_function.get_url_content", return_value=("題名", "本文"))
+@patch("lambda_function.get_thread_history", return_value=[{"text": "URL"}])
+@patch("cache_utils.put_state")
+@patch("cache_utils.get_state", return_value=None)
+def test_generate_reply_reuses_url_summary(
+    mock_get_state,
+    mock_put_state,
+    mock_get_thread_history,
+    mock_get_url_content,
+    mock_invoke_claude_model,
+    mock_handle_response,
+):
+    """URLのみのメッセージでは、同じページの要約を別のスレッドでも再利用することをテスト"""
+    # 関数の実行
+    generate_reply("C1", "<https://example.com/>", "1111.0001", ["Ev1"])
+    generate_reply("C2", "<https://example.com/>", "2222.0001", ["Ev2"])
+
+    # 検証
+    mock_invoke_claude_model.assert_called_once()
+    mock_handle_response.assert_called_with("C2", "2222.0001", "ページの要約", "Ev2")
+
+
+@patch("lambda_function.URL_SUMMARY_CACHE_ENABLED", True)
+@patch("lambda_function.save_url_summary")
+@patch("lambda_function.get_url_summary", return_value="ページの要約")
+@patch("lambda_function.handle_response")
+@patch("lambda_function.invoke_claude_model", return_value="続きの回答")
+@patch("lambda_function.get_url_content", return_value=("題名", "本文"))
+@patch("lambda_function.get_thread_history")
+@patch("slack_utils.get_bot_user_id", return_value="UBOT")
+def test_generate_reply_skips_url_summary_in_conversation(
+    mock_get_bot_user_id,
+    mock_get_thread_history,
+    mock_get_url_content,
+    mock_invoke_claude_model,
+    mock_handle_response,
+    mock_get_url_summary,
+    mock_save_url_summary,
+):
+    """前の会話があるスレッドでは、URLの要約を再利用も保存もしないことをテスト"""
+    # モックの設定
+    mock_get_thread_history.return_value = [
+        {"text": "この記事について聞きたい"},
+        {"text": "どうぞ", "bot_id": "B123"},
+        {"text": "URL"},
+    ]
+
+    # 関数の実行
+    generate_reply("C1", "<https://example.com/>", "1111.0001", ["Ev1"])
+
+    # 検証
+    mock_get_url_summary.assert_not_called()
+    mock_save_url_summary.assert_not_called()
+    mock_invoke_claude_model.assert_called_once()
+    mock_handle_response.assert_called_once_with(
+        "C1", "1111.0001", "続きの回答", "Ev1"
+    )
+
+
+@patch("lambda_function.URL_SUMMARY_CACHE_ENABLED", True)
+@patch("lambda_function.get_url_summary", return_value="ページの要約")
+@patch("lambda_function.handle_response")
+@patch("lambda_function.invoke_claude_model")
+@patch("lambda_function.get_url_content", return_value=("題名", "本文"))
+@patch("lambda_function.get_thread_history")
+@patch("slack_utils.get_bot_user_id", return_value="UBOT")
+def test_generate_reply_url_summary_respects_response_limit(
+    mock_get_bot_user_id,
+    mock_get_thread_history,
+    mock_get_url_content,
+    mock_invoke_claude_model,
+    mock_handle_response,
+    mock_get_url_summary,
+):
+    """応答数の上限に達したスレッドでは、URLの要約があっても上限のメッセージを返すことをテスト"""
+    # モックの設定
+    history = []
+    for i in range(50):
+        history.append({"text": f"質問{i}"})
+        history.append({"text": f"回答{i}", "bot_id": "B123"})
+    mock_get_thread_history.return_value = history + [{"text": "URL"}]
+
+    # 関数の実行
+    generate_reply("C1", "<https://example.com/>", "1111.0001", ["Ev1"])
+
+    # 検証
+    mock_get_url_summary.assert_not_called()
+    mock_invoke_claude_model.assert_not_called()
+    mock_handle_response.assert_called_once_with(
+        "C1", "1111.0001", RESPONSE_LIMIT_MESSAGE, "Ev1"
+    )
+
+
+@patch("lambda_function.flush_metrics")
+@patch("lambda_function.process_event")
+@patch("lambda_function.save_initial_event", return_value=True)
+@patch("lambda_function.handle_slack_event")
+def test_lambda_handler_flushes_metrics(
+    mock_handle_slack_event,
+    mock_save_initial_event,
+    mock_process_event,
+    mock_flush_metrics,
+):
+    """処理の終了時に処理段階ごとのメトリクスを出力することをテスト"""
+    # モックの設定
+    mock_handle_slack_event.return_value = (
+        "C123456",
+        "U123456",
+        "こんにちは",
+        "1234567890.123456",
+    )
+
+    # 関数の実行
+    response = lambda_handler(_app_mention_event(), None)
+
+    # 検証
+    assert response["statusCode"] == 200
+    mock_flush_metrics.assert_called_once_with("sync")
@@ -0,0 +1,96 @@
+import json
+import logging
+from unittest.mock import patch
+import log_utils
+from log_utils import (
+    log_event,
+    render_payload,
+    measure_chars,
+    truncate_value,
+    begin_invocation,
+    Payload,
+)
+
+
+def test_render_payload_size():
+    """size の場合は文字数のみを出力することをテスト"""
+    assert render_payload("あいう", "size") == {"chars": 3}
+
+
+@patch("log_utils.LOG_PREVIEW_CHARS", 5)
+def test_render_payload_preview():
+    """preview の場合は上限までの先頭部分と文字数を出力することをテスト"""
+    # 関数の実行
+    short = render_payload("abc", "preview")
+    long = render_payload("a" * 100, "preview")
+    messages = render_payload([{"text": "x" * 100}], "preview")
+
+    # 検証
+    assert short == "abc"
+    assert long == {"chars": 100, "preview": "aaaaa"}
+    assert messages["chars"] == 104
+    assert len(messages["preview"]) == 5
+
+
+def test_measure_chars():
+    """入れ子になった値の文字数を数えることをテスト"""
+    assert measure_chars({"text": "abc", "files": ["de", 12]}) == 4 + 3 + 5 + 2 + 2
+
+
+def test_truncate_value_limits_items():
+    """上限を超える要素を切り詰め、上限に達した後の要素を含めないことをテスト"""
+    # 関数の実行
+    result = truncate_value(["a" * 10, "b" * 10, "c" * 10], 15)
+
+    # 検証
+    assert result == ["a" * 10, "b" * 5]
+
+
+def test_log_event_skips_disabled_level(caplog):
+    """無効なログレベルでは値を文字列化しないことをテスト"""
+    # モックの設定
+    caplog.set_level(logging.INFO)
+
+    # 関数の実行
+    with patch("log_utils.render_payload") as mock_render_payload:
+        log_event(logging.DEBUG, "Bedrock response", body=Payload({"a": 1}))
+
+    # 検証
+    mock_render_payload.assert_not_called()
+    assert caplog.records == []
+
+
+@patch("log_utils.LOG_PREVIEW_CHARS", 10)
+def test_log_event_outputs_json(caplog):
+    """イベント名とフィールドを1行のJSONで出力することをテスト"""
+    # モックの設定
+    caplog.set_level(logging.INFO)
+
+    # 関数の実行
+    log_event(logging.INFO, "Thread history", messages=2, history=Payload("x" * 50))
+
+    # 検証
+    name, fields = caplog.records[0].getMessage().split(": ", 1)
+    assert name == "Thread history"
+    assert json.loads(fields) == {
+        "messages": 2,
+        "history": {"chars": 50, "preview": "x" * 10},
+    }
+
+
+@patch("log_utils.LOG_DEBUG_SAMPLE_RATE", 1.0)
+@patch("log_utils.LOG_PREVIEW_CHARS", 10)
+def test_log_event_sampled_invocation_dumps_full(caplog):
+    """抽選された呼び出しではレベルによらず全体を出力することをテスト"""
+    # モックの設定
+    caplog.set_level(logging.INFO)
+
+    # 関数の実行
+    begin_invocation()
+    log_event(logging.INFO, "AI response", response=Payload("x" * 50))
+
+    # 検証
+    assert log_utils._sampled is True
+    assert json.loads(caplog.records[-1].getMessage().split(": ", 1)[1]) == {
+        "response": "x" * 50
+    }
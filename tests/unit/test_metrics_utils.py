@@ -0,0 +1,95 @@
+import json
+from unittest.mock import patch
+from metrics_utils import (
+    timed,
+    add_count,
+    record_stage,
+    get_metrics,
+    flush_metrics,
+    to_metric_name,
+)
+
+
+@patch("metrics_utils.time.perf_counter", side_effect=[1.0, 1.5, 2.0, 2.25])
+def test_timed_accumulates(mock_perf_counter):
+    """同じ処理段階の時間を合計することをテスト"""
+    # 関数の実行
+    with timed("dynamodb"):
+        pass
+    with timed("dynamodb"):
+        pass
+
+    # 検証
+    stages, counts = get_metrics()
+    assert stages == {"dynamodb": 750.0}
+
+
+def test_timed_as_decorator():
+    """関数のデコレーターとして使えることをテスト"""
+
+    @timed("thread_history")
+    def fetch():
+        return "履歴"
+
+    # 関数の実行
+    result = fetch()
+
+    # 検証
+    assert result == "履歴"
+    assert "thread_history" in get_metrics()[0]
+
+
+def test_add_count_ignores_zero():
+    """0の件数は記録しないことをテスト"""
+    # 関数の実行
+    add_count("files", 0)
+    add_count("files", 2)
+    add_count("files")
+    add_count("urls", 0)
+
+    # 検証
+    assert get_metrics()[1] == {"files": 3}
+
+
+@patch("metrics_utils.METRICS_ENABLED", True)
+@patch("metrics_utils.METRICS_NAMESPACE", "TestBot")
+def test_flush_metrics_emf(capsys):
+    """Embedded Metric Formatの1行のJSONを出力し、集計をリセットすることをテスト"""
+    # モックの設定
+    record_stage("thread_history", 120.04)
+    add_count("input_tokens", 1500)
+
+    # 関数の実行
+    flush_metrics("worker", event_id="Ev1")
+
+    # 検証
+    document = json.loads(capsys.readouterr().out)
+    directive = document["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == "TestBot"
+    assert directive["Dimensions"] == [["Handler"]]
+    assert {"Name": "ThreadHistoryMs", "Unit": "Milliseconds"} in directive["Metrics"]
+    assert {"Name": "InputTokens", "Unit": "Count"} in directive["Metrics"]
+    assert document["Handler"] == "worker"
+    assert document["event_id"] == "Ev1"
+    assert document["ThreadHistoryMs"] == 120.0
+    assert document["InputTokens"] == 1500
+    assert get_metrics() == ({}, {})
+
+
+@patch("metrics_utils.METRICS_ENABLED", False)
+def test_flush_metrics_disabled(capsys):
+    """無効な場合は出力しないことをテスト"""
+    # モックの設定
+    record_stage("total", 10)
+
+    # 関数の実行
+    flush_metrics("sync")
+
+    # 検証
+    assert capsys.readouterr().out == ""
+    assert get_metrics() == ({}, {})
+
+
+def test_to_metric_name():
+    """メトリクス名への変換をテスト"""
+    assert to_metric_name("first_visible_token") == "FirstVisibleToken"
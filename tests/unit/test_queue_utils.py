@@ -0,0 +1,72 @@
+import json
+from unittest.mock import patch, MagicMock
+import pytest
+from queue_utils import (
+    InProcessQueue,
+    dispatch_task,
+    is_worker_event,
+    build_worker_event,
+    set_task_queue,
+)
+
+
+@patch("queue_utils.get_lambda_client")
+def test_dispatch_task_invokes_lambda_async(mock_get_lambda_client):
+    """dispatch_task関数が自身のLambdaを非同期呼び出しすることをテスト"""
+    # モックの設定
+    mock_client = MagicMock()
+    mock_get_lambda_client.return_value = mock_client
+    context = MagicMock()
+    context.function_name = "ai_chatbot"
+
+    # 関数の実行
+    dispatch_task({"event_id": "Ev123"}, context)
+
+    # 検証
+    args, kwargs = mock_client.invoke.call_args
+    assert kwargs["FunctionName"] == "ai_chatbot"
+    assert kwargs["InvocationType"] == "Event"
+    assert json.loads(kwargs["Payload"]) == {"worker_task": {"event_id": "Ev123"}}
+
+
+@patch("queue_utils.WORKER_FUNCTION_NAME", "ai_chatbot_worker")
+@patch("queue_utils.get_lambda_client")
+def test_dispatch_task_uses_configured_worker(mock_get_lambda_client):
+    """dispatch_task関数が設定されたワーカー関数名を優先することをテスト"""
+    mock_client = MagicMock()
+    mock_get_lambda_client.return_value = mock_client
+
+    dispatch_task({"event_id": "Ev123"}, {})
+
+    args, kwargs = mock_client.invoke.call_args
+    assert kwargs["FunctionName"] == "ai_chatbot_worker"
+
+
+def test_dispatch_task_without_function_name():
+    """dispatch_task関数が送信先を特定できない場合に例外を発生させることをテスト"""
+    with pytest.raises(RuntimeError):
+        dispatch_task({"event_id": "Ev123"}, {})
+
+
+def test_in_process_queue():
+    """InProcessQueueがタスクを保持し、drainでワーカーイベントとして処理することをテスト"""
+    queue = InProcessQueue()
+    set_task_queue(queue)
+    try:
+        dispatch_task({"event_id": "Ev1"}, None)
+        dispatch_task({"event_id": "Ev2"}, None)
+    finally:
+        set_task_queue(None)
+
+    handled = []
+    results = queue.drain(lambda event, context: handled.append(event) or "done")
+
+    assert results == ["done", "done"]
+    assert [event["worker_task"]["event_id"] for event in handled] == ["Ev1", "Ev2"]
+    assert queue.tasks == []
+
+
+def test_is_worker_event():
+    """is_worker_event関数がワーカー用イベントを識別できることをテスト"""
+    assert is_worker_event(build_worker_event({"event_id": "Ev1"})) is True
+    assert is_worker_event({"body": "{}"}) is False
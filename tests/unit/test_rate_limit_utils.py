@@ -0,0 +1,161 @@
+from unittest.mock import patch
+import pytest
+from botocore.exceptions import ClientError
+from rate_limit_utils import (
+    BedrockBusyError,
+    acquire_bedrock_capacity,
+    release_bedrock_capacity,
+)
+
+CONDITIONAL_CHECK_FAILED = ClientError(
+    {"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem"
+)
+
+
+@patch("rate_limit_utils.get_table")
+def test_acquire_bedrock_capacity_disabled(mock_get_table):
+    """流量制御が無効な場合はDynamoDBにアクセスしないことをテスト"""
+    assert acquire_bedrock_capacity(1000) is None
+    mock_get_table.assert_not_called()
+
+
+@patch("rate_limit_utils.BEDROCK_ADMISSION_ENABLED", True)
+@patch("rate_limit_utils.BEDROCK_TOKENS_PER_MINUTE", 10000)
+@patch("rate_limit_utils.get_table")
+def test_acquire_bedrock_capacity_success(mock_get_table):
+    """1分間の枠と同時実行枠を確保できることをテスト"""
+    mock_table = mock_get_table.return_value
+
+    # 関数の実行
+    capacity = acquire_bedrock_capacity(3000, model_id="model")
+
+    # 検証
+    assert capacity["estimated_tokens"] == 3000
+    values = mock_table.update_item.call_args.kwargs["ExpressionAttributeValues"]
+    assert values[":tokens"] == 3000
+    assert values[":max_tokens"] == 7000
+    item = mock_table.put_item.call_args.kwargs["Item"]
+    assert item["event_id"].startswith("bedrock_slot#model#")
+
+
+@patch("rate_limit_utils.BEDROCK_ADMISSION_ENABLED", True)
+@patch("rate_limit_utils.BEDROCK_ADMISSION_MAX_WAIT_SECONDS", 1)
+@patch("rate_limit_utils.BEDROCK_ADMISSION_POLL_SECONDS", 0.4)
+@patch("rate_limit_utils.time.sleep")
+@patch("rate_limit_utils.get_table")
+def test_acquire_bedrock_capacity_waits_then_succeeds(mock_get_table, mock_sleep):
+    """1分間の枠が一杯の場合、待機して再試行することをテスト"""
+    mock_table = mock_get_table.return_value
+    mock_table.update_item.side_effect = [CONDITIONAL_CHECK_FAILED, {}]
+
+    # 関数の実行
+    capacity = acquire_bedrock_capacity(100)
+
+    # 検証
+    assert capacity is not None
+    mock_sleep.assert_called_once_with(0.4)
+
+
+@patch("rate_limit_utils.BEDROCK_ADMISSION_ENABLED", True)
+@patch("rate_limit_utils.BEDROCK_ADMISSION_MAX_WAIT_SECONDS", 0)
+@patch("rate_limit_utils.get_table")
+def test_acquire_bedrock_capacity_rate_limited(mock_get_table):
+    """1分間の枠が空かない場合にBedrockBusyErrorを送出することをテスト"""
+    mock_get_table.return_value.update_item.side_effect = CONDITIONAL_CHECK_FAILED
+
+    with pytest.raises(BedrockBusyError):
+        acquire_bedrock_capacity(100)
+
+
+@patch("rate_limit_utils.BEDROCK_ADMISSION_ENABLED", True)
+@patch("rate_limit_utils.BEDROCK_ADMISSION_MAX_WAIT_SECONDS", 0)
+@patch("rate_limit_utils.BEDROCK_MAX_CONCURRENCY", 2)
+@patch("rate_limit_utils.get_table")
+def test_acquire_bedrock_capacity_no_slot_refunds(mock_get_table):
+    """同時実行枠が空かない場合、1分間の集計を戻してBedrockBusyErrorを送出することをテスト"""
+    mock_table = mock_get_table.return_value
+    mock_table.put_item.side_effect = CONDITIONAL_CHECK_FAILED
+
+    with pytest.raises(BedrockBusyError):
+        acquire_bedrock_capacity(100)
+
+    # 検証（1回の試行では1つの枠のみに書き込む）
+    assert mock_table.put_item.call_count == 1
+    values = mock_table.update_item.call_args.kwargs["ExpressionAttributeValues"]
+    assert values == {":requests": -1, ":tokens": -100}
+
+
+@patch("rate_limit_utils.BEDROCK_ADMISSION_ENABLED", True)
+@patch("rate_limit_utils.BEDROCK_ADMISSION_MAX_WAIT_SECONDS", 5)
+@patch("rate_limit_utils.BEDROCK_ADMISSION_POLL_SECONDS", 0.5)
+@patch("rate_limit_utils.BEDROCK_MAX_CONCURRENCY", 10)
+@patch("rate_limit_utils.time.monotonic")
+@patch("rate_limit_utils.time.sleep")
+@patch("rate_limit_utils.get_table")
+def test_acquire_bedrock_capacity_saturated_writes_once_per_poll(
+    mock_get_table, mock_sleep, mock_monotonic
+):
+    """同時実行枠が埋まっている間、待機中の試行ごとの書き込みが1回であることをテスト"""
+    # モックの設定（待機した分だけ時刻を進める）
+    clock = [0.0]
+    mock_monotonic.side_effect = lambda: clock[0]
+    mock_sleep.side_effect = lambda seconds: clock.__setitem__(0, clock[0] + seconds)
+    mock_table = mock_get_table.return_value
+    mock_table.put_item.side_effect = CONDITIONAL_CHECK_FAILED
+
+    with pytest.raises(BedrockBusyError):
+        acquire_bedrock_capacity(100)
+
+    # 検証
+    assert mock_table.put_item.call_count == mock_sleep.call_count + 1
+    assert mock_table.put_item.call_count <= 11
+
+
+@patch("rate_limit_utils.BEDROCK_ADMISSION_ENABLED", True)
+@patch("rate_limit_utils.get_table")
+def test_acquire_bedrock_capacity_slot_error_refunds(mock_get_table):
+    """同時実行枠の確保でDynamoDBのエラーが発生した場合、1分間の集計を戻して許可することをテスト"""
+    mock_table = mock_get_table.return_value
+    mock_table.put_item.side_effect = ClientError(
+        {"Error": {"Code": "InternalServerError"}}, "PutItem"
+    )
+
+    # 関数の実行
+    assert acquire_bedrock_capacity(100) is None
+
+    # 検証
+    values = mock_table.update_item.call_args.kwargs["ExpressionAttributeValues"]
+    assert values == {":requests": -1, ":tokens": -100}
+
+
+@patch("rate_limit_utils.BEDROCK_ADMISSION_ENABLED", True)
+@patch("rate_limit_utils.get_table")
+def test_acquire_bedrock_capacity_fails_open(mock_get_table):
+    """DynamoDBのエラー時は制限せずに呼び出しを許可することをテスト"""
+    mock_get_table.return_value.update_item.side_effect = ClientError(
+        {"Error": {"Code": "InternalServerError"}}, "UpdateItem"
+    )
+
+    assert acquire_bedrock_capacity(100) is None
+
+
+@patch("rate_limit_utils.get_table")
+def test_release_bedrock_capacity(mock_get_table):
+    """同時実行枠を解放し、実際のトークン数との差を反映することをテスト"""
+    mock_table = mock_get_table.return_value
+    capacity = {
+        "model_id": "model",
+        "window": 100,
+        "slot": (3, "owner"),
+        "estimated_tokens": 5000,
+    }
+
+    # 関数の実行
+    release_bedrock_capacity(capacity, actual_tokens=1200)
+
+    # 検証
+    delete_kwargs = mock_table.delete_item.call_args.kwargs
+    assert delete_kwargs["Key"] == {"event_id": "bedrock_slot#model#3"}
+    assert delete_kwargs["ExpressionAttributeValues"] == {":owner": "owner"}
+    values = mock_table.update_item.call_args.kwargs["ExpressionAttributeValues"]
+    assert values == {":requests": 0, ":tokens": -3800}
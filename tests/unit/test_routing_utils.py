@@ -0,0 +1,100 @@
+from unittest.mock import patch
+from routing_utils import extract_features, route_model, matches_rule
+from config import MODEL_TIERS
+
+
+def _features(**overrides):
+    features = {
+        "message_chars": 10,
+        "attachment_chars": 0,
+        "has_attachment": False,
+        "has_url": False,
+        "has_code": False,
+        "thread_depth": 0,
+    }
+    features.update(overrides)
+    return features
+
+
+def test_extract_features():
+    """メッセージと会話履歴から特徴量を求めることをテスト"""
+    # 関数の実行
+    message = (
+        "<https://example.com> のコードを見て\n```print(1)```"
+        "\n\n添付ファイルの内容:\nファイル内容"
+    )
+    features = extract_features(message, [{"text": "1"}, {"text": "2"}])
+
+    # 検証
+    assert features["message_chars"] == len(
+        "<https://example.com> のコードを見て\n```print(1)```"
+    )
+    assert features["attachment_chars"] == len("ファイル内容")
+    assert features["has_attachment"] is True
+    assert features["has_url"] is True
+    assert features["has_code"] is True
+    assert features["thread_depth"] == 2
+
+
+def test_extract_features_ignores_url_in_attachment():
+    """添付ファイル内のURLはURLの有無として数えないことをテスト"""
+    # 関数の実行
+    features = extract_features(
+        "まとめて\n\n添付ファイルの内容:\n<https://example.com>", []
+    )
+
+    # 検証
+    assert features["has_url"] is False
+
+
+def test_matches_rule():
+    """上限・下限・一致の条件を判定することをテスト"""
+    rule = {"tier": "light", "max_message_chars": 60, "has_code": False}
+
+    # 検証
+    assert matches_rule(rule, _features(message_chars=60))
+    assert not matches_rule(rule, _features(message_chars=61))
+    assert not matches_rule(rule, _features(has_code=True))
+    assert matches_rule(
+        {"tier": "heavy", "min_thread_depth": 3}, _features(thread_depth=3)
+    )
+    assert not matches_rule({"tier": "heavy", "unknown": True}, _features())
+
+
+def test_route_model_default_rules():
+    """既定のルールで、短い雑談・質問・添付ファイル付きの依頼をそれぞれ振り分けることをテスト"""
+    # 関数の実行
+    short = route_model("C123456", _features(message_chars=10))
+    question = route_model("C123456", _features(message_chars=200))
+    attachment = route_model(
+        "C123456", _features(has_attachment=True, attachment_chars=5000)
+    )
+
+    # 検証
+    assert short["tier"] == "light"
+    assert short["model_id"] == MODEL_TIERS["light"]["model_id"]
+    assert question["tier"] == "standard"
+    assert attachment["tier"] == "heavy"
+    assert attachment["rule"] == "default"
+
+
+@patch("routing_utils.MODEL_ROUTING_CHANNEL_OVERRIDES", {"C999": "heavy"})
+def test_route_model_channel_override():
+    """チャンネルの指定がルールより優先されることをテスト"""
+    # 関数の実行
+    route = route_model("C999", _features(message_chars=10))
+
+    # 検証
+    assert route["tier"] == "heavy"
+    assert route["rule"] == "channel_override"
+    assert route["max_tokens"] == MODEL_TIERS["heavy"]["max_tokens"]
+
+
+@patch("routing_utils.MODEL_ROUTING_CHANNEL_OVERRIDES", {"C999": "unknown"})
+def test_route_model_unknown_tier():
+    """未知のティアが指定された場合は既定のティアを使うことをテスト"""
+    # 関数の実行
+    route = route_model("C999", _features())
+
+    # 検証
+    assert route["tier"] == "heavy"
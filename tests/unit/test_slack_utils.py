@@ -1,13 +1,19 @@
 from unittest.mock import patch, MagicMock
 import pytest
+from slack_sdk.errors import SlackApiError
 from slack_utils import (
     handle_slack_event,
+    get_bot_user_id,
+    ts_key,
+    expand_messages,
     get_thread_history,
     send_slack_message,
     is_text_file,
     get_file_content,
     process_files,
+    slack_length,
     split_message,
+    StreamingMessage,
 )
 
 
@@ -116,9 +122,12 @@ def test_handle_slack_event_with_files(mock_get_bot_user_id, mock_process_files)
     mock_process_files.assert_called_once_with([{"id": "F123"}, {"id": "F456"}])
 
 
-@patch("slack_utils.slack_client.conversations_replies")
-def test_get_thread_history_success(mock_conversations_replies):
+@patch("slack_utils.get_slack_client")
+def test_get_thread_history_success(mock_get_slack_client):
     """get_thread_history関数がスレッド履歴を正しく取得できることをテスト"""
+    mock_conversations_replies = (
+        mock_get_slack_client.return_value.conversations_replies
+    )
     # モックの設定
     mock_conversations_replies.return_value = {
         "messages": [
@@ -128,7 +137,7 @@ def test_get_thread_history_success(mock_conversations_replies):
     }
 
     # 関数の実行
-    with patch("slack_utils.BOT_USER_ID", "U456"):
+    with patch("slack_utils.get_bot_user_id", return_value="U456"):
         with patch("slack_utils.extract_url", return_value=None):
             messages = get_thread_history("C123", "1234567890.000000")
 
@@ -137,13 +146,16 @@ def test_get_thread_history_success(mock_conversations_replies):
     assert messages[0]["text"] == "最初のメッセージ"
     assert messages[1]["text"] == "返信1"
     mock_conversations_replies.assert_called_once_with(
-        channel="C123", ts="1234567890.000000"
+        channel="C123", ts="1234567890.000000", limit=200
     )
 
 
-@patch("slack_utils.slack_client.conversations_replies")
-def test_get_thread_history_with_url(mock_conversations_replies):
+@patch("slack_utils.get_slack_client")
+def test_get_thread_history_with_url(mock_get_slack_client):
     """get_thread_history関数がURL付きメッセージを正しく処理できることをテスト"""
+    mock_conversations_replies = (
+        mock_get_slack_client.return_value.conversations_replies
+    )
     # モックの設定
     mock_conversations_replies.return_value = {
         "messages": [
@@ -156,7 +168,7 @@ def test_get_thread_history_with_url(mock_conversations_replies):
     }
 
     # 関数の実行
-    with patch("slack_utils.BOT_USER_ID", "U456"):
+    with patch("slack_utils.get_bot_user_id", return_value="U456"):
         with patch("slack_utils.extract_url", return_value="https://example.com"):
             with patch(
                 "slack_utils.get_url_content",
@@ -172,9 +184,10 @@ def test_get_thread_history_with_url(mock_conversations_replies):
     assert "Example Content" in messages[0]["text"]
 
 
-@patch("slack_utils.slack_client.chat_postMessage")
-def test_send_slack_message_success(mock_chat_post_message):
+@patch("slack_utils.get_slack_client")
+def test_send_slack_message_success(mock_get_slack_client):
     """send_slack_message関数がメッセージを正しく送信できることをテスト"""
+    mock_chat_post_message = mock_get_slack_client.return_value.chat_postMessage
     # 関数の実行
     send_slack_message("C123", "テストメッセージ", "1234567890.123456")
 
@@ -184,9 +197,10 @@ def test_send_slack_message_success(mock_chat_post_message):
     )
 
 
-@patch("slack_utils.slack_client.chat_postMessage")
-def test_send_slack_message_error(mock_chat_post_message):
+@patch("slack_utils.get_slack_client")
+def test_send_slack_message_error(mock_get_slack_client):
     """send_slack_message関数がエラー時に例外を発生させることをテスト"""
+    mock_chat_post_message = mock_get_slack_client.return_value.chat_postMessage
     # モックの設定
     mock_chat_post_message.side_effect = Exception("API error")
 
@@ -208,10 +222,11 @@ def test_is_text_file():
     assert is_text_file({}) is False
 
 
-@patch("slack_utils.slack_client.files_info")
-@patch("slack_utils.requests.get")
-def test_get_file_content_success(mock_requests_get, mock_files_info):
+@patch("slack_utils.get_slack_client")
+@patch("slack_utils.http_get")
+def test_get_file_content_success(mock_http_get, mock_get_slack_client):
     """get_file_content関数がファイル内容を正しく取得できることをテスト"""
+    mock_files_info = mock_get_slack_client.return_value.files_info
     # モックの設定
     mock_files_info.return_value = {
         "file": {"url_private": "https://files.slack.com/file1"}
@@ -219,7 +234,7 @@ def test_get_file_content_success(mock_requests_get, mock_files_info):
     mock_response = MagicMock()
     mock_response.status_code = 200
     mock_response.text = "ファイルの内容"
-    mock_requests_get.return_value = mock_response
+    mock_http_get.return_value = mock_response
 
     # 関数の実行
     content = get_file_content("F123")
@@ -227,7 +242,7 @@ def test_get_file_content_success(mock_requests_get, mock_files_info):
     # 検証
     assert content == "ファイルの内容"
     mock_files_info.assert_called_once_with(file="F123")
-    mock_requests_get.assert_called_once()
+    mock_http_get.assert_called_once()
 
 
 @patch("slack_utils.get_file_content")
@@ -281,9 +296,588 @@ def test_split_message_long():
     assert len(result) == 4
 
 
-@patch("slack_utils.slack_client.chat_postMessage")
-def test_send_slack_message_splits_long_message(mock_chat_post_message):
+def test_split_message_counts_utf16_units():
+    """split_message関数が絵文字をSlackと同じく2文字として数えることをテスト"""
+    text = "😀" * 2000
+    assert slack_length(text) == 4000
+    result = split_message(text, limit=3000)
+    assert len(result) == 2
+    assert all(slack_length(piece) <= 3000 for piece in result)
+    assert "".join(result) == text
+
+
+def test_split_message_prefers_paragraph_boundary():
+    """split_message関数が行の途中より段落の区切りを優先して分割することをテスト"""
+    first = "\n".join(["a" * 50] * 8)
+    second = "\n".join(["b" * 50] * 8)
+    result = split_message(first + "\n\n" + second, limit=600)
+    assert result == [first, second]
+
+
+def test_split_message_keeps_list_items():
+    """split_message関数がリストの項目の前で分割することをテスト"""
+    intro = "c" * 300
+    items = "\n".join(f"- {'d' * 40}" for _ in range(10))
+    result = split_message(intro + "\n" + items, limit=400)
+    assert result[0].startswith(intro)
+    for piece in result:
+        for line in piece.split("\n")[1:]:
+            assert line.startswith("- ")
+            assert len(line) == 42
+
+
+def test_split_message_reopens_code_fence():
+    """split_message関数がコードブロックを閉じ、次のメッセージで同じ言語指定で開き直すことをテスト"""
+    code = "\n".join(f"print({i})" for i in range(100))
+    text = f"説明\n```python\n{code}\n```\n以上です"
+    result = split_message(text, limit=300)
+    assert len(result) > 1
+    for piece in result:
+        assert slack_length(piece) <= 300
+        fences = [line for line in piece.split("\n") if line.startswith("```")]
+        assert len(fences) % 2 == 0
+    for piece in result[1:-1]:
+        assert piece.startswith("```python\n")
+    body = "\n".join(
+        line
+        for piece in result
+        for line in piece.split("\n")
+        if line.startswith("print(")
+    )
+    assert body == code
+
+
+@patch("slack_utils.get_slack_client")
+def test_send_slack_message_splits_long_message(mock_get_slack_client):
     """send_slack_message関数が長いメッセージを分割して送信することをテスト"""
+    mock_chat_post_message = mock_get_slack_client.return_value.chat_postMessage
     text = "a" * 5000
     send_slack_message("C123", text, "123.456")
     assert mock_chat_post_message.call_count == 2
+
+
+@patch("slack_utils.get_slack_client")
+def test_get_bot_user_id_cached(mock_get_slack_client):
+    """get_bot_user_id関数がauth.testを1度だけ呼び出し、結果をキャッシュすることをテスト"""
+    mock_auth_test = mock_get_slack_client.return_value.auth_test
+    mock_auth_test.return_value = {"user_id": "UBOT"}
+
+    assert get_bot_user_id() == "UBOT"
+    assert get_bot_user_id() == "UBOT"
+
+    mock_auth_test.assert_called_once()
+
+
+@patch("slack_utils.SLACK_BOT_USER_ID", "UENV")
+@patch("slack_utils.get_slack_client")
+def test_get_bot_user_id_env_override(mock_get_slack_client):
+    """環境変数でボットのユーザーIDが指定されている場合にauth.testを呼ばないことをテスト"""
+    mock_auth_test = mock_get_slack_client.return_value.auth_test
+    assert get_bot_user_id() == "UENV"
+    mock_auth_test.assert_not_called()
+
+
+@patch("slack_utils.BOT_IDENTITY_PERSIST_ENABLED", True)
+@patch("slack_utils.put_state")
+@patch("slack_utils.get_state")
+@patch("slack_utils.get_slack_client")
+def test_get_bot_user_id_persisted(
+    mock_get_slack_client, mock_get_state, mock_put_state
+):
+    """DynamoDBに保存済みのボットのユーザーIDを再利用することをテスト"""
+    mock_auth_test = mock_get_slack_client.return_value.auth_test
+    mock_get_state.return_value = {"bot_user_id": "UDDB"}
+
+    assert get_bot_user_id() == "UDDB"
+
+    mock_auth_test.assert_not_called()
+    mock_put_state.assert_not_called()
+    args, kwargs = mock_get_state.call_args
+    assert args[0].startswith("bot_identity#")
+    assert "test-slack-token" not in args[0]
+
+
+@patch("slack_utils.BOT_IDENTITY_PERSIST_ENABLED", True)
+@patch("slack_utils.put_state")
+@patch("slack_utils.get_state", return_value=None)
+@patch("slack_utils.get_slack_client")
+def test_get_bot_user_id_persists_resolved_id(
+    mock_get_slack_client, mock_get_state, mock_put_state
+):
+    """auth.testで解決したボットのユーザーIDをDynamoDBに保存することをテスト"""
+    mock_auth_test = mock_get_slack_client.return_value.auth_test
+    mock_auth_test.return_value = {"user_id": "UBOT"}
+
+    assert get_bot_user_id() == "UBOT"
+
+    args, kwargs = mock_put_state.call_args
+    assert args[1] == {"bot_user_id": "UBOT"}
+
+
+@patch("slack_utils.get_slack_client")
+def test_get_bot_user_id_error_not_cached(mock_get_slack_client):
+    """auth.testが失敗した場合は結果をキャッシュせず、次回再試行することをテスト"""
+    mock_auth_test = mock_get_slack_client.return_value.auth_test
+    mock_auth_test.side_effect = [
+        SlackApiError("error", {"ok": False}),
+        {"user_id": "UBOT"},
+    ]
+
+    assert get_bot_user_id() is None
+    assert get_bot_user_id() == "UBOT"
+
+
+@patch("slack_utils.get_file_content")
+def test_process_files_uses_cache(mock_get_file_content):
+    """process_files関数が同じファイル・同じ更新日時の内容を再取得しないことをテスト"""
+    mock_get_file_content.side_effect = ["内容1", "内容2"]
+    file = {"id": "F123", "name": "a.txt", "mimetype": "text/plain", "updated": 1}
+
+    first = process_files([file])
+    second = process_files([file])
+    updated = process_files([dict(file, updated=2)])
+
+    assert first == second
+    assert "内容1" in first[0]
+    assert "内容2" in updated[0]
+    assert mock_get_file_content.call_count == 2
+
+
+@patch("url_utils.http_get")
+@patch("slack_utils.get_slack_client")
+def test_get_thread_history_url_cached(mock_get_slack_client, mock_http_get):
+    """get_thread_history関数が同じURLの内容をURLの内容のキャッシュから展開することをテスト"""
+    mock_conversations_replies = (
+        mock_get_slack_client.return_value.conversations_replies
+    )
+    mock_conversations_replies.side_effect = lambda **kwargs: {
+        "messages": [
+            {"ts": "1.0", "user": "U123", "text": "<https://example.com/a>"},
+            {"ts": "1.1", "user": "U123", "text": "<https://EXAMPLE.com/a#x>"},
+        ]
+    }
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.headers = {"Content-Type": "text/html; charset=utf-8"}
+    mock_response.iter_content.return_value = [
+        b"<html><head><title>Title</title></head><body>Content</body></html>"
+    ]
+    mock_http_get.return_value = mock_response
+
+    with patch("slack_utils.get_bot_user_id", return_value="U456"):
+        get_thread_history("C123", "1.0")
+        # 1回目は2つのURLを並行して取得するため、両方がキャッシュ前に取得されうる
+        first_count = mock_http_get.call_count
+        messages = get_thread_history("C123", "1.0")
+
+    assert "Content" in messages[1]["text"]
+    assert mock_http_get.call_count == first_count
+
+
+@patch("url_utils.http_get")
+def test_expand_messages_unsupported_content_not_cached(mock_http_get):
+    """テキスト以外のURLの結果（Unsupported content）をキャッシュせず、毎回確認することをテスト"""
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.headers = {"Content-Type": "application/pdf"}
+    mock_http_get.return_value = mock_response
+
+    first = [{"text": "<https://example.com/file.pdf>"}]
+    second = [{"text": "<https://example.com/file.pdf>"}]
+    expand_messages(first)
+    expand_messages(second)
+
+    assert "application/pdf" in second[0]["text"]
+    assert mock_http_get.call_count == 2
+
+
+@patch("slack_utils.get_bot_user_id", return_value="U456")
+@patch("slack_utils.get_slack_client")
+def test_get_thread_history_paginates(mock_get_slack_client, mock_get_bot_user_id):
+    """get_thread_history関数がカーソルを辿って全ページを取得することをテスト"""
+    mock_conversations_replies = (
+        mock_get_slack_client.return_value.conversations_replies
+    )
+    mock_conversations_replies.side_effect = [
+        {
+            "messages": [
+                {"ts": "1.000001", "user": "U123", "text": "親"},
+                {"ts": "1.000002", "user": "U123", "text": "返信1"},
+            ],
+            "has_more": True,
+            "response_metadata": {"next_cursor": "cursor1"},
+        },
+        {
+            "messages": [
+                {"ts": "1.000001", "user": "U123", "text": "親"},
+                {"ts": "1.000003", "user": "U123", "text": "返信2"},
+            ],
+            "has_more": False,
+            "response_metadata": {"next_cursor": ""},
+        },
+    ]
+
+    messages = get_thread_history("C123", "1.000001")
+
+    # 検証：親メッセージの重複が除かれ、全ページが順に結合される
+    assert [m["text"] for m in messages] == ["親", "返信1", "返信2"]
+    second_call = mock_conversations_replies.call_args_list[1]
+    assert second_call.kwargs["cursor"] == "cursor1"
+
+
+@patch("slack_utils.THREAD_HISTORY_INCREMENTAL", True)
+@patch("slack_utils.expand_messages")
+@patch("slack_utils.get_bot_user_id", return_value="U456")
+@patch("slack_utils.get_slack_client")
+def test_get_thread_history_incremental(
+    mock_get_slack_client, mock_get_bot_user_id, mock_expand_messages
+):
+    """2回目以降は前回のts以降のメッセージのみを取得・展開することをテスト"""
+    mock_conversations_replies = (
+        mock_get_slack_client.return_value.conversations_replies
+    )
+    mock_conversations_replies.side_effect = [
+        {
+            "messages": [
+                {"ts": "1.000001", "user": "U123", "text": "親", "reply_count": 1},
+                {"ts": "1.000002", "user": "U456", "text": "回答"},
+            ]
+        },
+        {
+            "messages": [
+                {"ts": "1.000001", "user": "U123", "text": "親", "reply_count": 2},
+                {"ts": "1.000002", "user": "U456", "text": "回答"},
+                {"ts": "1.000003", "user": "U123", "text": "追加の質問"},
+            ]
+        },
+    ]
+
+    get_thread_history("C123", "1.000001")
+    messages = get_thread_history("C123", "1.000001")
+
+    # 検証：最新のボットのメッセージから取得し、それ以降のみを結合する
+    assert [m["text"] for m in messages] == ["親", "回答", "追加の質問"]
+    second_call = mock_conversations_replies.call_args_list[1]
+    assert second_call.kwargs["oldest"] == "1.000002"
+    assert second_call.kwargs["inclusive"] is True
+    # 展開はユーザーの新しいメッセージのみが対象
+    expanded = [call.args[0] for call in mock_expand_messages.call_args_list]
+    assert [[m["text"] for m in msgs] for msgs in expanded] == [["親"], ["追加の質問"]]
+
+
+def _replies(*messages):
+    return {"messages": [dict(message) for message in messages]}
+
+
+PARENT = {"ts": "1.000001", "user": "U123", "text": "親", "reply_count": 1}
+ANSWER = {"ts": "1.000002", "user": "U456", "text": "回答"}
+
+
+@patch("slack_utils.THREAD_HISTORY_INCREMENTAL", True)
+@patch("slack_utils.get_bot_user_id", return_value="U456")
+@patch("slack_utils.get_slack_client")
+def test_get_thread_history_refetches_edited_bot_message(
+    mock_get_slack_client, mock_get_bot_user_id
+):
+    """最新のボットのメッセージが編集されていれば、スレッド全体を取得し直すことをテスト"""
+    mock_conversations_replies = (
+        mock_get_slack_client.return_value.conversations_replies
+    )
+    edited = dict(ANSWER, text="編集後の回答", edited={"ts": "2.000000"})
+    mock_conversations_replies.side_effect = [
+        _replies(PARENT, ANSWER),
+        _replies(PARENT, edited),
+        _replies(PARENT, edited),
+    ]
+
+    get_thread_history("C123", "1.000001")
+    messages = get_thread_history("C123", "1.000001")
+
+    # 検証
+    assert [m["text"] for m in messages] == ["親", "編集後の回答"]
+    assert "oldest" not in mock_conversations_replies.call_args_list[2].kwargs
+
+
+@patch("slack_utils.THREAD_HISTORY_INCREMENTAL", True)
+@patch("slack_utils.get_bot_user_id", return_value="U456")
+@patch("slack_utils.get_slack_client")
+def test_get_thread_history_refetches_after_deletion(
+    mock_get_slack_client, mock_get_bot_user_id
+):
+    """返信数が保持した履歴と合わなければ（削除があれば）全体を取得し直すことをテスト"""
+    mock_conversations_replies = (
+        mock_get_slack_client.return_value.conversations_replies
+    )
+    question = {"ts": "1.000003", "user": "U123", "text": "質問"}
+    mock_conversations_replies.side_effect = [
+        _replies(dict(PARENT, reply_count=2), ANSWER, question),
+        _replies(dict(PARENT, reply_count=1), ANSWER),
+        _replies(dict(PARENT, reply_count=1), ANSWER),
+    ]
+
+    get_thread_history("C123", "1.000001")
+    messages = get_thread_history("C123", "1.000001")
+
+    # 検証
+    assert [m["text"] for m in messages] == ["親", "回答"]
+    assert mock_conversations_replies.call_count == 3
+
+
+@patch("slack_utils.THREAD_HISTORY_INCREMENTAL", True)
+@patch("slack_utils.get_bot_user_id", return_value="U456")
+@patch("slack_utils.get_slack_client")
+def test_get_thread_history_skips_streaming_reply(
+    mock_get_slack_client, mock_get_bot_user_id
+):
+    """生成中の応答を含む履歴は保持せず、次回も全体を取得することをテスト"""
+    mock_conversations_replies = (
+        mock_get_slack_client.return_value.conversations_replies
+    )
+    placeholder = dict(ANSWER, text="回答を生成しています...")
+    mock_conversations_replies.side_effect = lambda **kwargs: _replies(
+        PARENT, placeholder
+    )
+
+    get_thread_history("C123", "1.000001")
+    get_thread_history("C123", "1.000001")
+
+    # 検証
+    for call in mock_conversations_replies.call_args_list:
+        assert "oldest" not in call.kwargs
+
+
+@patch("slack_utils.THREAD_HISTORY_INCREMENTAL", False)
+@patch("slack_utils.get_bot_user_id", return_value="U456")
+@patch("slack_utils.get_slack_client")
+def test_get_thread_history_full_mode(mock_get_slack_client, mock_get_bot_user_id):
+    """インクリメンタルモードが無効の場合は毎回スレッド全体を取得することをテスト"""
+    mock_conversations_replies = (
+        mock_get_slack_client.return_value.conversations_replies
+    )
+    mock_conversations_replies.side_effect = lambda **kwargs: {
+        "messages": [{"ts": "1.000001", "user": "U123", "text": "親"}]
+    }
+
+    get_thread_history("C123", "1.000001")
+    get_thread_history("C123", "1.000001")
+
+    for call in mock_conversations_replies.call_args_list:
+        assert "oldest" not in call.kwargs
+
+
+def test_ts_key():
+    """ts_key関数がSlackのtsを数値として比較できる形に変換することをテスト"""
+    assert ts_key("1234567890.000010") > ts_key("1234567890.000009")
+    assert ts_key("1234567891.000000") > ts_key("1234567890.999999")
+
+
+@patch("slack_utils.get_slack_client")
+@patch("slack_utils.http_get")
+def test_get_file_content_timeout(mock_http_get, mock_get_slack_client):
+    """get_file_content関数が通信エラー時にNoneを返すことをテスト"""
+    import requests
+
+    mock_get_slack_client.return_value.files_info.return_value = {
+        "file": {"url_private": "https://files.slack.com/file1"}
+    }
+    mock_http_get.side_effect = requests.Timeout("timed out")
+
+    assert get_file_content("F123") is None
+
+
+@patch("slack_utils.get_url_content")
+@patch("slack_utils.get_file_content")
+def test_expand_messages_keeps_order(mock_get_file_content, mock_get_url_content):
+    """expand_messages関数が並行取得した結果を元のメッセージ・ファイル順に展開することをテスト"""
+    import time
+
+    def slow_file(file_id):
+        # 先に依頼したファイルほど遅く完了させる
+        time.sleep({"F1": 0.05, "F2": 0.02, "F3": 0.0}[file_id])
+        return f"{file_id}の内容"
+
+    mock_get_file_content.side_effect = slow_file
+    mock_get_url_content.side_effect = [Exception("URL取得エラー")]
+    messages = [
+        {
+            "text": "1通目",
+            "files": [
+                {"id": "F1", "name": "a.txt", "mimetype": "text/plain"},
+                {"id": "F2", "name": "b.txt", "mimetype": "text/plain"},
+            ],
+        },
+        {
+            "text": "2通目 <https://example.com>",
+            "files": [{"id": "F3", "name": "c.txt", "mimetype": "text/plain"}],
+        },
+    ]
+
+    expand_messages(messages)
+
+    # 検証
+    first = messages[0]["text"]
+    assert first.index("F1の内容") < first.index("F2の内容")
+    assert "F3の内容" in messages[1]["text"]
+    assert "URL内容取得を試みましたが、失敗しました" in messages[1]["text"]
+    assert "URL取得エラー" in messages[1]["text"]
+
+
+@patch("slack_utils.get_url_content", return_value=("題名", "本文"))
+@patch("slack_utils.get_file_content", return_value="内容")
+def test_expand_messages_records_fetch_metrics(
+    mock_get_file_content, mock_get_url_content
+):
+    """スレッド履歴の展開でも、ファイル・URLの取得件数と時間を記録することをテスト"""
+    from metrics_utils import begin_metrics, get_metrics
+
+    begin_metrics()
+    messages = [
+        {
+            "text": "1通目 <https://example.com>",
+            "files": [
+                {"id": "F1", "name": "a.txt", "mimetype": "text/plain"},
+                {"id": "F2", "name": "b.txt", "mimetype": "text/plain"},
+            ],
+        },
+        {"text": "2通目"},
+    ]
+
+    expand_messages(messages)
+
+    # 検証
+    stages, counts = get_metrics()
+    assert counts == {"files": 2, "urls": 1}
+    assert "file_download" in stages
+    assert "url_fetch" in stages
+
+
+@patch("slack_utils.time.monotonic")
+@patch("slack_utils.get_slack_client")
+def test_streaming_message_throttles_updates(mock_get_slack_client, mock_monotonic):
+    """StreamingMessageが最初の出力はすぐに表示し、以降は一定間隔で更新することをテスト"""
+    # モックの設定
+    mock_client = mock_get_slack_client.return_value
+    mock_client.chat_postMessage.return_value = {"ts": "100.000001"}
+    mock_monotonic.return_value = 10.0
+
+    # 関数の実行
+    writer = StreamingMessage("C123456", "1234567890.123456", interval=1.0)
+    writer.start()
+    writer.append("こん")
+    mock_monotonic.return_value = 10.5
+    writer.append("にちは")
+    mock_monotonic.return_value = 11.2
+    writer.append("、")
+    writer.finish()
+
+    # 検証
+    mock_client.chat_postMessage.assert_called_once()
+    texts = [c.kwargs["text"] for c in mock_client.chat_update.call_args_list]
+    assert texts == ["こん", "こんにちは、"]
+    assert writer.first_token_ms == 0
+
+
+@patch("slack_utils.get_slack_client")
+def test_streaming_message_rolls_over(mock_get_slack_client):
+    """StreamingMessageが上限を超えた出力を新しいメッセージに続けることをテスト"""
+    # モックの設定
+    mock_client = mock_get_slack_client.return_value
+    mock_client.chat_postMessage.side_effect = [{"ts": "1"}, {"ts": "2"}]
+
+    # 関数の実行
+    writer = StreamingMessage("C123456", "1234567890.123456", limit=10, interval=0)
+    writer.start()
+    writer.append("12345 ")
+    writer.append("67890 abc")
+    writer.append("d")
+    writer.finish()
+
+    # 検証
+    posted = [c.kwargs["text"] for c in mock_client.chat_postMessage.call_args_list]
+    updates = [
+        (c.kwargs["ts"], c.kwargs["text"])
+        for c in mock_client.chat_update.call_args_list
+    ]
+    assert posted[1] == "67890 abc"
+    assert ("1", "12345") in updates
+    assert updates[-1] == ("2", "67890 abcd")
+
+
+@patch("slack_utils.get_slack_client")
+def test_streaming_message_rollover_keeps_paragraph_break(mock_get_slack_client):
+    """段落の区切りで次のメッセージに移った場合も、続きの出力との間の空行を残すことをテスト"""
+    # モックの設定
+    mock_client = mock_get_slack_client.return_value
+    mock_client.chat_postMessage.side_effect = [{"ts": "1"}, {"ts": "2"}]
+
+    # 関数の実行
+    writer = StreamingMessage("C123456", "1234567890.123456", limit=50, interval=0)
+    writer.start()
+    writer.append("First paragraph is here.\n\n")
+    writer.append("Second paragraph, long enough to roll.\n\n")
+    writer.append("Third")
+    writer.finish()
+
+    # 検証
+    posted = [c.kwargs["text"] for c in mock_client.chat_postMessage.call_args_list]
+    updates = [
+        (c.kwargs["ts"], c.kwargs["text"])
+        for c in mock_client.chat_update.call_args_list
+    ]
+    assert posted[1] == "Second paragraph, long enough to roll."
+    assert ("1", "First paragraph is here.") in updates
+    assert updates[-1] == ("2", "Second paragraph, long enough to roll.\n\nThird")
+
+
+@patch("slack_utils.get_slack_client")
+def test_streaming_message_empty_output_deletes_placeholder(mock_get_slack_client):
+    """出力がなかった場合にプレースホルダーを削除することをテスト"""
+    # モックの設定
+    mock_client = mock_get_slack_client.return_value
+    mock_client.chat_postMessage.return_value = {"ts": "1"}
+
+    # 関数の実行
+    writer = StreamingMessage("C123456", "1234567890.123456")
+    writer.start()
+    writer.finish()
+
+    # 検証
+    mock_client.chat_delete.assert_called_once_with(channel="C123456", ts="1")
+
+
+@patch("slack_utils.get_slack_client")
+def test_streaming_message_fail_marks_interrupted(mock_get_slack_client):
+    """生成が中断された場合に出力済みの内容へ中断の旨を追記することをテスト"""
+    # モックの設定
+    mock_client = mock_get_slack_client.return_value
+    mock_client.chat_postMessage.return_value = {"ts": "1"}
+
+    # 関数の実行
+    writer = StreamingMessage("C123456", "1234567890.123456")
+    writer.start()
+    writer.append("途中まで")
+    writer.fail()
+
+    # 検証
+    text = mock_client.chat_update.call_args.kwargs["text"]
+    assert text.startswith("途中まで\n")
+    assert "中断" in text
+
+
+@patch("slack_utils.get_slack_client")
+def test_streaming_message_fail_before_output_deletes_placeholder(
+    mock_get_slack_client,
+):
+    """出力前に中断された場合はプレースホルダーを削除することをテスト"""
+    # モックの設定
+    mock_client = mock_get_slack_client.return_value
+    mock_client.chat_postMessage.return_value = {"ts": "1"}
+
+    # 関数の実行
+    writer = StreamingMessage("C123456", "1234567890.123456")
+    writer.start()
+    writer.fail()
+
+    # 検証
+    mock_client.chat_delete.assert_called_once_with(channel="C123456", ts="1")
+    mock_client.chat_update.assert_not_called()
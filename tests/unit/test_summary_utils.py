@@ -0,0 +1,122 @@
+import time
+from unittest.mock import patch
+from summary_utils import compact_history, get_summary_key
+from bedrock_utils import format_conversation_for_claude
+
+
+def _history(count):
+    return [
+        {
+            "ts": f"1700000000.{i:06d}",
+            "text": f"メッセージ{i}",
+            **({"bot_id": "B123"} if i % 2 else {}),
+        }
+        for i in range(count)
+    ]
+
+
+@patch("summary_utils.put_state")
+@patch("summary_utils.get_state", return_value=None)
+@patch("summary_utils.invoke_claude_model")
+def test_compact_history_below_threshold(
+    mock_invoke_claude_model, mock_get_state, mock_put_state
+):
+    """要約の閾値を超えない場合は会話履歴をそのまま返すことをテスト"""
+    history = _history(4)
+
+    # 関数の実行
+    result = compact_history("C123456", "1700000000.000000", history)
+
+    # 検証
+    assert result == history
+    mock_invoke_claude_model.assert_not_called()
+    mock_put_state.assert_not_called()
+
+
+@patch("summary_utils.THREAD_SUMMARY_TRIGGER_TOKENS", 10)
+@patch("summary_utils.THREAD_SUMMARY_KEEP_RECENT", 2)
+@patch("summary_utils.put_state")
+@patch("summary_utils.get_state", return_value=None)
+@patch("summary_utils.invoke_claude_model", return_value="要約文")
+def test_compact_history_creates_summary(
+    mock_invoke_claude_model, mock_get_state, mock_put_state
+):
+    """閾値を超えた場合、直近のメッセージを残して古い会話を要約・保存することをテスト"""
+    history = _history(6)
+
+    # 関数の実行
+    result = compact_history("C123456", "1700000000.000000", history)
+
+    # 検証
+    assert len(result) == 3
+    assert result[0]["summary"] is True
+    assert result[0]["text"].endswith("要約文")
+    assert result[0]["assistant_count"] == 2
+    assert result[1:] == history[-2:]
+
+    key, item = mock_put_state.call_args.args
+    assert key == get_summary_key("C123456", "1700000000.000000")
+    assert item["summary"] == "要約文"
+    assert item["last_ts"] == history[3]["ts"]
+    assert item["assistant_count"] == 2
+    prompt = mock_invoke_claude_model.call_args.args[0][0]["content"]
+    assert "メッセージ0" in prompt and "メッセージ4" not in prompt
+
+
+@patch("summary_utils.put_state")
+@patch("summary_utils.get_state")
+@patch("summary_utils.invoke_claude_model")
+def test_compact_history_reuses_stored_summary(
+    mock_invoke_claude_model, mock_get_state, mock_put_state
+):
+    """保存済みの要約がある場合、要約済みのメッセージを要約に置き換えることをテスト"""
+    history = _history(6)
+    mock_get_state.return_value = {
+        "summary": "前回の要約",
+        "last_ts": history[3]["ts"],
+        "assistant_count": 2,
+        "expires_at": int(time.time()) + 3600,
+    }
+
+    # 関数の実行
+    result = compact_history("C123456", "1700000000.000000", history)
+
+    # 検証
+    assert result[0]["text"].endswith("前回の要約")
+    assert result[1:] == history[4:]
+    mock_invoke_claude_model.assert_not_called()
+
+
+@patch("summary_utils.THREAD_SUMMARY_TRIGGER_TOKENS", 10)
+@patch("summary_utils.THREAD_SUMMARY_KEEP_RECENT", 2)
+@patch("summary_utils.put_state")
+@patch("summary_utils.get_state", return_value=None)
+@patch("summary_utils.invoke_claude_model", side_effect=Exception("API error"))
+def test_compact_history_summary_error(
+    mock_invoke_claude_model, mock_get_state, mock_put_state
+):
+    """要約に失敗した場合は会話履歴をそのまま返すことをテスト"""
+    history = _history(6)
+
+    # 関数の実行
+    result = compact_history("C123456", "1700000000.000000", history)
+
+    # 検証
+    assert result == history
+    mock_put_state.assert_not_called()
+
+
+@patch("slack_utils.get_bot_user_id", return_value="UBOT")
+def test_summary_keeps_response_count(mock_get_bot_user_id):
+    """要約に含めた回答数が回答回数の制限に数えられることをテスト"""
+    history = [
+        {"summary": True, "text": "要約", "assistant_count": 48},
+        {"bot_id": "B123", "text": "回答"},
+    ]
+
+    # 関数の実行
+    messages, count = format_conversation_for_claude(history, "質問")
+
+    # 検証
+    assert count == 49
+    assert messages[0] == {"role": "user", "content": "要約"}
@@ -0,0 +1,134 @@
+from unittest.mock import patch
+import pytest
+from botocore.exceptions import ClientError
+from thread_lease_utils import (
+    acquire_thread_lease,
+    release_thread_lease,
+    abandon_thread_lease,
+    get_lease_key,
+)
+
+CONDITIONAL_CHECK_FAILED = ClientError(
+    {"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem"
+)
+
+
+@patch("thread_lease_utils.get_table")
+def test_acquire_thread_lease_success(mock_get_table):
+    """リースが保持されていない場合に取得できることをテスト"""
+    mock_update_item = mock_get_table.return_value.update_item
+
+    # 関数の実行
+    result = acquire_thread_lease("C123456", "1234.5678", "Ev1")
+
+    # 検証
+    assert result is True
+    kwargs = mock_update_item.call_args.kwargs
+    assert kwargs["Key"] == {"event_id": get_lease_key("C123456", "1234.5678")}
+    assert kwargs["ExpressionAttributeValues"][":owner"] == "Ev1"
+
+
+@patch("thread_lease_utils.get_table")
+def test_acquire_thread_lease_queues_mention(mock_get_table):
+    """他のイベントがリースを保持している場合、イベントIDのみを保留中のメンションに追加することをテスト"""
+    mock_update_item = mock_get_table.return_value.update_item
+    mock_update_item.side_effect = [CONDITIONAL_CHECK_FAILED, {}]
+
+    # 関数の実行
+    result = acquire_thread_lease("C123456", "1234.5678", "Ev2")
+
+    # 検証
+    assert result is False
+    kwargs = mock_update_item.call_args.kwargs
+    assert kwargs["ExpressionAttributeValues"][":mention"] == [{"event_id": "Ev2"}]
+
+
+@patch("thread_lease_utils.get_table")
+def test_acquire_thread_lease_retries_after_release(mock_get_table):
+    """保留の追加前にリースが解放された場合、取得からやり直すことをテスト"""
+    mock_update_item = mock_get_table.return_value.update_item
+    mock_update_item.side_effect = [
+        CONDITIONAL_CHECK_FAILED,
+        CONDITIONAL_CHECK_FAILED,
+        {},
+    ]
+
+    # 関数の実行
+    result = acquire_thread_lease("C123456", "1234.5678", "Ev2")
+
+    # 検証
+    assert result is True
+    assert mock_update_item.call_count == 3
+
+
+@patch("thread_lease_utils.get_table")
+def test_acquire_thread_lease_other_error(mock_get_table):
+    """条件チェック以外のエラーは送出することをテスト"""
+    mock_get_table.return_value.update_item.side_effect = ClientError(
+        {"Error": {"Code": "InternalServerError"}}, "UpdateItem"
+    )
+
+    with pytest.raises(ClientError):
+        acquire_thread_lease("C123456", "1234.5678", "Ev1")
+
+
+@patch("thread_lease_utils.get_table")
+def test_release_thread_lease_without_pending(mock_get_table):
+    """保留中のメンションがない場合はリースを削除することをテスト"""
+    mock_table = mock_get_table.return_value
+
+    # 関数の実行
+    result = release_thread_lease("C123456", "1234.5678", "Ev1")
+
+    # 検証
+    assert result == []
+    mock_table.delete_item.assert_called_once()
+    mock_table.update_item.assert_not_called()
+
+
+@patch("thread_lease_utils.get_table")
+def test_release_thread_lease_takes_pending(mock_get_table):
+    """保留中のメンションがある場合はリースを延長して取り出すことをテスト"""
+    mock_table = mock_get_table.return_value
+    mock_table.delete_item.side_effect = CONDITIONAL_CHECK_FAILED
+    pending = [{"event_id": "Ev2"}, {"event_id": "Ev3"}]
+    mock_table.update_item.return_value = {"Attributes": {"pending_mentions": pending}}
+
+    # 関数の実行
+    result = release_thread_lease("C123456", "1234.5678", "Ev1")
+
+    # 検証
+    assert result == pending
+    assert mock_table.update_item.call_args.kwargs["ReturnValues"] == "UPDATED_OLD"
+
+
+@patch("thread_lease_utils.get_table")
+def test_release_thread_lease_lost(mock_get_table):
+    """リースを失っていた場合は何も取り出さないことをテスト"""
+    mock_table = mock_get_table.return_value
+    mock_table.delete_item.side_effect = CONDITIONAL_CHECK_FAILED
+    mock_table.update_item.side_effect = CONDITIONAL_CHECK_FAILED
+
+    assert release_thread_lease("C123456", "1234.5678", "Ev1") == []
+
+
+@patch("thread_lease_utils.get_table")
+def test_abandon_thread_lease_ignores_lost_lease(mock_get_table):
+    """リースを保持していない場合の削除は無視することをテスト"""
+    mock_get_table.return_value.delete_item.side_effect = CONDITIONAL_CHECK_FAILED
+
+    assert abandon_thread_lease("C123456", "1234.5678", "Ev1") == []
+
+
+@patch("thread_lease_utils.get_table")
+def test_abandon_thread_lease_returns_pending(mock_get_table):
+    """リースを削除し、応答されていない保留中のメンションを返すことをテスト"""
+    mock_delete_item = mock_get_table.return_value.delete_item
+    mock_delete_item.return_value = {
+        "Attributes": {"pending_mentions": [{"event_id": "Ev2"}]}
+    }
+
+    result = abandon_thread_lease("C123456", "1234.5678", "Ev1")
+
+    assert result == [{"event_id": "Ev2"}]
+    assert mock_delete_item.call_args.kwargs["ReturnValues"] == "ALL_OLD"
@@ -1,14 +1,25 @@
+import time
+from functools import partial
 from unittest.mock import patch, MagicMock
-from url_utils import get_url_content
+from url_utils import (
+    get_url_content,
+    get_cache_stats,
+    read_limited,
+    get_summary_cache_key,
+    get_url_summary,
+    save_url_summary,
+)
+from utils import run_concurrently
 
 
-@patch("url_utils.requests.get")
+@patch("url_utils.http_get")
 def test_get_url_content_success(mock_get):
     """get_url_content関数が正常にURLの内容を取得できることをテスト"""
     # モックレスポンスの設定
     mock_response = MagicMock()
     mock_response.status_code = 200
-    mock_response.content = """
+    mock_response.headers = {"Content-Type": "text/html; charset=utf-8"}
+    mock_response.iter_content.return_value = ["""
     <html>
         <head>
             <title>テストページ</title>
@@ -17,39 +28,91 @@ def test_get_url_content_success(mock_get):
             <p>これはテストコンテンツです。</p>
         </body>
     </html>
-    """
+    """.encode()]
     mock_get.return_value = mock_response
 
     # 関数の実行
     title, content = get_url_content("https://example.com")
 
     # 検証
-    mock_get.assert_called_once_with("https://example.com")
+    mock_get.assert_called_once_with("https://example.com", stream=True)
     assert title == "テストページ"
     assert "これはテストコンテンツです。" in content
 
 
-@patch("url_utils.requests.get")
+@patch("url_utils.http_get")
+def test_get_url_content_header_charset_shift_jis(mock_get):
+    """Content-Typeヘッダーのみで文字コードが指定されたShift_JISのページを読めることをテスト"""
+    # モックレスポンスの設定
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.headers = {"Content-Type": "text/html; charset=Shift_JIS"}
+    mock_response.iter_content.return_value = [
+        "<html><head><title>お知らせ</title></head>"
+        "<body><p>メンテナンスのお知らせです。</p></body></html>".encode("shift_jis")
+    ]
+    mock_get.return_value = mock_response
+
+    # 関数の実行
+    title, content = get_url_content("https://example.jp/sjis")
+
+    # 検証
+    assert title == "お知らせ"
+    assert content == "メンテナンスのお知らせです。"
+
+
+@patch("url_utils.http_get")
 def test_get_url_content_with_angle_brackets(mock_get):
     """get_url_content関数が<>で囲まれたURLを正しく処理できることをテスト"""
     # モックレスポンスの設定
     mock_response = MagicMock()
     mock_response.status_code = 200
-    mock_response.content = (
-        "<html><head><title>Test</title></head><body>Test</body></html>"
-    )
+    mock_response.headers = {"Content-Type": "text/html; charset=utf-8"}
+    mock_response.iter_content.return_value = [
+        ("<html><head><title>Test</title></head><body>Test</body></html>").encode()
+    ]
     mock_get.return_value = mock_response
 
     # 関数の実行
     title, content = get_url_content("<https://example.com>")
 
     # 検証
-    mock_get.assert_called_once_with("https://example.com")
+    mock_get.assert_called_once_with("https://example.com", stream=True)
     assert title == "Test"
     assert "Test" in content
 
 
-@patch("url_utils.requests.get")
+@patch("url_utils.http_get")
+def test_get_url_content_shares_inflight_fetch(mock_get):
+    """同じURLを並行して取得する場合に、サーバーへの問い合わせが1回になることをテスト"""
+
+    # モックレスポンスの設定（取得に時間がかかるページ）
+    def slow_get(url, **kwargs):
+        time.sleep(0.1)
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {"Content-Type": "text/html; charset=utf-8"}
+        mock_response.iter_content.return_value = [
+            b"<html><head><title>Shared</title></head><body>Body</body></html>"
+        ]
+        return mock_response
+
+    mock_get.side_effect = slow_get
+
+    # 関数の実行
+    results = run_concurrently(
+        [
+            partial(get_url_content, "https://example.com/shared"),
+            partial(get_url_content, "<https://example.com/shared>"),
+        ]
+    )
+
+    # 検証
+    mock_get.assert_called_once()
+    assert results == [("Shared", "Body"), ("Shared", "Body")]
+
+
+@patch("url_utils.http_get")
 def test_get_url_content_request_exception(mock_get):
     """get_url_content関数がリクエスト例外を適切に処理できることをテスト"""
     # リクエスト例外をシミュレート
@@ -63,13 +126,16 @@ def test_get_url_content_request_exception(mock_get):
     assert "Connection error" in content
 
 
-@patch("url_utils.requests.get")
+@patch("url_utils.http_get")
 def test_get_url_content_no_title(mock_get):
     """get_url_content関数がタイトルのないHTMLを適切に処理できることをテスト"""
     # モックレスポンスの設定
     mock_response = MagicMock()
     mock_response.status_code = 200
-    mock_response.content = "<html><body>No title content</body></html>"
+    mock_response.headers = {"Content-Type": "text/html; charset=utf-8"}
+    mock_response.iter_content.return_value = [
+        "<html><body>No title content</body></html>".encode()
+    ]
     mock_get.return_value = mock_response
 
     # 関数の実行
@@ -78,3 +144,175 @@ def test_get_url_content_no_title(mock_get):
     # 検証
     assert title == "No title found"
     assert "No title content" in content
+
+
+def _html_response(status_code=200, headers=None, title="キャッシュテスト"):
+    mock_response = MagicMock()
+    mock_response.status_code = status_code
+    mock_response.headers = {"Content-Type": "text/html; charset=utf-8"}
+    mock_response.headers.update(headers or {})
+    mock_response.iter_content.return_value = [
+        (f"<html><head><title>{title}</title></head><body>本文</body></html>").encode()
+    ]
+    return mock_response
+
+
+@patch("url_utils.http_get")
+def test_get_url_content_fresh_cache_hit(mock_get):
+    """キャッシュの有効期間内は同じURLを再取得しないことをテスト"""
+    mock_get.return_value = _html_response()
+
+    first = get_url_content("https://example.com/a")
+    second = get_url_content("<https://EXAMPLE.com/a#section>")
+
+    assert first == second == ("キャッシュテスト", "本文")
+    mock_get.assert_called_once()
+    assert get_cache_stats() == {"fresh": 1, "revalidated": 0, "miss": 1}
+
+
+@patch("url_utils.time.time")
+@patch("url_utils.http_get")
+def test_get_url_content_revalidates_with_validators(mock_get, mock_time):
+    """有効期間を過ぎたキャッシュを条件付きリクエストで再検証し、304なら再利用することをテスト"""
+    mock_time.return_value = 1000
+    mock_get.return_value = _html_response(
+        headers={"ETag": '"v1"', "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"}
+    )
+    get_url_content("https://example.com/a")
+
+    # 有効期間の経過後
+    mock_time.return_value = 1000 + 601
+    mock_get.return_value = _html_response(status_code=304, title="")
+    title, content = get_url_content("https://example.com/a")
+
+    # 検証
+    assert (title, content) == ("キャッシュテスト", "本文")
+    args, kwargs = mock_get.call_args
+    assert kwargs["headers"] == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Wed, 01 Jan 2025 00:00:00 GMT",
+    }
+    assert get_cache_stats() == {"fresh": 0, "revalidated": 1, "miss": 1}
+
+
+@patch("url_utils.time.time")
+@patch("url_utils.http_get")
+def test_get_url_content_refetches_changed_page(mock_get, mock_time):
+    """再検証でページが更新されていた場合は新しい内容を返すことをテスト"""
+    mock_time.return_value = 1000
+    mock_get.return_value = _html_response(headers={"ETag": '"v1"'})
+    get_url_content("https://example.com/a")
+
+    mock_time.return_value = 1000 + 601
+    mock_get.return_value = _html_response(headers={"ETag": '"v2"'}, title="更新後")
+    title, content = get_url_content("https://example.com/a")
+
+    assert title == "更新後"
+    assert get_cache_stats()["miss"] == 2
+
+
+@patch("url_utils.http_get")
+def test_get_url_content_error_status_not_cached(mock_get):
+    """200以外のレスポンスはキャッシュしないことをテスト"""
+    mock_get.return_value = _html_response(status_code=404, title="Not Found")
+
+    get_url_content("https://example.com/missing")
+    get_url_content("https://example.com/missing")
+
+    assert mock_get.call_count == 2
+
+
+def _streamed_response(content_type, chunks, content_length=None):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.encoding = "utf-8"
+    mock_response.headers = {"Content-Type": content_type}
+    if content_length is not None:
+        mock_response.headers["Content-Length"] = str(content_length)
+    mock_response.iter_content.return_value = iter(chunks)
+    return mock_response
+
+
+@patch("url_utils.http_get")
+def test_get_url_content_unsupported_content_type(mock_get):
+    """テキスト以外のContent-Typeでは本文を読み込まずに結果を返すことをテスト"""
+    mock_response = _streamed_response("application/pdf", [b"%PDF-1.7"])
+    mock_get.return_value = mock_response
+
+    title, content = get_url_content("https://example.com/file.pdf")
+
+    assert title == "Unsupported content"
+    assert "application/pdf" in content
+    mock_response.iter_content.assert_not_called()
+    mock_response.close.assert_called_once()
+
+
+@patch("url_utils.URL_MAX_BYTES", 10)
+@patch("url_utils.http_get")
+def test_get_url_content_truncates_large_page(mock_get):
+    """上限を超えるページは上限までで読み込みを打ち切ることをテスト"""
+    consumed = []
+
+    def chunks():
+        for chunk in [b"<p>12345", b"67890</p>", b"<p>never read</p>"]:
+            consumed.append(chunk)
+            yield chunk
+
+    mock_response = _streamed_response("text/html", chunks(), content_length=1000)
+    mock_get.return_value = mock_response
+
+    title, content = get_url_content("https://example.com/large")
+
+    # 検証：3つ目のチャンクは読み込まれない
+    assert len(consumed) == 2
+    assert "先頭の" in content
+    assert "never read" not in content
+    mock_response.close.assert_called_once()
+
+
+@patch("url_utils.http_get")
+def test_get_url_content_plain_text(mock_get):
+    """text/plainのページをHTMLとして解析せずにテキストとして返すことをテスト"""
+    mock_get.return_value = _streamed_response(
+        "text/plain", ["1行目\n\n 2行目".encode("utf-8")]
+    )
+
+    title, content = get_url_content("https://example.com/readme.txt")
+
+    assert title == "No title found"
+    assert content == "1行目 2行目"
+
+
+def test_read_limited():
+    """read_limited関数が上限までのバイト列と打ち切りの有無を返すことをテスト"""
+    response = _streamed_response("text/html", [b"abc", b"def"])
+    assert read_limited(response, 10) == (b"abcdef", False)
+
+    response = _streamed_response("text/html", [b"abc", b"def"])
+    assert read_limited(response, 4) == (b"abcd", True)
+
+
+def test_get_summary_cache_key():
+    """要約のキャッシュキーがURLの表記ゆれに左右されず、内容が変わると変わることをテスト"""
+    # 関数の実行
+    key = get_summary_cache_key("<https://Example.com/a?utm_source=x>", "題", "本文")
+    same = get_summary_cache_key("https://example.com/a", "題", "本文")
+    changed = get_summary_cache_key("https://example.com/a", "題", "新しい本文")
+
+    # 検証
+    assert key == same
+    assert key != changed
+    assert get_summary_cache_key("https://example.com/a", "Error", "失敗") is None
+
+
+@patch("cache_utils.put_state")
+@patch("cache_utils.get_state", return_value=None)
+def test_url_summary_roundtrip(mock_get_state, mock_put_state):
+    """保存した要約をモデルごとに取得でき、DynamoDBにも保存することをテスト"""
+    # 関数の実行
+    save_url_summary("https://example.com/#abc", "model-a", "要約です")
+
+    # 検証
+    assert get_url_summary("https://example.com/#abc", "model-a") == "要約です"
+    assert get_url_summary("https://example.com/#abc", "model-b") is None
+    mock_put_state.assert_called_once()
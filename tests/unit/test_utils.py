@@ -1,4 +1,7 @@
-from utils import create_error_message, extract_url
+import threading
+import time
+import pytest
+from utils import create_error_message, extract_url, normalize_url, run_concurrently
 
 
 def test_create_error_message():
@@ -29,3 +32,45 @@ def test_extract_url_with_url_without_label():
     """extract_url関数がラベルのないURLを正しく抽出することをテスト"""
     message = "こちらのリンクを確認してください <https://example.com>"
     assert extract_url(message) == "https://example.com"
+
+
+def test_normalize_url():
+    """normalize_url関数がキャッシュキー用にURLを正規化することをテスト"""
+    assert normalize_url("HTTPS://Example.COM") == "https://example.com/"
+    assert normalize_url("<https://example.com:443/a#top>") == "https://example.com/a"
+    assert (
+        normalize_url("https://example.com/a?id=1&utm_source=slack&x=")
+        == "https://example.com/a?id=1&x="
+    )
+    assert normalize_url("http://example.com:8080/a") == "http://example.com:8080/a"
+
+
+def test_run_concurrently_keeps_order():
+    """run_concurrently関数が完了順によらず、渡した順序で結果を返すことをテスト"""
+    def task(delay, value):
+        time.sleep(delay)
+        return value
+
+    tasks = [lambda: task(0.05, "a"), lambda: task(0.0, "b"), lambda: task(0.02, "c")]
+
+    assert run_concurrently(tasks, max_workers=3) == ["a", "b", "c"]
+    assert run_concurrently(tasks, max_workers=1) == ["a", "b", "c"]
+    assert run_concurrently([]) == []
+
+
+def test_run_concurrently_runs_in_parallel():
+    """run_concurrently関数が処理を並行して実行することをテスト"""
+    barrier = threading.Barrier(3, timeout=1)
+    tasks = [barrier.wait for _ in range(3)]
+
+    # 並行に実行されなければBarrierがタイムアウトする
+    run_concurrently(tasks, max_workers=3)
+
+
+def test_run_concurrently_propagates_exception():
+    """run_concurrently関数が処理中の例外を呼び出し元に送出することをテスト"""
+    def fail():
+        raise ValueError("error")
+
+    with pytest.raises(ValueError):
+        run_concurrently([lambda: 1, fail], max_workers=2)